@@ -0,0 +1,6 @@
+"""Command line export, see cli.py."""
+import sys
+
+from .cli import main
+
+sys.exit(main())
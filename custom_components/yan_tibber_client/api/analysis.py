@@ -0,0 +1,364 @@
+"""Analysis of the price info, cached per day by a fingerprint of its prices."""
+from concurrent.futures import Executor
+from datetime import datetime, timedelta, timezone
+
+from .api import (
+    HomePriceInfo,
+    LoadingLevel,
+    PriceBlocks,
+    PriceSeries,
+    PriceSlot,
+    PriceWindow,
+    Statistics,
+    TibberApi,
+)
+from .lazy import lazy_import
+from .optimizer import BatteryParameters, BatteryPlan, optimize_battery
+
+np = lazy_import("numpy")
+
+TRAILING_DAYS = (3, 30)
+"""Days of the trailing averages of the price history, the base of Tibber's price levels."""
+
+
+def fingerprint(arr: []) -> int:
+    """Cheap fingerprint of a today/tomorrow array of the priceInfo."""
+    return hash(tuple((x["startsAt"], x["total"], x["level"]) for x in arr))
+
+
+class DayAnalysis:
+    """Everything derived from the prices of one day alone, independent of the current time."""
+
+    def __init__(  # noqa: D107
+        self,
+        fingerprint: int,
+        series: PriceSeries,
+        stats: Statistics,
+        load_from_net: PriceSeries,
+        unload_battery: PriceSeries,
+    ) -> None:
+        self._fingerprint = fingerprint
+        self._series = series
+        self._stats = stats
+        self._load_from_net = load_from_net
+        self._unload_battery = unload_battery
+
+    @property
+    def fingerprint(self) -> int:  # noqa: D102
+        return self._fingerprint
+
+    @property
+    def series(self) -> PriceSeries:  # noqa: D102
+        return self._series
+
+    @property
+    def stats(self) -> Statistics:  # noqa: D102
+        return self._stats
+
+    @property
+    def load_from_net(self) -> PriceSeries:  # noqa: D102
+        return self._load_from_net
+
+    @property
+    def unload_battery(self) -> PriceSeries:  # noqa: D102
+        return self._unload_battery
+
+
+def next_window(
+    series: PriceSeries, level: LoadingLevel, slot_length: timedelta
+) -> PriceWindow | None:
+    """First run of slots marked with the loading level, None if there is none."""
+    marked = series.loading_levels == PriceSeries.LOADING_CODES[level]
+    if not marked.any():
+        return None
+    first = int(np.argmax(marked))
+    rest = np.flatnonzero(~marked[first:])
+    last = first + (int(rest[0]) if len(rest) > 0 else len(marked) - first) - 1
+    # a gap in the slots ends the window as well
+    gaps = np.flatnonzero(np.diff(series.starts[first : last + 1]) != np.timedelta64(slot_length))
+    if len(gaps) > 0:
+        last = first + int(gaps[0])
+    return PriceWindow(
+        series.starts_at(first),
+        series.starts_at(last) + slot_length,
+        float(series.prices[first : last + 1].mean()),
+        last - first + 1,
+    )
+
+
+class HomeSnapshot:
+    """Everything the entities of one home show, computed once per refresh."""
+
+    def __init__(  # noqa: D107
+        self,
+        home: HomePriceInfo,
+        today: DayAnalysis,
+        tomorrow: DayAnalysis | None,
+        current: PriceSlot,
+        future: PriceSeries,
+        future_stats: Statistics | None,
+        next_load_window: PriceWindow | None,
+        next_unload_window: PriceWindow | None,
+        battery_series: PriceSeries | None = None,
+        battery_plan: BatteryPlan | None = None,
+        blocks: PriceBlocks | None = None,
+        trailing_averages: dict[int, float | None] | None = None,
+    ) -> None:
+        self._home = home
+        self._today = today
+        self._tomorrow = tomorrow
+        self._current = current
+        self._future = future
+        self._future_stats = future_stats
+        self._next_load_window = next_load_window
+        self._next_unload_window = next_unload_window
+        self._battery_series = battery_series
+        self._battery_plan = battery_plan
+        self._blocks = blocks
+        self._trailing_averages = trailing_averages
+
+    @property
+    def home(self) -> HomePriceInfo:  # noqa: D102
+        return self._home
+
+    @property
+    def today(self) -> DayAnalysis:  # noqa: D102
+        return self._today
+
+    @property
+    def tomorrow(self) -> DayAnalysis | None:  # noqa: D102
+        return self._tomorrow
+
+    @property
+    def current(self) -> PriceSlot:
+        """Current slot with the loading level of today's analysis."""
+        return self._current
+
+    @property
+    def future(self) -> PriceSeries:  # noqa: D102
+        return self._future
+
+    @property
+    def future_stats(self) -> Statistics | None:  # noqa: D102
+        return self._future_stats
+
+    @property
+    def next_load_window(self) -> PriceWindow | None:
+        """Next slots to load the battery from the net, the current one included."""
+        return self._next_load_window
+
+    @property
+    def next_unload_window(self) -> PriceWindow | None:
+        """Next slots to unload the battery, the current one included."""
+        return self._next_unload_window
+
+    @property
+    def battery_series(self) -> PriceSeries | None:
+        """Slots the battery plan covers."""
+        return self._battery_series
+
+    @property
+    def battery_plan(self) -> BatteryPlan | None:  # noqa: D102
+        return self._battery_plan
+
+    @property
+    def blocks(self) -> PriceBlocks | None:
+        """Block queries over today and tomorrow, shared while their prices do not change."""
+        return self._blocks
+
+    @property
+    def trailing_averages(self) -> dict[int, float | None] | None:
+        """Average stored price of the TRAILING_DAYS before the current slot, None without history."""
+        return self._trailing_averages
+
+
+class PriceAnalyzer:
+    """Run the analysis pipeline, reusing the results of days whose prices did not change.
+
+    The results are frozen and never changed afterwards, so they are shared between homes and
+    updates. With an executor the days and the homes are analysed concurrently.
+    """
+
+    def __init__(self, api: TibberApi, executor: Executor | None = None) -> None:  # noqa: D107
+        self._api = api
+        self._executor = executor
+        self._days: dict[int, DayAnalysis] = {}
+        self._blocks: dict[tuple[int, int | None], PriceBlocks] = {}
+
+    def analyse_day(self, arr: []) -> DayAnalysis | None:
+        """Return the cached analysis of the day or compute it, None for a day without prices."""
+        if not arr:
+            return None
+        key = fingerprint(arr)
+        res = self._days.get(key)
+        if res is None:
+            res = self._analyse_day(key, arr)
+            self._days[key] = res
+        return res
+
+    def _analyse_day(self, key: int, arr: []) -> DayAnalysis:
+        api = self._api
+        timer = api.timer
+        with timer.stage("convert"):
+            series = api.convert_to_series(arr)
+        with timer.stage("extrema"):
+            series = api.with_extrema(series)
+        with timer.stage("statistics"):
+            stats = Statistics(series)
+        with timer.stage("loading_levels"):
+            series = api.with_loading_levels(series).freeze()
+            load_from_net = api.filter_loading_level(series, LoadingLevel.LOAD_FROM_NET)
+            unload_battery = api.filter_loading_level(series, LoadingLevel.UNLOAD_BATTERY)
+        return DayAnalysis(key, series, stats, load_from_net.freeze(), unload_battery.freeze())
+
+    def _map(self, fn, items: list) -> list:
+        """fn over the items, on the executor if there is one and more than one item."""
+        if self._executor is None or len(items) < 2:
+            return [fn(*x) for x in items]
+        return list(self._executor.map(lambda x: fn(*x), items))
+
+    def analyse(self, price_info: []) -> tuple[DayAnalysis, DayAnalysis | None]:
+        """Analyse today and tomorrow, only the days in use stay cached."""
+        return self.analyse_all({None: price_info})[None]
+
+    def analyse_all(
+        self, price_infos: dict[str, []]
+    ) -> dict[str, tuple[DayAnalysis, DayAnalysis | None]]:
+        """Analyse today and tomorrow of several homes in one batch.
+
+        Homes in the same price area share their day analyses. Homes without price info are
+        left out, only the days in use stay cached.
+        """
+        keys = {
+            key: tuple(
+                fingerprint(price_info[day]) if price_info[day] else None
+                for day in ("today", "tomorrow")
+            )
+            for key, price_info in price_infos.items()
+            if price_info
+        }
+        missing = {}
+        for key, fingerprints in keys.items():
+            for fp, day in zip(fingerprints, ("today", "tomorrow")):
+                if fp is not None and fp not in self._days:
+                    missing[fp] = price_infos[key][day]
+        for x in self._map(self._analyse_day, list(missing.items())):
+            self._days[x.fingerprint] = x
+        res = {
+            key: tuple(self._days.get(fp) for fp in fingerprints)
+            for key, fingerprints in keys.items()
+        }
+        self._days = {
+            x.fingerprint: x for days in res.values() for x in days if x is not None
+        }
+        in_use = {
+            (today.fingerprint, tomorrow.fingerprint if tomorrow is not None else None)
+            for today, tomorrow in res.values()
+            if today is not None
+        }
+        self._blocks = {k: v for k, v in self._blocks.items() if k in in_use}
+        return res
+
+    def future(
+        self, today: DayAnalysis, tomorrow: DayAnalysis | None
+    ) -> tuple[PriceSeries, Statistics | None]:
+        """Slots after now with their statistics, the only part which depends on the current time."""
+        api = self._api
+        parts = [api.filter_future_items(today.series)]
+        if tomorrow is not None:
+            parts.append(tomorrow.series)
+        future = PriceSeries.concat(*parts)
+        if len(future) == 0:
+            return future.freeze(), None
+        future = api.with_extrema(future).freeze()
+        return future, Statistics(future)
+
+    def upcoming(self, today: DayAnalysis, tomorrow: DayAnalysis | None) -> PriceSeries:
+        """The current slot and all slots after it."""
+        slot_length = self._api.resolution.slot_length
+        since = datetime.now(timezone.utc) - slot_length
+        upcoming = today.series.after(since)
+        if tomorrow is None:
+            return upcoming
+        return PriceSeries.concat(upcoming, tomorrow.series)
+
+    def blocks(self, today: DayAnalysis, tomorrow: DayAnalysis | None) -> PriceBlocks:
+        """Block queries over today and tomorrow, computed once per pair of days."""
+        key = (today.fingerprint, tomorrow.fingerprint if tomorrow is not None else None)
+        res = self._blocks.get(key)
+        if res is None:
+            # concurrent snapshots may both build it, either result is the same
+            days = [today.series] if tomorrow is None else [today.series, tomorrow.series]
+            res = self._api.price_blocks(PriceSeries.concat(*days))
+            self._blocks[key] = res
+        return res
+
+    def plan_battery(
+        self, today: DayAnalysis, tomorrow: DayAnalysis | None, params: BatteryParameters
+    ) -> tuple[PriceSeries, BatteryPlan]:
+        """Optimal battery schedule from the current slot until the last known price."""
+        upcoming = self.upcoming(today, tomorrow)
+        slot_hours = self._api.resolution.slot_length.total_seconds() / 3600
+        return upcoming, optimize_battery(upcoming.prices, params, slot_hours)
+
+    def trailing_averages(self, home_id: str, end: datetime) -> dict[int, float | None] | None:
+        """Average stored price of the TRAILING_DAYS before end, None without a price history."""
+        history = self._api.history
+        if history is None:
+            return None
+        # SQLite, kept off the event loop with the rest of the snapshot
+        return {days: history.trailing_average(home_id, end, days) for days in TRAILING_DAYS}
+
+    def snapshot(
+        self,
+        home: HomePriceInfo,
+        today: DayAnalysis,
+        tomorrow: DayAnalysis | None,
+        battery: BatteryParameters | None = None,
+    ) -> HomeSnapshot:
+        """Derive the current slot, the future and the next windows of the home."""
+        api = self._api
+        timer = api.timer
+        with timer.stage("snapshot"):
+            current = api.convert_to_hourly(home.price_info["current"])
+            api.merge_loading_level(current, today.series)
+            future, future_stats = self.future(today, tomorrow)
+            upcoming = self.upcoming(today, tomorrow)
+            slot_length = api.resolution.slot_length
+            next_load_window = next_window(upcoming, LoadingLevel.LOAD_FROM_NET, slot_length)
+            next_unload_window = next_window(upcoming, LoadingLevel.UNLOAD_BATTERY, slot_length)
+            blocks = self.blocks(today, tomorrow)
+            trailing_averages = self.trailing_averages(home.id, current.starts_at)
+        battery_plan = None
+        if battery is not None:
+            slot_hours = slot_length.total_seconds() / 3600
+            with timer.stage("battery_plan"):
+                battery_plan = optimize_battery(upcoming.prices, battery, slot_hours)
+        return HomeSnapshot(
+            home,
+            today,
+            tomorrow,
+            current,
+            future,
+            future_stats,
+            next_load_window,
+            next_unload_window,
+            upcoming if battery is not None else None,
+            battery_plan,
+            blocks,
+            trailing_averages,
+        )
+
+    def snapshots(
+        self,
+        homes: dict[str, HomePriceInfo],
+        battery: BatteryParameters | None = None,
+    ) -> dict[str, HomeSnapshot]:
+        """Analyse all homes in one batch and take their snapshots, homes without today are left out."""
+        analyses = self.analyse_all({home_id: home.price_info for home_id, home in homes.items()})
+        analyses = {home_id: days for home_id, days in analyses.items() if days[0] is not None}
+        snapshots = self._map(
+            self.snapshot,
+            [(homes[home_id], today, tomorrow, battery) for home_id, (today, tomorrow) in analyses.items()],
+        )
+        return dict(zip(analyses, snapshots))
@@ -1,14 +1,44 @@
 """Tibber API."""
-from datetime import datetime, tzinfo
+from __future__ import annotations
+
+import asyncio
+import copy
+from datetime import datetime, timedelta, timezone, tzinfo
 from enum import Enum
+import functools
+from http import HTTPStatus
+import json
 import logging
+import sqlite3
+from typing import TYPE_CHECKING
+
+import aiohttp
+
+from .cache import PriceCache
+from .lazy import lazy_import
+from .timing import NO_TIMER, StageTimer
 
-import numpy as np
-import requests
-from scipy.signal import argrelextrema
+if TYPE_CHECKING:
+    from .history import PriceHistory
+
+try:
+    # several times faster on large responses, optional
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
 
 _LOGGER = logging.getLogger(__name__)
 
+TIBBER_API_URL = "https://api.tibber.com/v1-beta/gql"
+PRICE_INFO_QUERY = '{ "query": "{ viewer { homes { id address { address1 postalCode city } currentSubscription { priceInfo%s { current { total startsAt level } today { total startsAt level } tomorrow { total startsAt level }}}}}}" }'
+WEBSOCKET_URL_QUERY = '{ "query": "{ viewer { websocketSubscriptionUrl } }" }'
+REQUEST_TIMEOUT = 10
+
+# loaded on the first analysis, not while Home Assistant imports the integration
+np = lazy_import("numpy")
+# the blocking client only, the event loop must not run its import
+requests = lazy_import("requests")
+
 
 # https://community.home-assistant.io/t/tibber-sensor-for-future-price-tomorrow/253818/23
 class PriceLevel(Enum):
@@ -47,6 +77,27 @@ class LoadingLevel(Enum):
     """Net is expensive thus battery unloading make sense."""
 
 
+class Resolution(Enum):
+    """Length of the price slots."""
+
+    HOURLY = "HOURLY"
+    QUARTER_HOURLY = "QUARTER_HOURLY"
+
+    @property
+    def slot_length(self) -> timedelta:  # noqa: D102
+        if self is Resolution.QUARTER_HOURLY:
+            return timedelta(minutes=15)
+        return timedelta(hours=1)
+
+    @property
+    def query(self) -> str:
+        """GraphQL query of the price info in this resolution."""
+        if self is Resolution.QUARTER_HOURLY:
+            return PRICE_INFO_QUERY % "(resolution: QUARTER_HOURLY)"
+        # hourly is the default of the API
+        return PRICE_INFO_QUERY % ""
+
+
 class ExtremaType(Enum):
     """Minimum or Maximum."""
 
@@ -60,7 +111,9 @@ class ExtremaType(Enum):
     """Absolute maximum."""
 
 
-class HourlyData:  # noqa: D101
+class PriceSlot:
+    """Price of one slot, an hour or a quarter of an hour depending on the resolution."""
+
     _level: PriceLevel
     _starts_at: datetime
     _price: float
@@ -104,7 +157,557 @@ class HourlyData:  # noqa: D101
         self._extrema_type = None
 
     def __str__(self) -> str:  # noqa: D105
-        return f"HourlyLevel({self.level}, startsAt={self.starts_at}, {self.price} @/kWh, {self.loading_level}, {self.extrema_type})"
+        return f"PriceSlot({self.level}, startsAt={self.starts_at}, {self.price} @/kWh, {self.loading_level}, {self.extrema_type})"
+
+
+HourlyData = PriceSlot
+"""Name of PriceSlot from the time when all slots were hours."""
+
+_LEVEL_CODES: dict[PriceLevel, int] = {
+    PriceLevel.VERY_CHEAP: -2,
+    PriceLevel.CHEAP: -1,
+    PriceLevel.NORMAL: 0,
+    PriceLevel.EXPENSIVE: 1,
+    PriceLevel.VERY_EXPENSIVE: 2,
+}
+_LOADING_CODES: dict[LoadingLevel, int] = {
+    None: 0,
+    LoadingLevel.LOAD_FROM_NET: 1,
+    LoadingLevel.UNLOAD_BATTERY: 2,
+}
+_EXTREMA_CODES: dict[ExtremaType, int] = {
+    None: 0,
+    ExtremaType.MIN: 1,
+    ExtremaType.REL_MIN: 2,
+    ExtremaType.REL_MAX: 3,
+    ExtremaType.MAX: 4,
+}
+_LEVELS_BY_CODE = {code: pl for pl, code in _LEVEL_CODES.items()}
+_LOADING_LEVELS_BY_CODE = {code: ll for ll, code in _LOADING_CODES.items()}
+_EXTREMA_TYPES_BY_CODE = {code: et for et, code in _EXTREMA_CODES.items()}
+
+
+class SlotIndex:
+    """Timeline of the starts of a series.
+
+    The starts are UTC, so a series without gaps has a fixed stride even over a change of
+    daylight saving time. Its lookups are arithmetic in O(1), others bisect in O(log n).
+    """
+
+    __slots__ = ("_starts", "_first", "_stride")
+
+    def __init__(self, starts: np.ndarray) -> None:  # noqa: D107
+        self._starts = starts.view(np.int64)
+        self._first = int(self._starts[0]) if len(starts) > 0 else 0
+        self._stride = None
+        if len(starts) >= 2:
+            steps = np.diff(self._starts)
+            if steps[0] > 0 and (steps == steps[0]).all():
+                self._stride = int(steps[0])
+
+    @property
+    def stride(self) -> int | None:
+        """Seconds between two starts, None if they are not evenly spaced."""
+        return self._stride
+
+    @staticmethod
+    def _seconds(t: datetime | np.datetime64) -> int:
+        if isinstance(t, datetime):
+            return int(t.timestamp())
+        return int(t.astype("datetime64[s]").astype(np.int64))
+
+    def after(self, t: datetime | np.datetime64) -> int:
+        """Index of the first slot starting after t, the length if there is none."""
+        x = self._seconds(t)
+        n = len(self._starts)
+        if self._stride is not None:
+            return min(max((x - self._first) // self._stride + 1, 0), n)
+        return int(np.searchsorted(self._starts, x, side="right"))
+
+    def find(self, t: datetime | np.datetime64) -> int | None:
+        """Index of the slot starting at t, None if there is none."""
+        x = self._seconds(t)
+        if self._stride is not None:
+            i, rest = divmod(x - self._first, self._stride)
+            return i if rest == 0 and 0 <= i < len(self._starts) else None
+        i = int(np.searchsorted(self._starts, x, side="left"))
+        return i if i < len(self._starts) and self._starts[i] == x else None
+
+    def containing(self, t: datetime | np.datetime64, slot_length: timedelta) -> int | None:
+        """Index of the slot running at t, None outside of the series."""
+        i = self.after(t) - 1
+        if i < 0 or self._seconds(t) >= self._starts[i] + slot_length.total_seconds():
+            return None
+        return i
+
+
+class LabelIndex:
+    """Indices of the slots per code of a label array, grouped by one stable sort."""
+
+    __slots__ = ("_indices",)
+
+    def __init__(self, codes: np.ndarray) -> None:  # noqa: D107
+        order = np.argsort(codes, kind="stable")
+        values, firsts = np.unique(codes[order], return_index=True)
+        ends = np.append(firsts[1:], len(codes))
+        self._indices = {
+            int(code): order[first:end]
+            for code, first, end in zip(values.tolist(), firsts.tolist(), ends.tolist())
+        }
+
+    def indices(self, code: int) -> np.ndarray:
+        """Ascending indices of the slots with the code."""
+        res = self._indices.get(code)
+        return res if res is not None else np.empty(0, dtype=np.intp)
+
+
+class PriceSeries:
+    """Price slots stored as parallel NumPy arrays.
+
+    starts holds the slot start in UTC (datetime64[s]) and offsets the UTC offset in seconds
+    Tibber reported for it, levels the PriceLevel codes (-2..2) and loading_levels/extrema_types
+    the codes of the marks set by the analysis (0 = not marked).
+    """
+
+    LEVEL_CODES = _LEVEL_CODES
+    LOADING_CODES = _LOADING_CODES
+    EXTREMA_CODES = _EXTREMA_CODES
+
+    __slots__ = (
+        "_starts",
+        "_offsets",
+        "_prices",
+        "_levels",
+        "_loading_levels",
+        "_extrema_types",
+        "_index",
+        "_loading_level_index",
+    )
+
+    def __init__(  # noqa: D107
+        self,
+        starts: np.ndarray,
+        offsets: np.ndarray,
+        prices: np.ndarray,
+        levels: np.ndarray,
+        loading_levels: np.ndarray | None = None,
+        extrema_types: np.ndarray | None = None,
+    ) -> None:
+        self._starts = starts
+        self._offsets = offsets
+        self._prices = prices
+        self._levels = levels
+        self._loading_levels = (
+            np.zeros(len(prices), dtype=np.int8)
+            if loading_levels is None
+            else loading_levels
+        )
+        self._extrema_types = (
+            np.zeros(len(prices), dtype=np.int8)
+            if extrema_types is None
+            else extrema_types
+        )
+        self._index: SlotIndex | None = None
+        self._loading_level_index: LabelIndex | None = None
+
+    @property
+    def starts(self) -> np.ndarray:  # noqa: D102
+        return self._starts
+
+    @property
+    def offsets(self) -> np.ndarray:  # noqa: D102
+        return self._offsets
+
+    @property
+    def prices(self) -> np.ndarray:  # noqa: D102
+        return self._prices
+
+    @property
+    def levels(self) -> np.ndarray:  # noqa: D102
+        return self._levels
+
+    @property
+    def loading_levels(self) -> np.ndarray:  # noqa: D102
+        return self._loading_levels
+
+    @property
+    def extrema_types(self) -> np.ndarray:  # noqa: D102
+        return self._extrema_types
+
+    @staticmethod
+    def empty() -> "PriceSeries":  # noqa: D102
+        return PriceSeries(
+            np.empty(0, dtype="datetime64[s]"),
+            np.empty(0, dtype=np.int32),
+            np.empty(0, dtype=np.float64),
+            np.empty(0, dtype=np.int8),
+        )
+
+    @staticmethod
+    def from_price_info(arr: []) -> "PriceSeries":
+        """Build the series from the today/tomorrow arrays of the Tibber priceInfo."""
+        n = len(arr)
+        starts, offsets = parse_starts_at([x["startsAt"] for x in arr])
+        prices = np.fromiter((x["total"] for x in arr), dtype=np.float64, count=n)
+        levels = np.fromiter(
+            (_LEVEL_CODES[PriceLevel.from_string(x["level"])] for x in arr),
+            dtype=np.int8,
+            count=n,
+        )
+        return PriceSeries(starts, offsets, prices, levels)
+
+    @staticmethod
+    def from_list(arr: list[PriceSlot]) -> "PriceSeries":  # noqa: D102
+        n = len(arr)
+        res = PriceSeries(
+            np.array([int(x.starts_at.timestamp()) for x in arr], dtype="datetime64[s]"),
+            np.array(
+                [int(x.starts_at.utcoffset().total_seconds()) for x in arr],
+                dtype=np.int32,
+            ),
+            np.fromiter((x.price for x in arr), dtype=np.float64, count=n),
+            np.fromiter((_LEVEL_CODES[x.level] for x in arr), dtype=np.int8, count=n),
+            np.fromiter(
+                (_LOADING_CODES[x.loading_level] for x in arr), dtype=np.int8, count=n
+            ),
+            np.fromiter(
+                (_EXTREMA_CODES[x.extrema_type] for x in arr), dtype=np.int8, count=n
+            ),
+        )
+        return res
+
+    @staticmethod
+    def concat(*series: "PriceSeries") -> "PriceSeries":
+        """Join several series into a new one, the marks are copied along."""
+        return PriceSeries(
+            np.concatenate([x.starts for x in series]),
+            np.concatenate([x.offsets for x in series]),
+            np.concatenate([x.prices for x in series]),
+            np.concatenate([x.levels for x in series]),
+            np.concatenate([x.loading_levels for x in series]),
+            np.concatenate([x.extrema_types for x in series]),
+        )
+
+    def with_marks(
+        self,
+        loading_levels: np.ndarray | None = None,
+        extrema_types: np.ndarray | None = None,
+    ) -> "PriceSeries":
+        """New series with other marks, the times and prices are shared."""
+        return PriceSeries(
+            self._starts,
+            self._offsets,
+            self._prices,
+            self._levels,
+            self._loading_levels if loading_levels is None else loading_levels,
+            self._extrema_types if extrema_types is None else extrema_types,
+        )
+
+    def freeze(self) -> "PriceSeries":
+        """Make the arrays read-only, so the series can be cached and shared between threads."""
+        for x in (
+            self._starts,
+            self._offsets,
+            self._prices,
+            self._levels,
+            self._loading_levels,
+            self._extrema_types,
+        ):
+            x.flags.writeable = False
+        return self
+
+    @property
+    def frozen(self) -> bool:  # noqa: D102
+        return not self._extrema_types.flags.writeable
+
+    def take(self, indices) -> "PriceSeries":
+        """Return the sub series selected by a slice, an index array or a boolean mask."""
+        return PriceSeries(
+            self._starts[indices],
+            self._offsets[indices],
+            self._prices[indices],
+            self._levels[indices],
+            self._loading_levels[indices],
+            self._extrema_types[indices],
+        )
+
+    @property
+    def index(self) -> SlotIndex:
+        """Timeline of the starts, built on first use."""
+        if self._index is None:
+            self._index = SlotIndex(self._starts)
+        return self._index
+
+    def after(self, t: datetime) -> "PriceSeries":
+        """Slots starting after t, a view on the arrays of this series."""
+        return self.take(slice(self.index.after(t), None))
+
+    def local_days(self) -> np.ndarray:
+        """Date of each slot in the local time Tibber reported (datetime64[D])."""
+        return (self._starts + self._offsets.astype("timedelta64[s]")).astype("datetime64[D]")
+
+    def days(self) -> list["PriceSeries"]:
+        """The series split per local day, views on the arrays of this series."""
+        if len(self) == 0:
+            return []
+        days = self.local_days()
+        bounds = [0, *(np.flatnonzero(days[1:] != days[:-1]) + 1).tolist(), len(self)]
+        return [self.take(slice(lo, hi)) for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+    def marks_changed(self) -> None:
+        """Drop the label index after the loading levels were written."""
+        self._loading_level_index = None
+
+    def starts_at(self, i: int) -> datetime:
+        """Start of slot i in the time zone reported by Tibber."""
+        return datetime.fromtimestamp(
+            int(self._starts[i].astype(np.int64)), _offset_tz(int(self._offsets[i]))
+        )
+
+    def hourly_data(self, i: int) -> PriceSlot:
+        """Snapshot of slot i, marks set on it are not written back to the series."""
+        res = PriceSlot(
+            _LEVELS_BY_CODE[int(self._levels[i])],
+            self.starts_at(i),
+            float(self._prices[i]),
+        )
+        res.loading_level = _LOADING_LEVELS_BY_CODE[int(self._loading_levels[i])]
+        res.extrema_type = _EXTREMA_TYPES_BY_CODE[int(self._extrema_types[i])]
+        return res
+
+    def loading_level_indices(self, level: LoadingLevel) -> np.ndarray:
+        """Indices of the slots marked with the loading level."""
+        if self._loading_level_index is None:
+            self._loading_level_index = LabelIndex(self._loading_levels)
+        return self._loading_level_index.indices(_LOADING_CODES[level])
+
+    def to_list(self) -> list[PriceSlot]:  # noqa: D102
+        return [self.hourly_data(i) for i in range(len(self))]
+
+    def __len__(self) -> int:  # noqa: D105
+        return len(self._prices)
+
+    def __getitem__(self, key):  # noqa: D105
+        if isinstance(key, (int, np.integer)):
+            return self.hourly_data(key)
+        return self.take(key)
+
+    def __iter__(self):  # noqa: D105
+        for i in range(len(self)):
+            yield self.hourly_data(i)
+
+
+def relative_extrema_indices(prices: np.ndarray, comparator) -> np.ndarray:
+    """Indices of the slots comparing true against both neighbours, the ends never qualify.
+
+    Same result as scipy.signal.argrelextrema(prices, comparator)[0] for order 1.
+    """
+    if len(prices) < 3:
+        return np.empty(0, dtype=np.intp)
+    inner = prices[1:-1]
+    return np.flatnonzero(comparator(inner, prices[:-2]) & comparator(inner, prices[2:])) + 1
+
+
+def extrema_codes(prices: np.ndarray, codes: np.ndarray | None = None) -> np.ndarray:
+    """Extrema codes with the absolute Min + Max marked, added to a copy of codes if given."""
+    res = np.zeros(len(prices), dtype=np.int8) if codes is None else codes.copy()
+    if len(prices) > 0:
+        res[np.argmin(prices)] = _EXTREMA_CODES[ExtremaType.MIN]
+        res[np.argmax(prices)] = _EXTREMA_CODES[ExtremaType.MAX]
+    return res
+
+
+def loading_level_codes(prices: np.ndarray, perc_loss_load_unload: float) -> np.ndarray:
+    """Slot i is LOAD_FROM_NET if a later slot costs >= price * factor, UNLOAD_BATTERY if it costs >= an earlier price * factor.
+
+    LOAD_FROM_NET wins if both apply. Runs in O(n) using a suffix maximum and a prefix minimum.
+    """
+    factor = 1.0 + perc_loss_load_unload / 100
+
+    res = np.zeros(len(prices), dtype=np.int8)
+    if len(prices) < 2:
+        return res
+
+    # highest price after slot i and lowest price before slot i
+    later_max = np.maximum.accumulate(prices[::-1])[::-1][1:]
+    earlier_min = np.minimum.accumulate(prices)[:-1]
+
+    res[1:][prices[1:] >= earlier_min * factor] = _LOADING_CODES[LoadingLevel.UNLOAD_BATTERY]
+    res[:-1][later_max >= prices[:-1] * factor] = _LOADING_CODES[LoadingLevel.LOAD_FROM_NET]
+    return res
+
+
+@functools.lru_cache(maxsize=8)
+def _offset_tz(offset: int) -> timezone:
+    return timezone(timedelta(seconds=offset))
+
+
+@functools.lru_cache(maxsize=16)
+def _suffix_offset(suffix: str) -> int:
+    """UTC offset in seconds of the part after the seconds, e.g. '.000+01:00'."""
+    offset = datetime.fromisoformat("2000-01-01T00:00:00" + suffix).utcoffset()
+    if offset is None:
+        raise ValueError(f"Timestamp without UTC offset: {suffix!r}")
+    return int(offset.total_seconds())
+
+
+def parse_starts_at(values: list[str]) -> tuple[np.ndarray, np.ndarray]:
+    """Parse ISO timestamps like '2024-01-27T00:00:00.000+01:00' into UTC starts and offsets.
+
+    NumPy parses the local date and time of the whole column at once, the suffix with the
+    fractional seconds and the offset is parsed once per distinct value. Same result as
+    datetime.fromisoformat per value, fractions of a second are dropped.
+    """
+    # from bytes, NumPy parses datetimes several times faster than from unicode
+    local = np.array([x[:19] for x in values], dtype="S19").astype("datetime64[s]")
+    offsets = np.fromiter(
+        (_suffix_offset(x[19:]) for x in values), dtype=np.int32, count=len(values)
+    )
+    return local - offsets.astype("timedelta64[s]"), offsets
+
+
+class PriceWindow:
+    """Consecutive slots with their average price."""
+
+    def __init__(  # noqa: D107
+        self, start: datetime, end: datetime, avg_price: float, slots: int
+    ) -> None:
+        self._start = start
+        self._end = end
+        self._avg_price = avg_price
+        self._slots = slots
+
+    @property
+    def start(self) -> datetime:  # noqa: D102
+        return self._start
+
+    @property
+    def end(self) -> datetime:
+        """End of the last slot of the window."""
+        return self._end
+
+    @property
+    def avg_price(self) -> float:  # noqa: D102
+        return self._avg_price
+
+    @property
+    def slots(self) -> int:  # noqa: D102
+        return self._slots
+
+    def __str__(self) -> str:  # noqa: D105
+        return f"PriceWindow({self.start} - {self.end}, {self.slots} slots, {self.avg_price} @/kWh)"
+
+
+class PriceBlocks:
+    """Queries for contiguous blocks of slots, e.g. to place an appliance.
+
+    The prefix sums of the prices are computed once per series, so the average of any block
+    is O(1) and the cheapest or most expensive block of k slots O(n). Blocks never span a
+    gap in the slots.
+    """
+
+    def __init__(self, series: PriceSeries, slot_length: timedelta) -> None:  # noqa: D107
+        self._series = series
+        self._slot_length = slot_length
+        self._sums = np.concatenate(([0.0], np.cumsum(series.prices)))
+        gaps = np.diff(series.starts) != np.timedelta64(slot_length)
+        # number of gaps before each slot, equal at both ends of a block without gap
+        self._runs = np.concatenate(([0], np.cumsum(gaps)))
+
+    @property
+    def series(self) -> PriceSeries:  # noqa: D102
+        return self._series
+
+    @property
+    def slot_length(self) -> timedelta:  # noqa: D102
+        return self._slot_length
+
+    def slots_for(self, duration: timedelta) -> int:
+        """Slots needed to cover the duration."""
+        return max(1, -(-duration // self._slot_length))
+
+    def average(self, start: int, slots: int) -> float:
+        """Average price of the block of slots starting at index start."""
+        return float((self._sums[start + slots] - self._sums[start]) / slots)
+
+    def averages(self, slots: int) -> np.ndarray:
+        """Average price of every block of slots by start index, NaN for blocks over a gap."""
+        n = len(self._series)
+        if slots <= 0 or slots > n:
+            return np.empty(0)
+        res = (self._sums[slots:] - self._sums[:-slots]) / slots
+        res[self._runs[slots - 1 :] != self._runs[: n - slots + 1]] = np.nan
+        return res
+
+    def window(self, start: int, slots: int) -> PriceWindow:
+        """The block of slots starting at index start."""
+        begin = self._series.starts_at(start)
+        return PriceWindow(
+            begin, begin + slots * self._slot_length, self.average(start, slots), slots
+        )
+
+    def _best(
+        self,
+        slots: int,
+        earliest: datetime | None,
+        deadline: datetime | None,
+        cheapest: bool,
+    ) -> PriceWindow | None:
+        starts = self._series.starts
+        lo = 0
+        if earliest is not None:
+            # the slot running at earliest may still be used
+            utc = np.datetime64(int(earliest.timestamp()), "s")
+            lo = max(int(np.searchsorted(starts, utc, side="right")) - 1, 0)
+        averages = self.averages(slots)
+        hi = len(averages)
+        if deadline is not None:
+            last_start = np.datetime64(int(deadline.timestamp()), "s") - np.timedelta64(
+                self._slot_length
+            )
+            hi = min(hi, int(np.searchsorted(starts, last_start, side="right")) - slots + 1)
+        # a deadline too early for the block leaves no candidate, not a slice from the end
+        hi = max(hi, lo)
+        candidates = averages[lo:hi]
+        if len(candidates) == 0 or np.isnan(candidates).all():
+            return None
+        # the earliest of equal blocks
+        i = np.nanargmin(candidates) if cheapest else np.nanargmax(candidates)
+        return self.window(lo + int(i), slots)
+
+    def cheapest(
+        self, slots: int, earliest: datetime | None = None, deadline: datetime | None = None
+    ) -> PriceWindow | None:
+        """Cheapest block of slots starting with the slot of earliest and ending by deadline."""
+        return self._best(slots, earliest, deadline, True)
+
+    def most_expensive(
+        self, slots: int, earliest: datetime | None = None, deadline: datetime | None = None
+    ) -> PriceWindow | None:
+        """Most expensive block of slots starting with the slot of earliest and ending by deadline."""
+        return self._best(slots, earliest, deadline, False)
+
+    def cheapest_blocks(
+        self,
+        durations: list[timedelta],
+        earliest: datetime | None = None,
+        deadline: datetime | None = None,
+    ) -> dict[timedelta, PriceWindow | None]:
+        """Cheapest block per duration, all from the same prefix sums."""
+        return {
+            x: self.cheapest(self.slots_for(x), earliest, deadline) for x in durations
+        }
+
+    def most_expensive_blocks(
+        self,
+        durations: list[timedelta],
+        earliest: datetime | None = None,
+        deadline: datetime | None = None,
+    ) -> dict[timedelta, PriceWindow | None]:
+        """Most expensive block per duration, all from the same prefix sums."""
+        return {
+            x: self.most_expensive(self.slots_for(x), earliest, deadline) for x in durations
+        }
 
 
 class Statistics:  # noqa: D101
@@ -113,8 +716,8 @@ class Statistics:  # noqa: D101
     """Last time slot."""
     _avg_level: PriceLevel
     _avg_price: float
-    _min: HourlyData
-    _max: HourlyData
+    _min: PriceSlot
+    _max: PriceSlot
 
     @property
     def start_time(self) -> datetime:  # noqa: D102
@@ -129,7 +732,7 @@ class Statistics:  # noqa: D101
         return self._avg_level
 
     @property
-    def min(self) -> HourlyData:  # noqa: D102
+    def min(self) -> PriceSlot:  # noqa: D102
         return self._min
 
     @property
@@ -137,7 +740,7 @@ class Statistics:  # noqa: D101
         return self._avg_price
 
     @property
-    def max(self) -> HourlyData:  # noqa: D102
+    def max(self) -> PriceSlot:  # noqa: D102
         return self._max
 
     @staticmethod
@@ -166,19 +769,34 @@ class Statistics:  # noqa: D101
         if pl == 2:
             return PriceLevel.VERY_EXPENSIVE
 
-    def __init__(self, arr: list[HourlyData]) -> None:  # noqa: D107
-        self._start_time = arr[0].starts_at
-        self._end_time = arr[len(arr) - 1].starts_at
+    def __init__(self, arr: list[PriceSlot] | PriceSeries) -> None:  # noqa: D107
+        if isinstance(arr, PriceSeries):
+            self._start_time = arr.starts_at(0)
+            self._end_time = arr.starts_at(len(arr) - 1)
+        else:
+            self._start_time = arr[0].starts_at
+            self._end_time = arr[len(arr) - 1].starts_at
 
         np_arr = TibberApi.get_prices_numpy(arr)
         self._avg_price = np.mean(np_arr)
-        self._max = TibberApi.absolute_maximum(arr)
-        self._min = TibberApi.absolute_minimum(arr)
+        # copies of the slots, the input is not marked
+        self._max = self._extremum(arr, int(np.argmax(np_arr)), ExtremaType.MAX)
+        self._min = self._extremum(arr, int(np.argmin(np_arr)), ExtremaType.MIN)
 
         self._avg_level = self._calc_avg_pricelevel(arr)
 
     @staticmethod
-    def _calc_avg_pricelevel(arr: list[HourlyData]) -> PriceLevel:
+    def _extremum(arr: list[PriceSlot] | PriceSeries, i: int, extrema_type: ExtremaType) -> PriceSlot:
+        res = arr.hourly_data(i) if isinstance(arr, PriceSeries) else copy.copy(arr[i])
+        res.extrema_type = extrema_type
+        return res
+
+    @staticmethod
+    def _calc_avg_pricelevel(arr: list[PriceSlot] | PriceSeries) -> PriceLevel:
+        if isinstance(arr, PriceSeries):
+            avg: float = np.mean(arr.levels)
+            return Statistics._level_from_int(round(avg))
+
         res = []
         for x in arr:
             int_val = Statistics._level_to_int(x.level)
@@ -188,72 +806,390 @@ class Statistics:  # noqa: D101
         return Statistics._level_from_int(round(avg))
 
 
+class HomePriceInfo:
+    """Price info of one home of the account."""
+
+    def __init__(self, home_id: str, address: str, price_info: []) -> None:  # noqa: D107
+        self._id = home_id
+        self._address = address
+        self._price_info = price_info
+
+    @property
+    def id(self) -> str:  # noqa: D102
+        return self._id
+
+    @property
+    def address(self) -> str:  # noqa: D102
+        return self._address
+
+    @property
+    def price_info(self) -> []:  # noqa: D102
+        return self._price_info
+
+    def with_price_info(self, price_info: []) -> "HomePriceInfo":  # noqa: D102
+        return HomePriceInfo(self._id, self._address, price_info)
+
+    def __str__(self) -> str:  # noqa: D105
+        return f"Home({self.id}, {self.address})"
+
+
 class TibberApi:  # noqa: D101
     def __init__(  # noqa: D107
-        self, token: str, perc_loss_load_unload: int, time_zone: tzinfo
+        self,
+        token: str,
+        perc_loss_load_unload: int,
+        time_zone: tzinfo,
+        session: aiohttp.ClientSession | None = None,
+        url: str = TIBBER_API_URL,
+        cache_path: str | None = None,
+        resolution: Resolution = Resolution.HOURLY,
+        history: "PriceHistory | None" = None,
+        timer: StageTimer = NO_TIMER,
     ) -> None:
         self._token = token
         self._perc_loss_load_unload = perc_loss_load_unload
         self._time_zone = time_zone
+        self._url = url
+        self._session = session
+        self._owns_session = False
+        self._requests_session: requests.Session | None = None
+        self._cache = PriceCache(cache_path) if cache_path is not None else None
+        self._resolution = resolution
+        self._history = history
+        self._timer = timer
 
     @property
     def perc_loss_load_unload(self) -> int:
         """Percentag loss for loading + unloading."""
         return self._perc_loss_load_unload
 
-    def get_price_info(self) -> []:  # noqa: D102
-        headers = {
+    @property
+    def resolution(self) -> Resolution:  # noqa: D102
+        return self._resolution
+
+    @property
+    def timer(self) -> StageTimer:
+        """Stage timings of the fetch and analysis, disabled by default."""
+        return self._timer
+
+    @property
+    def history(self) -> "PriceHistory | None":
+        """Local price history every fetch is appended to, if any."""
+        return self._history
+
+    def _headers(self) -> dict:
+        return {
             "Accept-Language": "sv-SE",
             "User-Agent": "REST",
             "Content-Type": "application/json; charset=utf-8",
             "Authorization": self._token,
         }
-        url = "https://api.tibber.com/v1-beta/gql"
-        payload = '{ "query": "{ viewer { homes { currentSubscription { priceInfo { current { total startsAt level } today { total startsAt level } tomorrow { total startsAt level }}}}}}" }'
-        response = requests.post(url, headers=headers, data=payload, timeout=10)
-        if response.status_code == requests.codes.ok:
-            data = response.json()
-            return data["data"]["viewer"]["homes"][0]["currentSubscription"][
-                "priceInfo"
-            ]
-        else:
+
+    @staticmethod
+    def homes_from_response(data: dict) -> list[HomePriceInfo]:
+        """Homes with an active subscription in a decoded price info response, [] for an error response."""
+        errors = data.get("errors")
+        viewer = (data.get("data") or {}).get("viewer")
+        if errors or viewer is None:
+            # GraphQL reports e.g. an invalid token or throttling with status 200
+            _LOGGER.error("Failed to get price data, %s", errors or data)
+            return []
+        res: list[HomePriceInfo] = []
+        for home in viewer.get("homes") or []:
+            subscription = home.get("currentSubscription")
+            if subscription is None:
+                # home without an active contract
+                continue
+            address = home.get("address") or {}
+            res.append(
+                HomePriceInfo(
+                    home.get("id"),
+                    " ".join(
+                        x
+                        for x in (
+                            address.get("address1"),
+                            address.get("postalCode"),
+                            address.get("city"),
+                        )
+                        if x
+                    ),
+                    subscription["priceInfo"],
+                )
+            )
+        return res
+
+    def _store_cache(self, homes: list[HomePriceInfo]) -> None:
+        if self._cache is None:
+            return
+        try:
+            self._cache.store(homes)
+        except OSError as err:
+            _LOGGER.warning("Failed to write price cache: %s", err)
+
+    def _store_history(self, homes: list[HomePriceInfo]) -> None:
+        if self._history is None:
+            return
+        try:
+            self._history.store(homes)
+        except sqlite3.Error as err:
+            _LOGGER.warning("Failed to write price history: %s", err)
+
+    def _store_fetched(self, homes: list[HomePriceInfo]) -> None:
+        self._store_cache(homes)
+        self._store_history(homes)
+
+    def load_cached_homes(self, now: datetime | None = None) -> list[HomePriceInfo]:
+        """Return the cached homes with their price info aligned to now, homes without prices for today are left out."""
+        if self._cache is None:
+            return []
+        res: list[HomePriceInfo] = []
+        for home_id, address, price_info in self._cache.load():
+            price_info = self.align_price_info(price_info, now)
+            if price_info:
+                res.append(HomePriceInfo(home_id, address, price_info))
+        return res
+
+    def load_cached_price_info(self, now: datetime | None = None) -> []:
+        """Return the cached price info of the first home aligned to now, [] if there is none for today."""
+        homes = self.load_cached_homes(now)
+        return homes[0].price_info if homes else []
+
+    def align_price_info(self, price_info: [], now: datetime | None = None) -> []:
+        """Move yesterday's tomorrow to today and pick the current slot, [] if outdated."""
+        if not price_info:
+            return []
+        if now is None:
+            now = datetime.now(self._time_zone)
+        today_date = now.astimezone(self._time_zone).date().isoformat()
+
+        today = price_info.get("today") or []
+        tomorrow = price_info.get("tomorrow") or []
+        if tomorrow and tomorrow[0]["startsAt"][:10] == today_date:
+            today, tomorrow = tomorrow, []
+        if not today or today[0]["startsAt"][:10] != today_date:
+            return []
+
+        starts, _ = parse_starts_at([x["startsAt"] for x in today])
+        now_utc = np.datetime64(int(now.timestamp()), "s")
+        current = today[max(int(np.searchsorted(starts, now_utc, side="right")) - 1, 0)]
+        return {"current": current, "today": today, "tomorrow": tomorrow}
+
+    def align_homes(
+        self, homes: list[HomePriceInfo], now: datetime | None = None
+    ) -> dict[str, HomePriceInfo]:
+        """Homes by id with their price info aligned to now, homes without prices for today are left out."""
+        res = {}
+        for home in homes:
+            price_info = self.align_price_info(home.price_info, now)
+            if price_info:
+                res[home.id] = home.with_price_info(price_info)
+        return res
+
+    def _post_price_query(self) -> bytes | None:
+        """Body of the price info query, None if it failed."""
+        if self._requests_session is None:
+            # keep the connection alive between polls
+            self._requests_session = requests.Session()
+        with self._timer.stage("http"):
+            response = self._requests_session.post(
+                self._url,
+                headers=self._headers(),
+                data=self._resolution.query,
+                timeout=REQUEST_TIMEOUT,
+            )
+            body = response.content
+        if response.status_code != requests.codes.ok:
             _LOGGER.error("Failed to get price data, %s", response.text)
+            return None
+        return body
+
+    def get_homes_price_info(self) -> list[HomePriceInfo]:
+        """Fetch the price info of all homes in one request."""
+        body = self._post_price_query()
+        if body is None:
             return []
+        timer = self._timer
+        with timer.stage("json_decode"):
+            data = json_loads(body)
+        homes = self.homes_from_response(data)
+        with timer.stage("store"):
+            self._store_fetched(homes)
+        return homes
+
+    def get_price_series(self) -> dict[str, dict[str, PriceSeries]]:
+        """Fetch current, today and tomorrow of all homes as PriceSeries per home id.
+
+        Decoded from the response bytes without a dict per slot, falls back to the JSON
+        decoder for responses the fast path does not read. Nothing is cached or stored.
+        """
+        from .decode import decode_price_series, price_series_of  # noqa: PLC0415
+
+        body = self._post_price_query()
+        if body is None:
+            return {}
+        with self._timer.stage("json_decode"):
+            res = decode_price_series(body)
+            if res is None:
+                res = price_series_of(self.homes_from_response(json_loads(body)))
+        return res
+
+    def get_price_info(self) -> []:  # noqa: D102
+        homes = self.get_homes_price_info()
+        return homes[0].price_info if homes else []
+
+    def post_query(self, query: str) -> dict | None:
+        """Send a GraphQL query, the decoded data of the response or None on failure."""
+        if self._requests_session is None:
+            self._requests_session = requests.Session()
+        response = self._requests_session.post(
+            self._url,
+            headers=self._headers(),
+            data=json.dumps({"query": query}),
+            timeout=REQUEST_TIMEOUT,
+        )
+        if response.status_code != requests.codes.ok:
+            _LOGGER.error("Query failed, %s", response.text)
+            return None
+        return json_loads(response.content).get("data")
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Return the shared session, creating a pooled keep-alive one if none was passed in."""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit_per_host=2, keepalive_timeout=60)
+            )
+            self._owns_session = True
+        return self._session
+
+    async def async_get_homes_price_info(self) -> list[HomePriceInfo]:
+        """Fetch the price info of all homes in one request without blocking the event loop."""
+        session = self._get_session()
+        timer = self._timer
+        with timer.stage("http"):
+            async with session.post(
+                self._url,
+                headers=self._headers(),
+                data=self._resolution.query,
+                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+            ) as response:
+                status = response.status
+                body = await response.read()
+        if status == HTTPStatus.OK:
+            with timer.stage("json_decode"):
+                data = json_loads(body)
+            homes = self.homes_from_response(data)
+            if self._cache is not None or self._history is not None:
+                with timer.stage("store"):
+                    await asyncio.get_running_loop().run_in_executor(
+                        None, self._store_fetched, homes
+                    )
+            return homes
+        _LOGGER.error("Failed to get price data, %s", body.decode("utf-8", "replace"))
+        return []
+
+    async def async_get_websocket_url(self) -> str | None:
+        """URL of the liveMeasurement subscriptions of the account, None on failure."""
+        session = self._get_session()
+        async with session.post(
+            self._url,
+            headers=self._headers(),
+            data=WEBSOCKET_URL_QUERY,
+            timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+        ) as response:
+            if response.status == HTTPStatus.OK:
+                data = await response.json()
+                return data["data"]["viewer"]["websocketSubscriptionUrl"]
+            _LOGGER.error("Failed to get websocket url, %s", await response.text())
+            return None
+
+    async def async_post_query(self, query: str) -> dict | None:
+        """Send a GraphQL query on the pooled connection, the decoded data or None on failure."""
+        session = self._get_session()
+        async with session.post(
+            self._url,
+            headers=self._headers(),
+            data=json.dumps({"query": query}),
+            timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+        ) as response:
+            status = response.status
+            body = await response.read()
+        if status != HTTPStatus.OK:
+            _LOGGER.error("Query failed, %s", body.decode("utf-8", "replace"))
+            return None
+        return json_loads(body).get("data")
+
+    async def async_get_price_info(self) -> []:
+        """Fetch the price info of the first home, reusing the pooled connection."""
+        homes = await self.async_get_homes_price_info()
+        return homes[0].price_info if homes else []
+
+    async def async_close(self) -> None:
+        """Close the session if it was created by this instance."""
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+        self._session = None
+        self._owns_session = False
+
+    def close(self) -> None:
+        """Close the blocking session."""
+        if self._requests_session is not None:
+            self._requests_session.close()
+            self._requests_session = None
 
     @staticmethod
-    def convert_to_list(arr: []) -> list[HourlyData]:  # noqa: D102
-        res: list[HourlyData] = []
+    def convert_to_list(arr: []) -> list[PriceSlot]:  # noqa: D102
+        res: list[PriceSlot] = []
         for x in arr:
             hld = TibberApi.convert_to_hourly(x)
             res.append(hld)
         return res
 
     @staticmethod
-    def convert_to_hourly(hld) -> HourlyData:  # noqa: D102
-        res = HourlyData(
+    def convert_to_hourly(hld) -> PriceSlot:  # noqa: D102
+        res = PriceSlot(
             PriceLevel.from_string(hld["level"]),
             datetime.fromisoformat(hld["startsAt"]),
             hld["total"],
         )
         return res
 
-    def filter_future_items(self, arr: list[HourlyData]) -> list[HourlyData]:
-        """Filter out all items with startsAt <= now."""
+    @staticmethod
+    def convert_to_series(arr: []) -> PriceSeries:  # noqa: D102
+        return PriceSeries.from_price_info(arr)
+
+    def filter_future_items(
+        self, arr: list[PriceSlot] | PriceSeries
+    ) -> list[PriceSlot] | PriceSeries:
+        """Filter out all items with startsAt <= now, a series is sliced without copying."""
         now = datetime.now(self._time_zone)
 
-        filtered_values: list[HourlyData] = [x for x in arr if x.starts_at > now]
+        if isinstance(arr, PriceSeries):
+            return arr.after(now)
+
+        filtered_values: list[PriceSlot] = [x for x in arr if x.starts_at > now]
         return filtered_values
 
+    def price_blocks(self, arr: list[PriceSlot] | PriceSeries) -> PriceBlocks:
+        """Block queries over the slots, built once per data set and asked many times."""
+        series = arr if isinstance(arr, PriceSeries) else PriceSeries.from_list(arr)
+        return PriceBlocks(series, self._resolution.slot_length)
+
     @staticmethod
     def filter_loading_level(
-        arr: list[HourlyData], level: LoadingLevel
-    ) -> list[HourlyData]:
+        arr: list[PriceSlot] | PriceSeries, level: LoadingLevel
+    ) -> list[PriceSlot] | PriceSeries:
         """Filter out all items with a certain loading level."""
-        filtered_values: list[HourlyData] = [x for x in arr if x.loading_level is level]
+        if isinstance(arr, PriceSeries):
+            return arr.take(arr.loading_level_indices(level))
+
+        filtered_values: list[PriceSlot] = [x for x in arr if x.loading_level is level]
         return filtered_values
 
     @staticmethod
-    def get_prices_numpy(arr: list[HourlyData]) -> np.array:  # noqa: D102
+    def get_prices_numpy(arr: list[PriceSlot] | PriceSeries) -> np.array:  # noqa: D102
+        if isinstance(arr, PriceSeries):
+            return arr.prices
+
         res = []
         for x in arr:
             res.append(x.price)
@@ -261,11 +1197,17 @@ class TibberApi:  # noqa: D101
         return np.array(res)
 
     @staticmethod
-    def relative_minima(arr: list[HourlyData]) -> list[HourlyData]:  # noqa: D102
+    def relative_minima(
+        arr: list[PriceSlot] | PriceSeries,
+    ) -> list[PriceSlot] | PriceSeries:  # noqa: D102
         data_array = TibberApi.get_prices_numpy(arr)
-        extrema_indices = argrelextrema(data_array, np.less)[0]
+        extrema_indices = relative_extrema_indices(data_array, np.less)
+
+        if isinstance(arr, PriceSeries):
+            arr.extrema_types[extrema_indices] = _EXTREMA_CODES[ExtremaType.REL_MIN]
+            return arr.take(extrema_indices)
 
-        res: list[HourlyData] = []
+        res: list[PriceSlot] = []
         for x in extrema_indices:
             val = arr[x]
             val.extrema_type = ExtremaType.REL_MIN
@@ -274,11 +1216,17 @@ class TibberApi:  # noqa: D101
         return res
 
     @staticmethod
-    def relative_maxima(arr: list[HourlyData]) -> list[HourlyData]:  # noqa: D102
+    def relative_maxima(
+        arr: list[PriceSlot] | PriceSeries,
+    ) -> list[PriceSlot] | PriceSeries:  # noqa: D102
         data_array = TibberApi.get_prices_numpy(arr)
-        extrema_indices = argrelextrema(data_array, np.greater)[0]
+        extrema_indices = relative_extrema_indices(data_array, np.greater)
 
-        res: list[HourlyData] = []
+        if isinstance(arr, PriceSeries):
+            arr.extrema_types[extrema_indices] = _EXTREMA_CODES[ExtremaType.REL_MAX]
+            return arr.take(extrema_indices)
+
+        res: list[PriceSlot] = []
         for x in extrema_indices:
             val = arr[x]
             val.extrema_type = ExtremaType.REL_MAX
@@ -287,10 +1235,15 @@ class TibberApi:  # noqa: D101
         return res
 
     @staticmethod
-    def relative_extrema(arr: list[HourlyData]) -> list[HourlyData]:  # noqa: D102
+    def relative_extrema(
+        arr: list[PriceSlot] | PriceSeries,
+    ) -> list[PriceSlot] | PriceSeries:  # noqa: D102
+        if isinstance(arr, PriceSeries):
+            return TibberApi._relative_extrema_series(arr)
+
         minima = TibberApi.relative_minima(arr)
         # determine absolute MIN
-        min_x: HourlyData = None
+        min_x: PriceSlot = None
         for x in minima:
             if min_x is None or x.price < min_x.price:
                 min_x = x
@@ -298,7 +1251,7 @@ class TibberApi:  # noqa: D101
 
         maxima = TibberApi.relative_maxima(arr)
         # determine absolute MAX
-        max_x: HourlyData = None
+        max_x: PriceSlot = None
         for x in maxima:
             if max_x is None or x.price > max_x.price:
                 max_x = x
@@ -311,14 +1264,42 @@ class TibberApi:  # noqa: D101
         return sorted_extrama
 
     @staticmethod
-    def mark_extrema(arr: list[HourlyData]) -> None:  # noqa: D102
-        """Mark Min + Max."""
+    def _relative_extrema_series(arr: PriceSeries) -> PriceSeries:
+        prices = arr.prices
+        minima = relative_extrema_indices(prices, np.less)
+        maxima = relative_extrema_indices(prices, np.greater)
+        codes = arr.extrema_types
+        codes[minima] = _EXTREMA_CODES[ExtremaType.REL_MIN]
+        codes[maxima] = _EXTREMA_CODES[ExtremaType.REL_MAX]
+        if len(minima) > 0:
+            codes[minima[np.argmin(prices[minima])]] = _EXTREMA_CODES[ExtremaType.MIN]
+        if len(maxima) > 0:
+            codes[maxima[np.argmax(prices[maxima])]] = _EXTREMA_CODES[ExtremaType.MAX]
+
+        return arr.take(np.sort(np.concatenate((minima, maxima))))
+
+    @staticmethod
+    def with_extrema(series: PriceSeries) -> PriceSeries:
+        """Copy of the marks with the absolute Min + Max added, the series is left alone."""
+        codes = extrema_codes(series.prices, series.extrema_types)
+        return series.with_marks(extrema_types=codes)
+
+    @staticmethod
+    def mark_extrema(arr: list[PriceSlot] | PriceSeries) -> None:  # noqa: D102
+        """Mark Min + Max in place."""
         TibberApi.absolute_minimum(arr)
         TibberApi.absolute_maximum(arr)
 
     @staticmethod
-    def absolute_minimum(arr: list[HourlyData]) -> HourlyData:  # noqa: D102
-        res: HourlyData = None
+    def absolute_minimum(arr: list[PriceSlot] | PriceSeries) -> PriceSlot:  # noqa: D102
+        if isinstance(arr, PriceSeries):
+            if len(arr) == 0:
+                return None
+            i = np.argmin(arr.prices)
+            arr.extrema_types[i] = _EXTREMA_CODES[ExtremaType.MIN]
+            return arr[i]
+
+        res: PriceSlot = None
         for x in arr:
             if res is None or x.price < res.price:
                 res = x
@@ -328,8 +1309,15 @@ class TibberApi:  # noqa: D101
         return res
 
     @staticmethod
-    def absolute_maximum(arr: list[HourlyData]) -> HourlyData:  # noqa: D102
-        res: HourlyData = None
+    def absolute_maximum(arr: list[PriceSlot] | PriceSeries) -> PriceSlot:  # noqa: D102
+        if isinstance(arr, PriceSeries):
+            if len(arr) == 0:
+                return None
+            i = np.argmax(arr.prices)
+            arr.extrema_types[i] = _EXTREMA_CODES[ExtremaType.MAX]
+            return arr[i]
+
+        res: PriceSlot = None
         for x in arr:
             if res is None or x.price > res.price:
                 res = x
@@ -338,28 +1326,40 @@ class TibberApi:  # noqa: D101
             res.extrema_type = ExtremaType.MAX
         return res
 
-    def determine_loading_levels(self, arr: list[HourlyData]) -> None:
+    def with_loading_levels(self, series: PriceSeries) -> PriceSeries:
+        """New series with the loading levels, the series is left alone."""
+        codes = loading_level_codes(series.prices, self.perc_loss_load_unload)
+        marked = codes != 0
+        res = series.loading_levels.copy()
+        res[marked] = codes[marked]
+        return series.with_marks(loading_levels=res)
+
+    def determine_loading_levels(self, arr: list[PriceSlot] | PriceSeries) -> None:
         """Mark all slots which are suitable for loading and unloading of the battery, which have at least perc_loss_load_unload distance."""
-        factor = 1.0 + self.perc_loss_load_unload / 100
-
-        for i in range(len(arr) - 1):
-            hd1 = arr[i]
-            # current slot is suitable for loading if there is a successor slot with price >= max_price
-            max_price = hd1.price * factor
-            found = False
-            for j in range(i + 1, len(arr) - 1):
-                hd2 = arr[j]
-                if hd2.price >= max_price:
-                    found = True
-                    hd2.loading_level = LoadingLevel.UNLOAD_BATTERY
-
-            if found:
-                hd1.loading_level = LoadingLevel.LOAD_FROM_NET
+        codes = loading_level_codes(TibberApi.get_prices_numpy(arr), self.perc_loss_load_unload)
+
+        if isinstance(arr, PriceSeries):
+            marked = codes != 0
+            arr.loading_levels[marked] = codes[marked]
+            arr.marks_changed()
+            return
+
+        for x, code in zip(arr, codes):
+            if code != 0:
+                x.loading_level = _LOADING_LEVELS_BY_CODE[int(code)]
 
     @staticmethod
-    def merge_loading_level(current: HourlyData, today: list[HourlyData]) -> None:
+    def merge_loading_level(
+        current: PriceSlot, today: list[PriceSlot] | PriceSeries
+    ) -> None:
         """Find the loading level in today and set it to current."""
-        filtered_values: list[HourlyData] = [
+        if isinstance(today, PriceSeries):
+            i = today.index.find(current.starts_at)
+            if i is not None:
+                current.loading_level = _LOADING_LEVELS_BY_CODE[int(today.loading_levels[i])]
+            return
+
+        filtered_values: list[PriceSlot] = [
             x for x in today if x.starts_at == current.starts_at
         ]
         if len(filtered_values) > 0:
@@ -0,0 +1,241 @@
+"""Replay loading strategies day by day over historical prices and compare their savings."""
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from enum import Enum
+import itertools
+import os
+
+from .api import LoadingLevel, PriceSeries, loading_level_codes
+from .lazy import lazy_import
+from .optimizer import BatteryParameters, optimize_battery
+
+np = lazy_import("numpy")
+
+_LOAD = PriceSeries.LOADING_CODES[LoadingLevel.LOAD_FROM_NET]
+_UNLOAD = PriceSeries.LOADING_CODES[LoadingLevel.UNLOAD_BATTERY]
+
+
+class Strategy(Enum):
+    """How the battery is driven in the replay."""
+
+    LOADING_LEVELS = "loading_levels"
+    """Charge at full power in LOAD_FROM_NET slots, discharge in UNLOAD_BATTERY slots."""
+    OPTIMIZER = "optimizer"
+    """Follow the plan of optimize_battery, the best possible with the day's prices."""
+
+
+class BacktestConfig:
+    """One point of the parameter grid."""
+
+    __slots__ = ("_perc_loss_load_unload", "_battery", "_strategy")
+
+    def __init__(  # noqa: D107
+        self,
+        perc_loss_load_unload: float,
+        battery: BatteryParameters,
+        strategy: Strategy = Strategy.LOADING_LEVELS,
+    ) -> None:
+        self._perc_loss_load_unload = perc_loss_load_unload
+        self._battery = battery
+        self._strategy = strategy
+
+    @property
+    def perc_loss_load_unload(self) -> float:  # noqa: D102
+        return self._perc_loss_load_unload
+
+    @property
+    def battery(self) -> BatteryParameters:  # noqa: D102
+        return self._battery
+
+    @property
+    def strategy(self) -> Strategy:  # noqa: D102
+        return self._strategy
+
+    def __str__(self) -> str:  # noqa: D105
+        battery = self._battery
+        return (
+            f"BacktestConfig({self._strategy.value}, {self._perc_loss_load_unload} %, "
+            f"{battery.capacity} kWh, {battery.max_charge_power}/{battery.max_discharge_power} kW)"
+        )
+
+
+class BacktestResult:
+    """Realized energies and money of one configuration, in kWh and the currency of the prices."""
+
+    __slots__ = ("_config", "_days", "_charged", "_discharged", "_cost", "_value")
+
+    def __init__(  # noqa: D107
+        self,
+        config: BacktestConfig,
+        days: int,
+        charged: float,
+        discharged: float,
+        cost: float,
+        value: float,
+    ) -> None:
+        self._config = config
+        self._days = days
+        self._charged = charged
+        self._discharged = discharged
+        self._cost = cost
+        self._value = value
+
+    @property
+    def config(self) -> BacktestConfig:  # noqa: D102
+        return self._config
+
+    @property
+    def days(self) -> int:  # noqa: D102
+        return self._days
+
+    @property
+    def charged(self) -> float:
+        """Energy drawn from the net for charging."""
+        return self._charged
+
+    @property
+    def discharged(self) -> float:
+        """Energy from the battery which replaced energy from the net."""
+        return self._discharged
+
+    @property
+    def cost(self) -> float:
+        """Paid for charging."""
+        return self._cost
+
+    @property
+    def value(self) -> float:
+        """Not paid thanks to discharging."""
+        return self._value
+
+    @property
+    def savings(self) -> float:  # noqa: D102
+        return self._value - self._cost
+
+    @property
+    def spread(self) -> float | None:
+        """Average price of the discharged minus that of the charged energy."""
+        if self._charged <= 0 or self._discharged <= 0:
+            return None
+        return self._value / self._discharged - self._cost / self._charged
+
+    def __str__(self) -> str:  # noqa: D105
+        return f"BacktestResult({self._config}, {self._days} days, saved {self.savings:.2f})"
+
+
+def parameter_grid(
+    perc_losses: list[float],
+    batteries: list[BatteryParameters],
+    strategies: tuple[Strategy, ...] = (Strategy.LOADING_LEVELS,),
+) -> list[BacktestConfig]:
+    """Every combination of the loss percentages, batteries and strategies."""
+    return [
+        BacktestConfig(perc, battery, strategy)
+        for strategy, battery, perc in itertools.product(strategies, batteries, perc_losses)
+    ]
+
+
+def split_days(series: PriceSeries) -> list[np.ndarray]:
+    """Prices of the series per day of the local time Tibber reported."""
+    return [x.prices for x in series.days()]
+
+
+def _replay_loading_levels(
+    days: list[np.ndarray], config: BacktestConfig, slot_hours: float
+) -> BacktestResult:
+    battery = config.battery
+    eff = float(np.sqrt(battery.efficiency))
+    max_in = battery.max_charge_power * slot_hours
+    max_out = battery.max_discharge_power * slot_hours
+    soc = battery.initial_soc
+    charged = discharged = cost = value = 0.0
+    for prices in days:
+        codes = loading_level_codes(prices, config.perc_loss_load_unload)
+        marked = np.flatnonzero(codes)
+        # the battery state is carried over, only the marked slots change it
+        for price, code in zip(prices[marked].tolist(), codes[marked].tolist()):
+            if code == _LOAD:
+                grid = min(max_in, (battery.capacity - soc) / eff)
+                soc += grid * eff
+                charged += grid
+                cost += grid * price
+            elif code == _UNLOAD:
+                grid = min(max_out, (soc - battery.min_soc) * eff)
+                if grid <= 0:
+                    continue
+                soc -= grid / eff
+                discharged += grid
+                value += grid * price
+    return BacktestResult(config, len(days), charged, discharged, cost, value)
+
+
+def _replay_optimizer(
+    days: list[np.ndarray], config: BacktestConfig, slot_hours: float
+) -> BacktestResult:
+    battery = config.battery
+    soc = battery.initial_soc
+    charged = discharged = cost = value = 0.0
+    for prices in days:
+        plan = optimize_battery(prices, battery.with_initial_soc(soc), slot_hours)
+        if len(plan) == 0:
+            continue
+        grid = plan.grid_energy
+        charging = grid > 0
+        charged += float(grid[charging].sum())
+        discharged -= float(grid[~charging].sum())
+        cost += float(np.dot(prices[charging], grid[charging]))
+        value -= float(np.dot(prices[~charging], grid[~charging]))
+        soc = float(plan.soc[-1])
+    return BacktestResult(config, len(days), charged, discharged, cost, value)
+
+
+_REPLAYS = {
+    Strategy.LOADING_LEVELS: _replay_loading_levels,
+    Strategy.OPTIMIZER: _replay_optimizer,
+}
+
+
+def backtest(
+    days: list[np.ndarray], config: BacktestConfig, slot_hours: float = 1.0
+) -> BacktestResult:
+    """Replay the days one after the other, each decided on its own prices only."""
+    return _REPLAYS[config.strategy](days, config, slot_hours)
+
+
+# prices of the worker processes, sent once per worker instead of once per configuration
+_worker_days: list[np.ndarray] = []
+_worker_slot_hours = 1.0
+
+
+def _init_worker(days: list[np.ndarray], slot_hours: float) -> None:
+    global _worker_days, _worker_slot_hours  # noqa: PLW0603
+    _worker_days = days
+    _worker_slot_hours = slot_hours
+
+
+def _backtest_in_worker(config: BacktestConfig) -> BacktestResult:
+    return backtest(_worker_days, config, _worker_slot_hours)
+
+
+def run_backtests(
+    series: PriceSeries,
+    configs: list[BacktestConfig],
+    slot_hours: float = 1.0,
+    max_workers: int | None = None,
+) -> list[BacktestResult]:
+    """Backtest every configuration over the series, in a process pool.
+
+    The results are in the order of configs. max_workers=1 runs in this process, the default
+    uses one process per CPU.
+    """
+    days = split_days(series)
+    if max_workers is None:
+        max_workers = min(os.cpu_count() or 1, len(configs))
+    if max_workers <= 1 or len(configs) <= 1:
+        return [backtest(days, config, slot_hours) for config in configs]
+    chunksize = max(1, len(configs) // (max_workers * 4))
+    with ProcessPoolExecutor(
+        max_workers, initializer=_init_worker, initargs=(days, slot_hours)
+    ) as executor:
+        return list(executor.map(_backtest_in_worker, configs, chunksize=chunksize))
@@ -0,0 +1,64 @@
+"""Local cache of the last fetched priceInfo."""
+import json
+import logging
+import os
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class PriceCache:
+    """Keep the last priceInfo payload per home, together with its date, in a compact JSON file.
+
+    Prices of a day never change once published, so the cached payload can be shown
+    after a restart before the first fetch finished.
+    """
+
+    def __init__(self, path: str) -> None:  # noqa: D107
+        self._path = path
+        self._entries: dict | None = None
+
+    @property
+    def path(self) -> str:  # noqa: D102
+        return self._path
+
+    def _read(self) -> dict:
+        if self._entries is None:
+            try:
+                with open(self._path, encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except FileNotFoundError:
+                self._entries = {}
+            except (OSError, ValueError) as err:
+                _LOGGER.warning("Ignoring unreadable price cache %s: %s", self._path, err)
+                self._entries = {}
+        return self._entries
+
+    def load(self) -> list[tuple[str, str, []]]:
+        """Return (home id, address, priceInfo) of every cached home."""
+        res = []
+        for home_id, entry in self._read().items():
+            if isinstance(entry, dict) and entry.get("price_info"):
+                res.append((home_id, entry.get("address"), entry["price_info"]))
+        return res
+
+    def store(self, homes: list) -> bool:
+        """Write the priceInfo of the homes keyed by home and date, returns False if the file is already up to date."""
+        entries = {}
+        for home in homes:
+            today = home.price_info.get("today") if home.price_info else None
+            if not today:
+                continue
+            entries[home.id or ""] = {
+                "address": home.address,
+                "date": today[0]["startsAt"][:10],
+                "price_info": home.price_info,
+            }
+        if not entries or entries == self._read():
+            return False
+        self._entries = entries
+
+        tmp_path = f"{self._path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entries, f, separators=(",", ":"))
+        os.replace(tmp_path, self._path)
+        return True
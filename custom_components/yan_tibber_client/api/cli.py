@@ -0,0 +1,216 @@
+"""Command line export of the analysed prices, once, as a daemon or over the local history.
+
+python -m custom_components.yan_tibber_client.api prices --token TOKEN --output prices.csv
+python -m custom_components.yan_tibber_client.api prices --daemon --output prices.jsonl
+python -m custom_components.yan_tibber_client.api history --db prices.db --home ID --start 2024-01-01
+"""
+from __future__ import annotations
+
+import argparse
+from collections.abc import Callable
+from datetime import date, datetime, time as dt_time, timedelta, tzinfo
+import json
+import logging
+import os
+import sys
+import time
+from zoneinfo import ZoneInfo
+
+from .analysis import PriceAnalyzer
+from .api import TIBBER_API_URL, HomePriceInfo, Resolution, TibberApi
+from .export import FORMATS, ExportError, analyse_days, format_of, open_writer, series_columns
+from .history import CHUNK_SLOTS, PriceHistory
+from .lazy import lazy_import
+from .scheduler import FetchScheduler, least_complete
+
+requests = lazy_import("requests")
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_TIME_ZONE = "Europe/Berlin"
+MIN_SLEEP = 1.0
+"""Seconds the daemon sleeps at least between two rounds."""
+
+
+def export_homes(
+    analyzer: PriceAnalyzer,
+    homes: dict[str, HomePriceInfo],
+    writer,
+    exported: set[tuple[str, int]] | None = None,
+) -> set[tuple[str, int]]:
+    """Write the analysed days of the homes which are not in exported yet.
+
+    Returns the (home id, day fingerprint) of the current days, the exported set of the next
+    round, so a day is written once however often it is analysed.
+    """
+    exported = exported or set()
+    analyses = analyzer.analyse_all({home_id: home.price_info for home_id, home in homes.items()})
+    current = set()
+    for home_id, days in analyses.items():
+        for day in days:
+            if day is None:
+                continue
+            key = (home_id, day.fingerprint)
+            current.add(key)
+            if key not in exported:
+                writer.write(series_columns(day.series, home_id))
+    return current
+
+
+def run_daemon(
+    api: TibberApi,
+    writer,
+    time_zone: tzinfo,
+    clock: Callable[[], datetime] | None = None,
+    sleep: Callable[[float], None] = time.sleep,
+    rounds: int | None = None,
+) -> None:
+    """Fetch whenever the FetchScheduler asks for it and write each new day once.
+
+    Runs until interrupted or for the given number of rounds. Outside the publication window
+    of tomorrow's prices the daemon sleeps until it opens.
+    """
+    if clock is None:
+        clock = lambda: datetime.now(time_zone)  # noqa: E731
+    scheduler = FetchScheduler(time_zone, slot_length=api.resolution.slot_length)
+    analyzer = PriceAnalyzer(api)
+    homes = api.align_homes(api.load_cached_homes(clock()), clock())
+    exported: set[tuple[str, int]] = set()
+    done = 0
+    while rounds is None or done < rounds:
+        now = clock()
+        homes = api.align_homes(list(homes.values()), now)
+        if scheduler.needs_fetch(least_complete(homes), now):
+            try:
+                fetched = api.get_homes_price_info()
+            except requests.RequestException as err:
+                _LOGGER.error("Failed to get price data, %s", err)
+                fetched = []
+            fetched_homes = api.align_homes(fetched, now)
+            scheduler.record_fetch(least_complete(fetched_homes), now)
+            if fetched_homes:
+                homes = fetched_homes
+        exported = export_homes(analyzer, homes, writer, exported)
+        done += 1
+        if rounds is not None and done >= rounds:
+            return
+        now = clock()
+        wakeup = scheduler.next_fetch(least_complete(homes), now)
+        _LOGGER.debug("Next fetch at %s", wakeup)
+        sleep(max(MIN_SLEEP, (wakeup - now).total_seconds()))
+
+
+def _local_midnight(d: date, time_zone: tzinfo) -> datetime:
+    return datetime.combine(d, dt_time(), time_zone)
+
+
+def _prices(args: argparse.Namespace, api: TibberApi, writer) -> None:
+    if args.daemon:
+        run_daemon(api, writer, args.time_zone)
+        return
+    if args.fixture is not None:
+        with open(args.fixture, encoding="utf-8") as f:
+            homes = TibberApi.homes_from_response(json.load(f))
+    elif args.token:
+        homes = api.get_homes_price_info()
+    else:
+        homes = api.load_cached_homes()
+    export_homes(PriceAnalyzer(api), {x.id: x for x in homes if x.price_info}, writer)
+
+
+def _history(args: argparse.Namespace, api: TibberApi, writer) -> None:
+    history = PriceHistory(args.db)
+    try:
+        home_ids = [args.home] if args.home else history.home_ids()
+        start = _local_midnight(args.start, args.time_zone)
+        end = _local_midnight(args.end + timedelta(days=1), args.time_zone)
+        for home_id in home_ids:
+            chunks = history.chunks(home_id, start, end, args.chunk_slots)
+            for day in analyse_days(api, chunks):
+                writer.write(series_columns(day, home_id))
+    finally:
+        history.close()
+
+
+def build_parser() -> argparse.ArgumentParser:  # noqa: D103
+    parser = argparse.ArgumentParser(
+        prog="python -m custom_components.yan_tibber_client.api",
+        description="Export the Tibber prices with their extrema and loading levels.",
+    )
+    parser.add_argument("--perc-loss", type=float, default=20, help="perc_loss_load_unload")
+    parser.add_argument(
+        "--resolution", choices=[x.value for x in Resolution], default=Resolution.HOURLY.value
+    )
+    parser.add_argument("--time-zone", type=ZoneInfo, default=ZoneInfo(DEFAULT_TIME_ZONE))
+    parser.add_argument("--output", "-o", help="file to append to, stdout if left out or -")
+    parser.add_argument(
+        "--format", "-f", choices=FORMATS, help="by default from the output extension, else jsonl"
+    )
+    parser.add_argument("--verbose", "-v", action="store_true")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    prices = commands.add_parser("prices", help="today's and tomorrow's prices of all homes")
+    source = prices.add_mutually_exclusive_group()
+    source.add_argument("--token", default=os.environ.get("TIBBER_TOKEN"), help="or TIBBER_TOKEN")
+    source.add_argument("--fixture", help="a recorded GraphQL response instead of fetching")
+    prices.add_argument(
+        "--cache", help="price cache of the integration, read without a token, else written"
+    )
+    prices.add_argument("--url", default=TIBBER_API_URL, help=argparse.SUPPRESS)
+    prices.add_argument("--history", help="SQLite price history every fetch is appended to")
+    prices.add_argument(
+        "--daemon", action="store_true", help="keep running and write each new day once"
+    )
+
+    history = commands.add_parser("history", help="the stored prices of a date range")
+    history.add_argument("--db", required=True, help="SQLite price history")
+    history.add_argument("--home", help="home id, all homes if left out")
+    history.add_argument("--start", type=date.fromisoformat, required=True)
+    history.add_argument(
+        "--end", type=date.fromisoformat, default=date.today(), help="last day, today by default"
+    )
+    history.add_argument("--chunk-slots", type=int, default=CHUNK_SLOTS, help="rows per query")
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Run the command line, returns the exit code."""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING)
+    if args.command == "prices" and not (args.token or args.fixture or args.cache):
+        parser.error("prices needs --token (or TIBBER_TOKEN), --fixture or --cache")
+    if args.command == "prices" and args.daemon and not args.token:
+        parser.error("--daemon fetches, it needs --token (or TIBBER_TOKEN)")
+
+    history = args.history if args.command == "prices" else None
+    api = TibberApi(
+        getattr(args, "token", None) or "",
+        args.perc_loss,
+        args.time_zone,
+        url=getattr(args, "url", TIBBER_API_URL),
+        cache_path=getattr(args, "cache", None),
+        resolution=Resolution(args.resolution),
+        history=PriceHistory(history) if history is not None else None,
+    )
+    try:
+        writer = open_writer(args.format or format_of(args.output), args.output)
+    except (ExportError, OSError) as err:
+        print(err, file=sys.stderr)
+        return 1
+    try:
+        if args.command == "prices":
+            _prices(args, api, writer)
+        else:
+            _history(args, api, writer)
+    except KeyboardInterrupt:
+        pass
+    except BrokenPipeError:
+        # the reader went away, e.g. head, the rest goes nowhere
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    finally:
+        writer.close()
+        api.close()
+        if api.history is not None:
+            api.history.close()
+    return 0
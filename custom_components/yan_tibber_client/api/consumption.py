@@ -0,0 +1,375 @@
+"""Paginated consumption history of a home and its cost compared to the average price."""
+from __future__ import annotations
+
+import base64
+from collections.abc import AsyncIterator, Iterator
+from datetime import datetime, timedelta
+from enum import Enum
+
+from .api import PriceSeries, TibberApi, parse_starts_at
+from .lazy import lazy_import
+
+np = lazy_import("numpy")
+
+CONSUMPTION_QUERY = '{ viewer { home(id: "%s") { consumption(resolution: %s, first: %d, after: "%s") { pageInfo { endCursor hasNextPage } nodes { from to cost unitPrice consumption } } } } }'
+PAGE_SIZE = 744
+"""Nodes per request, a month of hours."""
+
+
+class ConsumptionError(Exception):
+    """The consumption could not be fetched, the pages stop early."""
+
+
+class ConsumptionResolution(Enum):
+    """Resolution of the consumption nodes."""
+
+    HOURLY = "HOURLY"
+    DAILY = "DAILY"
+    WEEKLY = "WEEKLY"
+    MONTHLY = "MONTHLY"
+    ANNUAL = "ANNUAL"
+
+
+def cursor_at(dt: datetime) -> str:
+    """Cursor of the consumption pages starting at dt, base64 of its ISO string."""
+    return base64.b64encode(dt.isoformat().encode()).decode()
+
+
+class ConsumptionPage:
+    """Consumption nodes stored as parallel arrays.
+
+    starts and ends hold the interval of each node in UTC (datetime64[s]), offsets the UTC
+    offset of the start in seconds. consumption (kWh), cost and unit_prices are NaN where
+    Tibber reported null, e.g. for hours not metered yet.
+    """
+
+    __slots__ = (
+        "_starts",
+        "_ends",
+        "_offsets",
+        "_consumption",
+        "_cost",
+        "_unit_prices",
+        "_end_cursor",
+        "_has_next_page",
+    )
+
+    def __init__(  # noqa: D107
+        self,
+        starts: np.ndarray,
+        ends: np.ndarray,
+        offsets: np.ndarray,
+        consumption: np.ndarray,
+        cost: np.ndarray,
+        unit_prices: np.ndarray,
+        end_cursor: str | None = None,
+        has_next_page: bool = False,
+    ) -> None:
+        self._starts = starts
+        self._ends = ends
+        self._offsets = offsets
+        self._consumption = consumption
+        self._cost = cost
+        self._unit_prices = unit_prices
+        self._end_cursor = end_cursor
+        self._has_next_page = has_next_page
+
+    @property
+    def starts(self) -> np.ndarray:  # noqa: D102
+        return self._starts
+
+    @property
+    def ends(self) -> np.ndarray:  # noqa: D102
+        return self._ends
+
+    @property
+    def offsets(self) -> np.ndarray:  # noqa: D102
+        return self._offsets
+
+    @property
+    def consumption(self) -> np.ndarray:  # noqa: D102
+        return self._consumption
+
+    @property
+    def cost(self) -> np.ndarray:  # noqa: D102
+        return self._cost
+
+    @property
+    def unit_prices(self) -> np.ndarray:  # noqa: D102
+        return self._unit_prices
+
+    @property
+    def end_cursor(self) -> str | None:
+        """Cursor of the next page."""
+        return self._end_cursor
+
+    @property
+    def has_next_page(self) -> bool:  # noqa: D102
+        return self._has_next_page
+
+    @staticmethod
+    def from_connection(connection: dict) -> "ConsumptionPage":
+        """Build the page from the consumption connection of the GraphQL response."""
+        nodes = connection.get("nodes") or []
+        n = len(nodes)
+        starts, offsets = parse_starts_at([x["from"] for x in nodes])
+        ends, _ = parse_starts_at([x["to"] for x in nodes])
+        page_info = connection.get("pageInfo") or {}
+        return ConsumptionPage(
+            starts,
+            ends,
+            offsets,
+            np.fromiter((x["consumption"] for x in nodes), dtype=np.float64, count=n),
+            np.fromiter((x["cost"] for x in nodes), dtype=np.float64, count=n),
+            np.fromiter((x["unitPrice"] for x in nodes), dtype=np.float64, count=n),
+            page_info.get("endCursor"),
+            bool(page_info.get("hasNextPage")),
+        )
+
+    def take(self, indices) -> "ConsumptionPage":
+        """Return the nodes selected by a slice, an index array or a boolean mask."""
+        return ConsumptionPage(
+            self._starts[indices],
+            self._ends[indices],
+            self._offsets[indices],
+            self._consumption[indices],
+            self._cost[indices],
+            self._unit_prices[indices],
+            self._end_cursor,
+            self._has_next_page,
+        )
+
+    def __len__(self) -> int:  # noqa: D105
+        return len(self._starts)
+
+
+def _utc(dt: datetime) -> np.datetime64:
+    return np.datetime64(int(dt.timestamp()), "s")
+
+
+class ConsumptionFetcher:
+    """Walk the consumption of a home page by page from a start to an optional end.
+
+    Only one page is held at a time, whatever the length of the range. The pages are
+    trimmed to the range, a failed request raises ConsumptionError.
+    """
+
+    def __init__(  # noqa: D107
+        self,
+        api: TibberApi,
+        home_id: str,
+        resolution: ConsumptionResolution = ConsumptionResolution.HOURLY,
+        page_size: int = PAGE_SIZE,
+    ) -> None:
+        self._api = api
+        self._home_id = home_id
+        self._resolution = resolution
+        self._page_size = page_size
+
+    def _query(self, cursor: str) -> str:
+        return CONSUMPTION_QUERY % (
+            self._home_id,
+            self._resolution.value,
+            self._page_size,
+            cursor,
+        )
+
+    def _page(self, data: dict | None) -> ConsumptionPage:
+        home = ((data or {}).get("viewer") or {}).get("home")
+        if home is None or home.get("consumption") is None:
+            raise ConsumptionError(f"No consumption for home {self._home_id}")
+        return ConsumptionPage.from_connection(home["consumption"])
+
+    @staticmethod
+    def _trim(
+        page: ConsumptionPage, start: np.datetime64, end: np.datetime64 | None
+    ) -> tuple[ConsumptionPage, bool]:
+        """Nodes of the page in the range and whether the next page is wanted."""
+        mask = page.starts >= start
+        if end is not None:
+            mask &= page.starts < end
+        more = page.has_next_page and len(page) > 0 and page.end_cursor is not None
+        if more and end is not None:
+            more = bool(page.ends[-1] < end)
+        return page.take(mask), more
+
+    def pages(self, start: datetime, end: datetime | None = None) -> Iterator[ConsumptionPage]:
+        """Pages of the nodes from start until end, blocking."""
+        start_utc = _utc(start)
+        end_utc = _utc(end) if end is not None else None
+        cursor = cursor_at(start)
+        while True:
+            page, more = self._trim(
+                self._page(self._api.post_query(self._query(cursor))), start_utc, end_utc
+            )
+            if len(page):
+                yield page
+            if not more:
+                return
+            cursor = page.end_cursor
+
+    async def async_pages(
+        self, start: datetime, end: datetime | None = None
+    ) -> AsyncIterator[ConsumptionPage]:
+        """Pages of the nodes from start until end, on the pooled connection."""
+        start_utc = _utc(start)
+        end_utc = _utc(end) if end is not None else None
+        cursor = cursor_at(start)
+        while True:
+            data = await self._api.async_post_query(self._query(cursor))
+            page, more = self._trim(self._page(data), start_utc, end_utc)
+            if len(page):
+                yield page
+            if not more:
+                return
+            cursor = page.end_cursor
+
+
+class CostSummary:
+    """Consumption and cost of a period, energy in kWh and prices per kWh.
+
+    cost and average_price only cover the slots with a known price, reported_cost is the sum
+    of the cost reported by Tibber.
+    """
+
+    __slots__ = ("_energy", "_priced_energy", "_cost", "_reported_cost", "_price_sum", "_slots")
+
+    def __init__(  # noqa: D107
+        self,
+        energy: float,
+        priced_energy: float,
+        cost: float,
+        reported_cost: float,
+        price_sum: float,
+        slots: int,
+    ) -> None:
+        self._energy = energy
+        self._priced_energy = priced_energy
+        self._cost = cost
+        self._reported_cost = reported_cost
+        self._price_sum = price_sum
+        self._slots = slots
+
+    @property
+    def energy(self) -> float:  # noqa: D102
+        return self._energy
+
+    @property
+    def priced_energy(self) -> float:
+        """Energy consumed in the slots with a known price."""
+        return self._priced_energy
+
+    @property
+    def cost(self) -> float:
+        """Energy times the price of its slot."""
+        return self._cost
+
+    @property
+    def reported_cost(self) -> float:  # noqa: D102
+        return self._reported_cost
+
+    @property
+    def slots(self) -> int:
+        """Number of metered slots with a known price."""
+        return self._slots
+
+    @property
+    def average_price(self) -> float | None:
+        """Average price of the slots, not weighted by the consumption."""
+        return self._price_sum / self._slots if self._slots else None
+
+    @property
+    def average_price_cost(self) -> float:
+        """Cost of the same energy at the average price."""
+        return self._priced_energy * self.average_price if self._slots else 0.0
+
+    @property
+    def savings(self) -> float:
+        """Saved by shifting the load to the cheap slots, negative if it went to the expensive ones."""
+        return self.average_price_cost - self._cost
+
+    def __str__(self) -> str:  # noqa: D105
+        return f"CostSummary({self.energy:.3f} kWh, {self.cost:.2f}, saved {self.savings:.2f})"
+
+
+_ENERGY, _PRICED_ENERGY, _COST, _REPORTED_COST, _PRICE_SUM, _SLOTS = range(6)
+
+
+class CostAccumulator:
+    """Add up the cost of consumption pages per month of local time.
+
+    The price of a node is the average of the stored price slots it spans, or the unitPrice
+    reported by Tibber if they do not cover it. Only the sums per month are kept, so any
+    number of pages can be added.
+    """
+
+    def __init__(  # noqa: D107
+        self, prices: PriceSeries | None = None, slot_length: timedelta = timedelta(hours=1)
+    ) -> None:
+        if prices is None:
+            prices = PriceSeries.empty()
+        self._price_starts = prices.starts
+        self._price_sums = np.concatenate(([0.0], np.cumsum(prices.prices)))
+        self._slot_length = np.timedelta64(slot_length)
+        self._months: dict[str, np.ndarray] = {}
+
+    def prices_of(self, page: ConsumptionPage) -> np.ndarray:
+        """Price per node, NaN where neither the stored prices nor Tibber know it."""
+        lo = np.searchsorted(self._price_starts, page.starts, side="left")
+        hi = np.searchsorted(self._price_starts, page.ends, side="left")
+        count = hi - lo
+        covered = (count > 0) & (count == (page.ends - page.starts) // self._slot_length)
+        stored = np.divide(
+            self._price_sums[hi] - self._price_sums[lo],
+            count,
+            out=np.full(len(page), np.nan),
+            where=covered,
+        )
+        return np.where(covered, stored, page.unit_prices)
+
+    def add(self, page: ConsumptionPage) -> None:  # noqa: D102
+        if len(page) == 0:
+            return
+        prices = self.prices_of(page)
+        consumption = page.consumption
+        metered = ~np.isnan(consumption)
+        priced = metered & ~np.isnan(prices)
+        local = page.starts + page.offsets.astype("timedelta64[s]")
+        months, inverse = np.unique(local.astype("datetime64[M]"), return_inverse=True)
+        columns = np.zeros((6, len(months)))
+        for row, values, mask in (
+            (_ENERGY, consumption, metered),
+            (_PRICED_ENERGY, consumption, priced),
+            (_COST, consumption * prices, priced),
+            (_REPORTED_COST, page.cost, ~np.isnan(page.cost)),
+            (_PRICE_SUM, prices, priced),
+            (_SLOTS, np.ones(len(page)), priced),
+        ):
+            columns[row] = np.bincount(
+                inverse, weights=np.where(mask, values, 0.0), minlength=len(months)
+            )
+        for month, sums in zip(months.astype(str).tolist(), columns.T):
+            if month in self._months:
+                self._months[month] += sums
+            else:
+                self._months[month] = sums.copy()
+
+    @staticmethod
+    def _summary(sums: np.ndarray) -> CostSummary:
+        return CostSummary(
+            float(sums[_ENERGY]),
+            float(sums[_PRICED_ENERGY]),
+            float(sums[_COST]),
+            float(sums[_REPORTED_COST]),
+            float(sums[_PRICE_SUM]),
+            int(sums[_SLOTS]),
+        )
+
+    def by_month(self) -> dict[str, CostSummary]:
+        """Summary per month like '2024-01', in order."""
+        return {month: self._summary(self._months[month]) for month in sorted(self._months)}
+
+    def total(self) -> CostSummary:  # noqa: D102
+        if not self._months:
+            return self._summary(np.zeros(6))
+        return self._summary(np.sum(list(self._months.values()), axis=0))
@@ -0,0 +1,96 @@
+"""Decode the price info of a GraphQL response straight into PriceSeries columns."""
+from __future__ import annotations
+
+import re
+
+from .api import HomePriceInfo, PriceSeries, parse_starts_at
+from .lazy import lazy_import
+
+np = lazy_import("numpy")
+
+# the keys of a home and of its priceInfo, the slots between two of them belong to the first
+_MARKER = re.compile(rb'"(id|current|today|tomorrow)"\s*:\s*(?:"([^"]*)")?')
+# the fields of a slot in the order of PRICE_INFO_QUERY
+_SLOT = re.compile(
+    rb'"total"\s*:\s*(-?[0-9][0-9.eE+-]*)\s*,\s*'
+    rb'"startsAt"\s*:\s*"([^"]*)"\s*,\s*'
+    rb'"level"\s*:\s*"([A-Z_]*)"'
+)
+_LEVEL_CODES = {x.value.encode(): code for x, code in PriceSeries.LEVEL_CODES.items()}
+
+
+def _parse_starts(values: tuple[bytes, ...]) -> tuple[np.ndarray, np.ndarray]:
+    """parse_starts_at of byte strings, the offsets of '...+HH:MM' are read off the bytes."""
+    column = np.array(values)
+    chars = column.view(np.uint8).reshape(len(values), -1)
+    # shorter values are padded with zero bytes and fail the check
+    signs = chars[:, -6]
+    if not ((chars[:, -3] == ord(":")) & ((signs == ord("+")) | (signs == ord("-")))).all():
+        return parse_starts_at([x.decode("ascii") for x in values])
+    digits = chars[:, [-5, -4, -2, -1]].astype(np.int32) - ord("0")
+    offsets = (digits[:, 0] * 10 + digits[:, 1]) * 3600 + (digits[:, 2] * 10 + digits[:, 3]) * 60
+    offsets = np.where(signs == ord("-"), -offsets, offsets).astype(np.int32)
+    local = column.astype("S19").astype("datetime64[s]")
+    return local - offsets.astype("timedelta64[s]"), offsets
+
+
+def _series(slots: list[tuple[bytes, bytes, bytes]]) -> PriceSeries:
+    if not slots:
+        return PriceSeries.empty()
+    totals, starts_at, levels = zip(*slots)
+    starts, offsets = _parse_starts(starts_at)
+    return PriceSeries(
+        starts,
+        offsets,
+        np.array(totals, dtype=np.float64),
+        np.array([_LEVEL_CODES[x] for x in levels], dtype=np.int8),
+    )
+
+
+def decode_price_series(body: bytes | str) -> dict[str, dict[str, PriceSeries]] | None:
+    """PriceSeries of current, today and tomorrow per home id, without building a dict per slot.
+
+    The slots are read from the response bytes with regular expressions in the field order of
+    PRICE_INFO_QUERY. Anything else, e.g. a null price, another field order or an error
+    response, returns None and the caller decodes the JSON instead. Homes without a
+    subscription are left out.
+    """
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    if b'"errors"' in body:
+        return None
+    markers = list(_MARKER.finditer(body))
+    res: dict[str, dict[str, PriceSeries]] = {}
+    home: dict[str, PriceSeries] | None = None
+    found = 0
+    for i, marker in enumerate(markers):
+        key = marker.group(1).decode()
+        if key == "id":
+            home = None
+            if marker.group(2) is not None:
+                home = res.setdefault(marker.group(2).decode(), {})
+            continue
+        if home is None:
+            return None
+        end = markers[i + 1].start() if i + 1 < len(markers) else len(body)
+        slots = _SLOT.findall(body, marker.end(), end)
+        found += len(slots)
+        home[key] = _series(slots)
+    if found != body.count(b'"startsAt"'):
+        # a slot the expression did not match
+        return None
+    return {home_id: days for home_id, days in res.items() if days}
+
+
+def price_series_of(homes: list[HomePriceInfo]) -> dict[str, dict[str, PriceSeries]]:
+    """The result of decode_price_series from already decoded homes."""
+    res = {}
+    for home in homes:
+        days = {}
+        for key, value in (home.price_info or {}).items():
+            if isinstance(value, dict):
+                value = [value]
+            days[key] = PriceSeries.from_price_info(value) if value else PriceSeries.empty()
+        if days:
+            res[home.id] = days
+    return res
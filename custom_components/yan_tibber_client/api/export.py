@@ -0,0 +1,154 @@
+"""Stream analysed price slots to JSON Lines, CSV or Parquet."""
+from __future__ import annotations
+
+from collections.abc import Iterable, Iterator
+import csv
+import json
+import sys
+from typing import IO
+
+from .api import PriceSeries, TibberApi
+from .formatting import compact_codes
+from .lazy import lazy_import
+
+np = lazy_import("numpy")
+
+FORMATS = ("jsonl", "csv", "parquet")
+COLUMNS = ("home_id", "starts_at", "price", "level", "loading_level", "extrema_type")
+
+_CODES = compact_codes()
+
+
+class ExportError(Exception):
+    """The output can not be written in the requested format."""
+
+
+def local_iso(series: PriceSeries) -> list[str]:
+    """ISO strings of the slot starts with the UTC offset Tibber reported."""
+    offsets = series.offsets
+    local = (series.starts + offsets.astype("timedelta64[s]")).astype(str)
+    # the distinct offsets of a range are few, format each once
+    suffixes = {
+        x: f"{'-' if x < 0 else '+'}{abs(x) // 3600:02d}:{abs(x) % 3600 // 60:02d}"
+        for x in np.unique(offsets).tolist()
+    }
+    return [t + suffixes[x] for t, x in zip(local.tolist(), offsets.tolist())]
+
+
+def series_columns(series: PriceSeries, home_id: str) -> dict[str, list]:
+    """The slots of the series as columns named by COLUMNS, marks not set are None."""
+    return {
+        "home_id": [home_id] * len(series),
+        "starts_at": local_iso(series),
+        "price": series.prices.tolist(),
+        "level": [_CODES["levels"][x] for x in series.levels.tolist()],
+        "loading_level": [_CODES["loading_levels"][x] for x in series.loading_levels.tolist()],
+        "extrema_type": [_CODES["extrema_types"][x] for x in series.extrema_types.tolist()],
+    }
+
+
+def analyse_days(api: TibberApi, chunks: Iterable[PriceSeries]) -> Iterator[PriceSeries]:
+    """Extrema and loading levels of each local day of the chunks, as the day sensors show them."""
+    for chunk in chunks:
+        for day in chunk.days():
+            yield api.with_loading_levels(api.with_extrema(day))
+
+
+class _TextWriter:
+    def __init__(self, stream: IO[str], owns_stream: bool = False) -> None:
+        self._stream = stream
+        self._owns_stream = owns_stream
+
+    def close(self) -> None:  # noqa: D102
+        self._stream.flush()
+        if self._owns_stream:
+            self._stream.close()
+
+
+class JsonLinesWriter(_TextWriter):
+    """One JSON object per slot and line."""
+
+    def write(self, columns: dict[str, list]) -> None:  # noqa: D102
+        write = self._stream.write
+        for row in zip(*columns.values()):
+            write(json.dumps(dict(zip(columns, row))))
+            write("\n")
+        self._stream.flush()
+
+
+class CsvWriter(_TextWriter):
+    """Comma separated slots with a header line, unset marks are empty."""
+
+    def __init__(  # noqa: D107
+        self, stream: IO[str], owns_stream: bool = False, header: bool = True
+    ) -> None:
+        super().__init__(stream, owns_stream)
+        self._writer = csv.writer(stream, lineterminator="\n")
+        self._header = header
+
+    def write(self, columns: dict[str, list]) -> None:  # noqa: D102
+        if self._header:
+            self._writer.writerow(columns)
+            self._header = False
+        self._writer.writerows(zip(*columns.values()))
+        self._stream.flush()
+
+
+class ParquetWriter:
+    """One row group per write, the file is complete after close. Needs pyarrow."""
+
+    def __init__(self, path: str) -> None:  # noqa: D107
+        try:
+            import pyarrow  # noqa: PLC0415
+            import pyarrow.parquet  # noqa: PLC0415
+        except ImportError as err:
+            raise ExportError("Parquet export needs pyarrow, pip install pyarrow") from err
+        self._pa = pyarrow
+        self._schema = pyarrow.schema(
+            [
+                ("home_id", pyarrow.string()),
+                ("starts_at", pyarrow.string()),
+                ("price", pyarrow.float64()),
+                ("level", pyarrow.string()),
+                ("loading_level", pyarrow.string()),
+                ("extrema_type", pyarrow.string()),
+            ]
+        )
+        self._writer = pyarrow.parquet.ParquetWriter(path, self._schema)
+
+    def write(self, columns: dict[str, list]) -> None:  # noqa: D102
+        self._writer.write_table(self._pa.table(columns, schema=self._schema))
+
+    def close(self) -> None:  # noqa: D102
+        self._writer.close()
+
+
+def open_writer(fmt: str, path: str | None = None):
+    """Writer of the format to the file at path, stdout if path is None or '-'.
+
+    The file is appended to for jsonl and csv (the CSV header only goes into a new file),
+    Parquet is always written as a new file.
+    """
+    if fmt not in FORMATS:
+        raise ExportError(f"Unknown format {fmt}, expected one of {', '.join(FORMATS)}")
+    to_stdout = path is None or path == "-"
+    if fmt == "parquet":
+        if to_stdout:
+            raise ExportError("Parquet is written to a file, not to stdout")
+        return ParquetWriter(path)
+    if to_stdout:
+        stream = sys.stdout
+    else:
+        stream = open(path, "a", encoding="utf-8", newline="")  # noqa: SIM115
+    if fmt == "jsonl":
+        return JsonLinesWriter(stream, not to_stdout)
+    return CsvWriter(stream, not to_stdout, header=to_stdout or stream.tell() == 0)
+
+
+def format_of(path: str | None, default: str = "jsonl") -> str:
+    """Format named by the extension of path, the default for stdout or other extensions."""
+    if path:
+        for fmt in FORMATS:
+            if path.endswith(f".{fmt}"):
+                return fmt
+    return default
@@ -0,0 +1,285 @@
+"""Poll the price info of many Tibber accounts concurrently and analyse them in one batch."""
+import asyncio
+from collections.abc import Awaitable, Callable
+from concurrent.futures import Executor
+from datetime import datetime, timedelta, timezone, tzinfo
+import logging
+import random
+import time
+
+import aiohttp
+
+from .analysis import HomeSnapshot, PriceAnalyzer, fingerprint
+from .api import TIBBER_API_URL, HomePriceInfo, Resolution, TibberApi
+from .optimizer import BatteryParameters
+
+_LOGGER = logging.getLogger(__name__)
+
+CONCURRENCY = 50
+"""Requests in flight at once over all accounts."""
+MIN_REQUEST_INTERVAL = timedelta(seconds=30)
+"""Per token, Tibber throttles clients polling faster."""
+JITTER = timedelta(seconds=10)
+"""Each request of a round is delayed by a random part of it."""
+
+
+class RateLimiter:
+    """Token bucket of one Tibber token.
+
+    Up to burst requests pass at once, after that one per min_interval. A min_interval of
+    zero does not limit at all.
+    """
+
+    __slots__ = ("_min_interval", "_burst", "_tokens", "_updated", "_clock")
+
+    def __init__(  # noqa: D107
+        self,
+        min_interval: timedelta = MIN_REQUEST_INTERVAL,
+        burst: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._min_interval = min_interval.total_seconds()
+        self._burst = burst
+        self._tokens = float(burst)
+        self._clock = clock
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        if self._min_interval > 0:
+            self._tokens = min(
+                self._burst, self._tokens + (now - self._updated) / self._min_interval
+            )
+        self._updated = now
+
+    def delay(self) -> float:
+        """Seconds until the next request may be sent."""
+        if self._min_interval <= 0:
+            return 0.0
+        self._refill()
+        return max(0.0, (1 - self._tokens) * self._min_interval)
+
+    async def acquire(self) -> None:
+        """Wait until a request may be sent and take its token."""
+        if self._min_interval <= 0:
+            return
+        while (delay := self.delay()) > 0:
+            await asyncio.sleep(delay)
+        self._tokens -= 1
+
+
+class AccountResult:
+    """Outcome of the last round of one account, the snapshots of its homes or the error."""
+
+    __slots__ = ("_account", "_snapshots", "_error", "_fetched_at", "_duration")
+
+    def __init__(  # noqa: D107
+        self,
+        account: str,
+        snapshots: dict[str, HomeSnapshot],
+        error: str | None,
+        fetched_at: datetime,
+        duration: float,
+    ) -> None:
+        self._account = account
+        self._snapshots = snapshots
+        self._error = error
+        self._fetched_at = fetched_at
+        self._duration = duration
+
+    @property
+    def account(self) -> str:  # noqa: D102
+        return self._account
+
+    @property
+    def snapshots(self) -> dict[str, HomeSnapshot]:
+        """Snapshot per home id, empty on failure."""
+        return self._snapshots
+
+    @property
+    def error(self) -> str | None:  # noqa: D102
+        return self._error
+
+    @property
+    def ok(self) -> bool:  # noqa: D102
+        return self._error is None
+
+    @property
+    def fetched_at(self) -> datetime:
+        """When the response arrived, in UTC."""
+        return self._fetched_at
+
+    @property
+    def duration(self) -> float:
+        """Seconds from sending the request to the response, waiting for the rate limit excluded."""
+        return self._duration
+
+    def __str__(self) -> str:  # noqa: D105
+        state = self._error if self._error is not None else f"{len(self._snapshots)} homes"
+        return f"AccountResult({self._account}, {state})"
+
+
+class _Account:
+    __slots__ = ("name", "api", "limiter")
+
+    def __init__(self, name: str, api: TibberApi, limiter: RateLimiter) -> None:
+        self.name = name
+        self.api = api
+        self.limiter = limiter
+
+
+class Fleet:
+    """Fetch and analyse the price info of many accounts, each with its own token.
+
+    All requests share one pooled session and at most concurrency of them are in flight.
+    Each token is rate limited on its own and the requests of a round are spread by a random
+    jitter, so the accounts do not hit the API at the same instant. The homes of all accounts
+    are analysed in one batch: homes in the same price area share their day analyses, and
+    only the last result per account is kept.
+    """
+
+    def __init__(  # noqa: D107
+        self,
+        tokens: dict[str, str],
+        perc_loss_load_unload: int,
+        time_zone: tzinfo,
+        url: str = TIBBER_API_URL,
+        resolution: Resolution = Resolution.HOURLY,
+        concurrency: int = CONCURRENCY,
+        min_request_interval: timedelta = MIN_REQUEST_INTERVAL,
+        jitter: timedelta = JITTER,
+        battery: BatteryParameters | None = None,
+        executor: Executor | None = None,
+        seed: int | None = None,
+        clock: Callable[[], datetime] | None = None,
+    ) -> None:
+        self._tokens = tokens
+        self._perc_loss_load_unload = perc_loss_load_unload
+        self._time_zone = time_zone
+        self._url = url
+        self._resolution = resolution
+        self._concurrency = concurrency
+        self._min_request_interval = min_request_interval
+        self._jitter = jitter.total_seconds()
+        self._battery = battery
+        self._executor = executor
+        self._random = random.Random(seed)
+        self._clock = clock if clock is not None else lambda: datetime.now(time_zone)
+        self._session: aiohttp.ClientSession | None = None
+        self._accounts: list[_Account] = []
+        # the analysis needs the settings shared by all accounts, not a token
+        self._analyzer = PriceAnalyzer(
+            TibberApi("", perc_loss_load_unload, time_zone, url=url, resolution=resolution)
+        )
+        self._results: dict[str, AccountResult] = {}
+
+    @property
+    def results(self) -> dict[str, AccountResult]:
+        """Result of the last round per account name."""
+        return self._results
+
+    def _start(self) -> None:
+        if self._session is not None and not self._session.closed:
+            return
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=self._concurrency, limit_per_host=self._concurrency, keepalive_timeout=60
+            )
+        )
+        self._accounts = [
+            _Account(
+                name,
+                TibberApi(
+                    token,
+                    self._perc_loss_load_unload,
+                    self._time_zone,
+                    session=self._session,
+                    url=self._url,
+                    resolution=self._resolution,
+                ),
+                RateLimiter(self._min_request_interval),
+            )
+            for name, token in self._tokens.items()
+        ]
+
+    async def _fetch(
+        self, account: _Account, semaphore: asyncio.Semaphore
+    ) -> tuple[list[HomePriceInfo], str | None, datetime, float]:
+        if self._jitter > 0:
+            await asyncio.sleep(self._random.uniform(0, self._jitter))
+        await account.limiter.acquire()
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                fetched = await account.api.async_get_homes_price_info()
+                # homes without prices for today can not be analysed
+                homes = list(account.api.align_homes(fetched, self._clock()).values())
+                error = None if homes else "no price info"
+            except (
+                aiohttp.ClientError,
+                asyncio.TimeoutError,
+                ValueError,
+                KeyError,
+                TypeError,
+            ) as err:
+                # TypeError: e.g. an error response with "data": null
+                _LOGGER.warning("Failed to fetch account %s: %r", account.name, err)
+                homes, error = [], repr(err)
+            return homes, error, datetime.now(timezone.utc), time.perf_counter() - start
+
+    @staticmethod
+    def _share_days(homes: list[HomePriceInfo]) -> None:
+        """Let the homes with the same prices hold the same day arrays instead of one decoded copy each."""
+        days: dict[int, list] = {}
+        for home in homes:
+            price_info = home.price_info
+            for day in ("today", "tomorrow"):
+                arr = price_info.get(day)
+                if arr:
+                    price_info[day] = days.setdefault(fingerprint(arr), arr)
+
+    async def async_poll(self) -> dict[str, AccountResult]:
+        """Fetch all accounts once and analyse their homes, the results per account name."""
+        self._start()
+        semaphore = asyncio.Semaphore(self._concurrency)
+        fetched = await asyncio.gather(*(self._fetch(x, semaphore) for x in self._accounts))
+        homes = {
+            (account.name, home.id): home
+            for account, (account_homes, *_) in zip(self._accounts, fetched)
+            for home in account_homes
+        }
+        self._share_days(list(homes.values()))
+        # the analysis is CPU bound, the results are immutable and safe to hand over
+        snapshots = await asyncio.get_running_loop().run_in_executor(
+            self._executor, self._analyzer.snapshots, homes, self._battery
+        )
+        per_account: dict[str, dict[str, HomeSnapshot]] = {x.name: {} for x in self._accounts}
+        for (name, home_id), snapshot in snapshots.items():
+            per_account[name][home_id] = snapshot
+        self._results = {
+            account.name: AccountResult(account.name, per_account[account.name], error, at, duration)
+            for account, (_, error, at, duration) in zip(self._accounts, fetched)
+        }
+        return self._results
+
+    async def async_run(
+        self,
+        interval: timedelta,
+        callback: Callable[[dict[str, AccountResult]], Awaitable[None] | None] | None = None,
+    ) -> None:
+        """Poll every interval until cancelled, handing each round to the callback."""
+        while True:
+            started = time.monotonic()
+            results = await self.async_poll()
+            if callback is not None:
+                res = callback(results)
+                if asyncio.iscoroutine(res):
+                    await res
+            await asyncio.sleep(max(0.0, interval.total_seconds() - (time.monotonic() - started)))
+
+    async def async_close(self) -> None:
+        """Close the shared session."""
+        if self._session is not None:
+            await self._session.close()
+        self._session = None
+        self._accounts = []
@@ -0,0 +1,189 @@
+"""JSON formatting of the analysis results for sensor attributes and exports."""
+from __future__ import annotations
+
+from datetime import datetime, timedelta, tzinfo
+import functools
+
+from .api import LoadingLevel, PriceSeries, PriceSlot, PriceWindow, Statistics
+from .lazy import lazy_import
+from .optimizer import BatteryPlan
+
+np = lazy_import("numpy")
+
+_LEVEL_NAMES = {code: x.value for x, code in PriceSeries.LEVEL_CODES.items()}
+_LOADING_LEVEL_NAMES = {
+    code: x.value if x is not None else None
+    for x, code in PriceSeries.LOADING_CODES.items()
+}
+_EXTREMA_TYPE_NAMES = {
+    code: x.value if x is not None else None
+    for x, code in PriceSeries.EXTREMA_CODES.items()
+}
+
+
+def format_price(price: float) -> float:
+    """Return rounded price in Cent / kWh."""
+    return round(price * 100, 1)
+
+
+LOCAL_TIME_CACHE_SIZE = 1024
+"""Formatted timestamps kept, a multiple of the slots of today and tomorrow."""
+
+
+@functools.lru_cache(maxsize=LOCAL_TIME_CACHE_SIZE)
+def format_epoch(epoch: int, time_zone: tzinfo) -> str:
+    """Return the ISO string of the whole seconds since the epoch in the local time zone.
+
+    The slot starts repeat in the lists, statistics and windows of every update, so each
+    distinct timestamp is converted once.
+    """
+    return datetime.fromtimestamp(epoch, time_zone).isoformat()
+
+
+def format_epochs(starts: np.ndarray, time_zone: tzinfo) -> list[str]:
+    """format_epoch of each datetime64[s] value."""
+    return [format_epoch(x, time_zone) for x in starts.astype(np.int64).tolist()]
+
+
+def format_date(dt: datetime, time_zone: tzinfo) -> str:
+    """Return the ISO string of dt in the given local time zone."""
+    if dt.microsecond == 0 and dt.tzinfo is not None:
+        return format_epoch(int(dt.timestamp()), time_zone)
+    if dt.tzinfo is not time_zone:
+        dt = dt.astimezone(time_zone)
+    return dt.isoformat()
+
+
+def hourly_data_to_json(x: PriceSlot, time_zone: tzinfo) -> {}:  # noqa: D103
+    res = {
+        "level": x.level.value,
+        "price": format_price(x.price),
+    }
+    if x.starts_at is not None:
+        res["starts_at"] = format_date(x.starts_at, time_zone)
+    if x.loading_level is not None:
+        res["loading_level"] = x.loading_level.value
+    if x.extrema_type is not None:
+        res["extrema_type"] = x.extrema_type.value
+
+    return res
+
+
+def convert_to_json_list(arr: list[PriceSlot] | PriceSeries, time_zone: tzinfo) -> []:  # noqa: D103
+    if isinstance(arr, PriceSeries):
+        return _series_to_json_list(arr, time_zone)
+    return [hourly_data_to_json(x, time_zone) for x in arr]
+
+
+def _series_to_json_list(series: PriceSeries, time_zone: tzinfo) -> []:
+    """Same output as hourly_data_to_json per slot, read straight from the arrays."""
+    res = []
+    for starts_at, level, price, loading_level, extrema_type in zip(
+        format_epochs(series.starts, time_zone),
+        series.levels.tolist(),
+        series.prices.tolist(),
+        series.loading_levels.tolist(),
+        series.extrema_types.tolist(),
+    ):
+        x = {
+            "level": _LEVEL_NAMES[level],
+            "price": format_price(price),
+            "starts_at": starts_at,
+        }
+        if loading_level:
+            x["loading_level"] = _LOADING_LEVEL_NAMES[loading_level]
+        if extrema_type:
+            x["extrema_type"] = _EXTREMA_TYPE_NAMES[extrema_type]
+        res.append(x)
+    return res
+
+
+def statistics_to_json(x: Statistics, time_zone: tzinfo) -> {}:  # noqa: D103
+    res = {
+        "start_time": format_date(x.start_time, time_zone),
+        "end_time": format_date(x.end_time, time_zone),
+        "avg_level": x.avg_level.value,
+        "min": hourly_data_to_json(x.min, time_zone),
+        "avg_price": format_price(x.avg_price),
+        "max": hourly_data_to_json(x.max, time_zone),
+    }
+    return res
+
+
+def compact_codes() -> {}:
+    """Legend of the codes used by the compact attribute format."""
+    return {
+        "levels": dict(_LEVEL_NAMES),
+        "loading_levels": dict(_LOADING_LEVEL_NAMES),
+        "extrema_types": dict(_EXTREMA_TYPE_NAMES),
+    }
+
+
+def series_to_compact_json(series: PriceSeries, time_zone: tzinfo) -> {}:
+    """Columnar form of the series: prices and codes per slot, starts as minutes after base."""
+    if len(series) == 0:
+        return None
+    return {
+        "base": format_date(series.starts_at(0), time_zone),
+        "offsets": ((series.starts - series.starts[0]) // np.timedelta64(1, "m")).tolist(),
+        "prices": [format_price(x) for x in series.prices.tolist()],
+        "levels": series.levels.tolist(),
+        "loading_levels": series.loading_levels.tolist(),
+        "extrema_types": series.extrema_types.tolist(),
+    }
+
+
+def loading_level_indices_to_json(series: PriceSeries, level: LoadingLevel) -> []:
+    """Indices into the compact series instead of copies of the slots."""
+    return series.loading_level_indices(level).tolist()
+
+
+def battery_plan_to_json(series: PriceSeries, plan: BatteryPlan, time_zone: tzinfo) -> []:
+    """One entry per slot of the plan with its action and the energies in kWh."""
+    return [
+        {
+            "starts_at": starts_at,
+            "action": plan.action(i).value,
+            "grid_energy": round(grid_energy, 3),
+            "soc": round(soc, 3),
+        }
+        for i, (starts_at, grid_energy, soc) in enumerate(
+            zip(
+                format_epochs(series.starts, time_zone),
+                plan.grid_energy.tolist(),
+                plan.soc.tolist(),
+            )
+        )
+    ]
+
+
+def battery_plan_to_compact_json(series: PriceSeries, plan: BatteryPlan, time_zone: tzinfo) -> {}:
+    """Columnar form of the plan, actions as 1 = charge, 0 = hold, -1 = discharge."""
+    if len(series) == 0:
+        return None
+    return {
+        "base": format_date(series.starts_at(0), time_zone),
+        "offsets": ((series.starts - series.starts[0]) // np.timedelta64(1, "m")).tolist(),
+        "actions": plan.actions.tolist(),
+        "grid_energy": np.round(plan.grid_energy, 3).tolist(),
+        "soc": np.round(plan.soc, 3).tolist(),
+    }
+
+
+def price_window_to_json(x: PriceWindow | None, time_zone: tzinfo) -> {}:  # noqa: D103
+    if x is None:
+        return None
+    return {
+        "start": format_date(x.start, time_zone),
+        "end": format_date(x.end, time_zone),
+        "avg_price": format_price(x.avg_price),
+        "slots": x.slots,
+    }
+
+
+def blocks_to_json(blocks: dict[timedelta, PriceWindow | None], time_zone: tzinfo) -> {}:
+    """Blocks keyed by their duration like '2h' or '1.5h'."""
+    return {
+        f"{duration / timedelta(hours=1):g}h": price_window_to_json(x, time_zone)
+        for duration, x in blocks.items()
+    }
@@ -0,0 +1,199 @@
+"""Local history of all fetched prices."""
+from __future__ import annotations
+
+from collections.abc import Iterator
+from datetime import datetime, timedelta
+import sqlite3
+import threading
+
+from .api import PriceSeries, PriceSlot
+from .lazy import lazy_import
+
+np = lazy_import("numpy")
+
+CHUNK_SLOTS = 31 * 24
+"""Rows read per query by chunks, a month of hours."""
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS prices (
+    home_id TEXT NOT NULL,
+    starts_at INTEGER NOT NULL,
+    utc_offset INTEGER NOT NULL,
+    total REAL NOT NULL,
+    level INTEGER NOT NULL,
+    PRIMARY KEY (home_id, starts_at)
+) WITHOUT ROWID
+"""
+
+
+def _epoch(dt: datetime) -> np.datetime64:
+    return np.datetime64(int(dt.timestamp()), "s")
+
+
+class PriceHistory:
+    """Append-only SQLite store of every fetched slot per home.
+
+    The table is clustered by home and slot start. Each home is mirrored into a PriceSeries
+    sorted by start when it is first queried and after each write, so range queries are two
+    binary searches and a copy instead of a database round trip.
+    """
+
+    def __init__(self, path: str) -> None:  # noqa: D107
+        self._path = path
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self._series: dict[str, PriceSeries] = {}
+
+    @property
+    def path(self) -> str:  # noqa: D102
+        return self._path
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            # written from the executor, read from the event loop
+            self._conn = sqlite3.connect(self._path, check_same_thread=False)
+            self._conn.execute(_SCHEMA)
+        return self._conn
+
+    def _read_home(self, home_id: str) -> PriceSeries:
+        return self._to_series(
+            self._connect().execute(
+                "SELECT starts_at, utc_offset, total, level FROM prices"
+                " WHERE home_id = ? ORDER BY starts_at",
+                (home_id,),
+            ).fetchall()
+        )
+
+    @staticmethod
+    def _to_series(rows: list[tuple]) -> PriceSeries:
+        if not rows:
+            return PriceSeries.empty()
+        starts, offsets, prices, levels = zip(*rows)
+        return PriceSeries(
+            np.array(starts, dtype="datetime64[s]"),
+            np.array(offsets, dtype=np.int32),
+            np.array(prices, dtype=np.float64),
+            np.array(levels, dtype=np.int8),
+        )
+
+    def load(self) -> None:
+        """Read all homes into memory, meant to run in the executor before the first query."""
+        with self._lock:
+            for home_id in self._home_ids():
+                self._series[home_id] = self._read_home(home_id)
+
+    def _home_ids(self) -> list[str]:
+        return [x for x, in self._connect().execute("SELECT DISTINCT home_id FROM prices")]
+
+    def home_ids(self) -> list[str]:  # noqa: D102
+        with self._lock:
+            return self._home_ids()
+
+    def store(self, homes: list) -> int:
+        """Append the today/tomorrow slots of the homes, returns the number of new slots.
+
+        Slots which are already stored are left alone, published prices do not change.
+        """
+        added = 0
+        with self._lock:
+            conn = self._connect()
+            changed = []
+            with conn:
+                for home in homes:
+                    if not home.price_info:
+                        continue
+                    home_id = home.id or ""
+                    series = PriceSeries.from_price_info(
+                        (home.price_info.get("today") or [])
+                        + (home.price_info.get("tomorrow") or [])
+                    )
+                    cursor = conn.executemany(
+                        "INSERT OR IGNORE INTO prices VALUES (?, ?, ?, ?, ?)",
+                        zip(
+                            [home_id] * len(series),
+                            series.starts.astype(np.int64).tolist(),
+                            series.offsets.tolist(),
+                            series.prices.tolist(),
+                            series.levels.tolist(),
+                        ),
+                    )
+                    if cursor.rowcount > 0:
+                        added += cursor.rowcount
+                        changed.append(home_id)
+            for home_id in changed:
+                self._series[home_id] = self._read_home(home_id)
+        return added
+
+    def _home_series(self, home_id: str) -> PriceSeries:
+        series = self._series.get(home_id)
+        if series is None:
+            with self._lock:
+                series = self._series.get(home_id)
+                if series is None:
+                    series = self._read_home(home_id)
+                    self._series[home_id] = series
+        return series
+
+    def series(self, home_id: str, start: datetime, end: datetime) -> PriceSeries:
+        """Slots of the home starting in [start, end), sorted by start."""
+        series = self._home_series(home_id or "")
+        lo, hi = np.searchsorted(series.starts, [_epoch(start), _epoch(end)])
+        # a copy, the analysis marks slots in place
+        return series.take(np.arange(lo, hi))
+
+    def chunks(
+        self, home_id: str, start: datetime, end: datetime, slots: int = CHUNK_SLOTS
+    ) -> Iterator[PriceSeries]:
+        """Slots of the home starting in [start, end) in chunks of whole local days.
+
+        The rows are read straight from the database, slots at a time, without the in-memory
+        copy of the home. The last day of a chunk is held back until it is complete, so a
+        chunk holds at most slots plus the slots of a day, whatever the length of the range.
+        """
+        after = int(_epoch(start).astype(np.int64))
+        until = int(_epoch(end).astype(np.int64))
+        carry = PriceSeries.empty()
+        while True:
+            with self._lock:
+                rows = self._connect().execute(
+                    "SELECT starts_at, utc_offset, total, level FROM prices"
+                    " WHERE home_id = ? AND starts_at >= ? AND starts_at < ?"
+                    " ORDER BY starts_at LIMIT ?",
+                    (home_id or "", after, until, slots),
+                ).fetchall()
+            series = PriceSeries.concat(carry, self._to_series(rows))
+            if len(rows) < slots:
+                if len(series):
+                    yield series
+                return
+            after = rows[-1][0] + 1
+            days = series.local_days()
+            cut = int(np.searchsorted(days, days[-1]))
+            if cut == 0:
+                # a single day longer than a chunk, keep reading
+                carry = series
+                continue
+            yield series.take(slice(0, cut))
+            carry = series.take(slice(cut, None))
+
+    def slots(self, home_id: str, start: datetime, end: datetime) -> list[PriceSlot]:  # noqa: D102
+        return self.series(home_id, start, end).to_list()
+
+    def prices(self, home_id: str, start: datetime, end: datetime) -> tuple[np.ndarray, np.ndarray]:
+        """Slot starts (UTC datetime64[s]) and prices in [start, end)."""
+        series = self.series(home_id, start, end)
+        return series.starts, series.prices
+
+    def trailing_average(self, home_id: str, end: datetime, days: int) -> float | None:
+        """Average price of the slots of the days before end, None without history."""
+        prices = self.series(home_id, end - timedelta(days=days), end).prices
+        if len(prices) == 0:
+            return None
+        return float(prices.mean())
+
+    def close(self) -> None:  # noqa: D102
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._series = {}
@@ -0,0 +1,27 @@
+"""Deferred import of the heavy modules, so loading the integration stays cheap."""
+import importlib.util
+import sys
+from types import ModuleType
+
+
+def lazy_import(name: str) -> ModuleType:
+    """Return the module, executing it only when one of its attributes is first used."""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def preload(*names: str) -> None:
+    """Finish the deferred imports now, e.g. in an executor thread instead of the event loop."""
+    for name in names:
+        # any attribute access executes a lazy module
+        getattr(lazy_import(name), "__file__", None)
@@ -0,0 +1,367 @@
+"""Streaming liveMeasurement subscription of a Tibber Pulse and its windowed aggregation."""
+import asyncio
+from collections.abc import AsyncIterator, Callable
+from datetime import datetime, timedelta
+import json
+import logging
+
+import aiohttp
+
+from .api import REQUEST_TIMEOUT, PriceSeries
+
+_LOGGER = logging.getLogger(__name__)
+
+LIVE_PROTOCOL = "graphql-transport-ws"
+LIVE_MEASUREMENT_QUERY = 'subscription { liveMeasurement(homeId: "%s") { timestamp power accumulatedConsumption } }'
+MIN_BACKOFF = timedelta(seconds=5)
+MAX_BACKOFF = timedelta(minutes=5)
+QUEUE_SIZE = 64
+"""Readings held for a slow consumer, the oldest are dropped beyond that."""
+MAX_GAP = timedelta(minutes=1)
+"""Power is not integrated over longer gaps between two readings, e.g. while reconnecting."""
+
+
+class LiveMeasurementError(Exception):
+    """The server refused the connection or the subscription."""
+
+
+def _decode_message(text: str) -> dict:
+    try:
+        data = json.loads(text)
+    except ValueError as err:
+        raise LiveMeasurementError(f"Malformed message: {text[:200]}") from err
+    if not isinstance(data, dict):
+        raise LiveMeasurementError(f"Malformed message: {text[:200]}")
+    return data
+
+
+class LiveReading:
+    """One liveMeasurement message, power in W and consumption in kWh."""
+
+    __slots__ = ("_timestamp", "_power", "_accumulated_consumption")
+
+    def __init__(  # noqa: D107
+        self, timestamp: datetime, power: float, accumulated_consumption: float | None = None
+    ) -> None:
+        self._timestamp = timestamp
+        self._power = power
+        self._accumulated_consumption = accumulated_consumption
+
+    @property
+    def timestamp(self) -> datetime:  # noqa: D102
+        return self._timestamp
+
+    @property
+    def power(self) -> float:  # noqa: D102
+        return self._power
+
+    @property
+    def accumulated_consumption(self) -> float | None:
+        """Consumption since midnight as reported by the Pulse."""
+        return self._accumulated_consumption
+
+    @staticmethod
+    def from_payload(x: dict) -> "LiveReading":  # noqa: D102
+        return LiveReading(
+            datetime.fromisoformat(x["timestamp"]),
+            float(x["power"] or 0),
+            x.get("accumulatedConsumption"),
+        )
+
+    def __str__(self) -> str:  # noqa: D105
+        return f"LiveReading({self.timestamp}, {self.power} W)"
+
+
+class LiveMeasurementClient:
+    """Subscribe to the liveMeasurement of a home and queue the readings.
+
+    The connection is re-established with an exponential backoff from min_backoff up to
+    max_backoff. The queue is bounded: when the consumer falls behind the oldest readings
+    are dropped, the aggregation only needs the recent ones.
+    """
+
+    def __init__(  # noqa: D107
+        self,
+        token: str,
+        home_id: str,
+        url: str,
+        session: aiohttp.ClientSession | None = None,
+        queue_size: int = QUEUE_SIZE,
+        min_backoff: timedelta = MIN_BACKOFF,
+        max_backoff: timedelta = MAX_BACKOFF,
+    ) -> None:
+        self._token = token
+        self._home_id = home_id
+        self._url = url
+        self._session = session
+        self._owns_session = False
+        self._queue: asyncio.Queue[LiveReading] = asyncio.Queue(maxsize=queue_size)
+        self._min_backoff = min_backoff
+        self._max_backoff = max_backoff
+        self._task: asyncio.Task | None = None
+        self._attempts = 0
+        self._connections = 0
+        self._dropped = 0
+
+    @property
+    def connections(self) -> int:
+        """Number of successful connections, reconnects included."""
+        return self._connections
+
+    @property
+    def dropped(self) -> int:
+        """Readings dropped because the queue was full."""
+        return self._dropped
+
+    def _backoff(self) -> timedelta:
+        return min(self._min_backoff * 2 ** (self._attempts - 1), self._max_backoff)
+
+    def _put(self, reading: LiveReading) -> None:
+        if self._queue.full():
+            self._queue.get_nowait()
+            self._dropped += 1
+        self._queue.put_nowait(reading)
+
+    def start(self) -> None:
+        """Connect in the background, readings are queued until stop."""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:  # noqa: D102
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+            self._owns_session = False
+
+    async def get(self) -> LiveReading:
+        """Wait for the next reading."""
+        return await self._queue.get()
+
+    async def readings(self) -> AsyncIterator[LiveReading]:
+        """Iterate over the readings until the client is stopped."""
+        while True:
+            yield await self._queue.get()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self._subscribe()
+                _LOGGER.debug("liveMeasurement subscription completed")
+            except (aiohttp.ClientError, asyncio.TimeoutError, LiveMeasurementError) as err:
+                _LOGGER.warning("liveMeasurement connection failed: %s", err)
+            self._attempts += 1
+            delay = self._backoff()
+            _LOGGER.debug("Reconnecting in %s", delay)
+            await asyncio.sleep(delay.total_seconds())
+
+    @staticmethod
+    def _reading(payload: dict | None) -> LiveReading:
+        if isinstance(payload, dict) and payload.get("errors"):
+            raise LiveMeasurementError(payload["errors"])
+        try:
+            return LiveReading.from_payload(payload["data"]["liveMeasurement"])
+        except (TypeError, KeyError, ValueError) as err:
+            # e.g. "data": null, reconnecting is all that helps
+            raise LiveMeasurementError(f"Malformed liveMeasurement: {payload!r}") from err
+
+    async def _subscribe(self) -> None:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession()
+            self._owns_session = True
+        async with self._session.ws_connect(
+            self._url,
+            protocols=(LIVE_PROTOCOL,),
+            headers={"User-Agent": "REST"},
+            heartbeat=30,
+        ) as ws:
+            await ws.send_json({"type": "connection_init", "payload": {"token": self._token}})
+            msg = await ws.receive(timeout=REQUEST_TIMEOUT)
+            if (
+                msg.type != aiohttp.WSMsgType.TEXT
+                or _decode_message(msg.data).get("type") != "connection_ack"
+            ):
+                raise LiveMeasurementError(f"Connection not acknowledged: {msg.data}")
+            self._connections += 1
+            await ws.send_json(
+                {
+                    "id": "1",
+                    "type": "subscribe",
+                    "payload": {"query": LIVE_MEASUREMENT_QUERY % self._home_id},
+                }
+            )
+            async for msg in ws:
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    break
+                data = _decode_message(msg.data)
+                msg_type = data.get("type")
+                if msg_type == "next":
+                    self._put(self._reading(data.get("payload")))
+                    # healthy again, the next failure starts with the shortest backoff
+                    self._attempts = 0
+                elif msg_type == "ping":
+                    await ws.send_json({"type": "pong"})
+                elif msg_type == "error":
+                    raise LiveMeasurementError(data.get("payload"))
+                elif msg_type == "complete":
+                    return
+
+
+class WindowAggregate:
+    """Power and cost of one window, energy in kWh, power in W."""
+
+    __slots__ = ("_start", "_end", "_energy", "_cost", "_avg_power", "_max_power", "_readings")
+
+    def __init__(  # noqa: D107
+        self,
+        start: datetime,
+        end: datetime,
+        energy: float,
+        cost: float | None,
+        avg_power: float,
+        max_power: float,
+        readings: int,
+    ) -> None:
+        self._start = start
+        self._end = end
+        self._energy = energy
+        self._cost = cost
+        self._avg_power = avg_power
+        self._max_power = max_power
+        self._readings = readings
+
+    @property
+    def start(self) -> datetime:  # noqa: D102
+        return self._start
+
+    @property
+    def end(self) -> datetime:  # noqa: D102
+        return self._end
+
+    @property
+    def energy(self) -> float:  # noqa: D102
+        return self._energy
+
+    @property
+    def cost(self) -> float | None:
+        """Energy times the slot price, None without a price for the window."""
+        return self._cost
+
+    @property
+    def avg_power(self) -> float:  # noqa: D102
+        return self._avg_power
+
+    @property
+    def max_power(self) -> float:  # noqa: D102
+        return self._max_power
+
+    @property
+    def readings(self) -> int:  # noqa: D102
+        return self._readings
+
+    def __str__(self) -> str:  # noqa: D105
+        return f"WindowAggregate({self.start}, {self.avg_power:.0f} W, {self.energy:.4f} kWh, {self.cost})"
+
+
+class PowerAggregator:
+    """Combine readings into windows of equal length aligned to the epoch.
+
+    Each reading's power is held until the next one. The window length has to divide the
+    slot length, so a window never spans two prices.
+    """
+
+    def __init__(  # noqa: D107
+        self,
+        window: timedelta,
+        price_at: Callable[[datetime], float | None] | None = None,
+        max_gap: timedelta = MAX_GAP,
+    ) -> None:
+        self._window = window
+        self._price_at = price_at
+        self._max_gap = max_gap
+        self._last: LiveReading | None = None
+        self._start: datetime | None = None
+        self._reset()
+
+    def _reset(self) -> None:
+        self._energy = 0.0
+        self._covered = 0.0
+        self._max_power = 0.0
+        self._readings = 0
+
+    def _window_start(self, dt: datetime) -> datetime:
+        epoch = dt.timestamp()
+        length = self._window.total_seconds()
+        return datetime.fromtimestamp(epoch - epoch % length, dt.tzinfo)
+
+    def _integrate(self, start: datetime, end: datetime, power: float) -> None:
+        seconds = (end - start).total_seconds()
+        self._energy += power * seconds / 3_600_000
+        self._covered += seconds
+
+    def _finish(self) -> WindowAggregate:
+        cost = None
+        if self._price_at is not None:
+            price = self._price_at(self._start)
+            if price is not None:
+                cost = self._energy * price
+        avg_power = (
+            self._energy * 3_600_000 / self._covered if self._covered > 0 else self._max_power
+        )
+        return WindowAggregate(
+            self._start,
+            self._start + self._window,
+            self._energy,
+            cost,
+            avg_power,
+            self._max_power,
+            self._readings,
+        )
+
+    def current(self) -> WindowAggregate | None:
+        """Aggregate of the window still open, None before the first reading."""
+        if self._start is None:
+            return None
+        return self._finish()
+
+    def add(self, reading: LiveReading) -> list[WindowAggregate]:
+        """Add the reading, returns the windows it completed (usually none or one)."""
+        res: list[WindowAggregate] = []
+        last = self._last
+        if last is not None and reading.timestamp <= last.timestamp:
+            # duplicate or out of order after a reconnect
+            return res
+        if last is None:
+            self._start = self._window_start(reading.timestamp)
+        else:
+            hold = reading.timestamp - last.timestamp <= self._max_gap
+            t = last.timestamp
+            while reading.timestamp >= self._start + self._window:
+                end = self._start + self._window
+                if hold:
+                    self._integrate(t, end, last.power)
+                res.append(self._finish())
+                self._reset()
+                t = end
+                # no empty windows for a gap
+                self._start = end if hold else self._window_start(reading.timestamp)
+            if hold:
+                self._integrate(t, reading.timestamp, last.power)
+        self._readings += 1
+        self._max_power = max(self._max_power, reading.power)
+        self._last = reading
+        return res
+
+
+def price_at(series: PriceSeries, dt: datetime, slot_length: timedelta) -> float | None:
+    """Price of the slot of the series containing dt, None outside of the series."""
+    if len(series) == 0:
+        return None
+    i = series.index.containing(dt, slot_length)
+    return float(series.prices[i]) if i is not None else None
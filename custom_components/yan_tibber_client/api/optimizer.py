@@ -0,0 +1,192 @@
+"""Battery charge/discharge schedule by dynamic programming over the state of charge."""
+from __future__ import annotations
+
+from enum import Enum
+
+from .api import PriceSeries, PriceSlot, TibberApi
+from .lazy import lazy_import
+
+np = lazy_import("numpy")
+
+
+class BatteryAction(Enum):
+    """What the battery does in a slot."""
+
+    CHARGE = "CHARGE"
+    """Load the battery from the net."""
+    HOLD = "HOLD"
+    """Leave the battery alone."""
+    DISCHARGE = "DISCHARGE"
+    """Cover the consumption from the battery."""
+
+
+class BatteryParameters:
+    """Battery model of the optimizer, energies in kWh and powers in kW."""
+
+    def __init__(  # noqa: D107
+        self,
+        capacity: float,
+        max_charge_power: float,
+        max_discharge_power: float,
+        efficiency: float = 0.9,
+        initial_soc: float = 0.0,
+        min_soc: float = 0.0,
+        soc_steps: int = 100,
+    ) -> None:
+        if not 0 < efficiency <= 1:
+            raise ValueError(f"Efficiency must be in (0, 1], got {efficiency}")
+        self._capacity = capacity
+        self._max_charge_power = max_charge_power
+        self._max_discharge_power = max_discharge_power
+        self._efficiency = efficiency
+        self._initial_soc = initial_soc
+        self._min_soc = min_soc
+        self._soc_steps = soc_steps
+
+    @property
+    def capacity(self) -> float:  # noqa: D102
+        return self._capacity
+
+    @property
+    def max_charge_power(self) -> float:  # noqa: D102
+        return self._max_charge_power
+
+    @property
+    def max_discharge_power(self) -> float:  # noqa: D102
+        return self._max_discharge_power
+
+    @property
+    def efficiency(self) -> float:
+        """Round trip efficiency, split evenly between charging and discharging."""
+        return self._efficiency
+
+    @property
+    def initial_soc(self) -> float:
+        """Energy in the battery at the start of the first slot."""
+        return self._initial_soc
+
+    @property
+    def min_soc(self) -> float:
+        """Energy which must stay in the battery."""
+        return self._min_soc
+
+    @property
+    def soc_steps(self) -> int:
+        """Number of steps the capacity is divided into."""
+        return self._soc_steps
+
+    def with_initial_soc(self, initial_soc: float) -> "BatteryParameters":  # noqa: D102
+        return BatteryParameters(
+            self._capacity,
+            self._max_charge_power,
+            self._max_discharge_power,
+            self._efficiency,
+            initial_soc,
+            self._min_soc,
+            self._soc_steps,
+        )
+
+
+class BatteryPlan:
+    """Optimal schedule: per slot action, energy drawn from the net and state of charge at its end."""
+
+    def __init__(  # noqa: D107
+        self, actions: np.ndarray, grid_energy: np.ndarray, soc: np.ndarray, savings: float
+    ) -> None:
+        self._actions = actions
+        self._grid_energy = grid_energy
+        self._soc = soc
+        self._savings = savings
+
+    @property
+    def actions(self) -> np.ndarray:
+        """1 = charge, 0 = hold, -1 = discharge."""
+        return self._actions
+
+    @property
+    def grid_energy(self) -> np.ndarray:
+        """kWh drawn from the net for charging (> 0) or replaced by the battery (< 0)."""
+        return self._grid_energy
+
+    @property
+    def soc(self) -> np.ndarray:
+        """kWh in the battery at the end of each slot."""
+        return self._soc
+
+    @property
+    def savings(self) -> float:
+        """Expected savings compared to not using the battery, in the currency of the prices."""
+        return self._savings
+
+    def action(self, i: int) -> BatteryAction:  # noqa: D102
+        return _ACTIONS_BY_CODE[int(self._actions[i])]
+
+    def __len__(self) -> int:  # noqa: D105
+        return len(self._actions)
+
+
+_ACTIONS_BY_CODE = {
+    1: BatteryAction.CHARGE,
+    0: BatteryAction.HOLD,
+    -1: BatteryAction.DISCHARGE,
+}
+
+
+def optimize_battery(
+    arr: list[PriceSlot] | PriceSeries | np.ndarray,
+    params: BatteryParameters,
+    slot_hours: float = 1.0,
+) -> BatteryPlan:
+    """Find the charge/hold/discharge schedule with the highest savings.
+
+    The state of charge is discretized into params.soc_steps steps. Charging a step costs
+    price / sqrt(efficiency) per kWh stored, discharging a step saves price * sqrt(efficiency)
+    per kWh stored. The battery has to end with at least its initial charge, so the savings
+    are not bought by emptying it. O(slots * soc steps * power steps).
+    """
+    prices = arr if isinstance(arr, np.ndarray) else TibberApi.get_prices_numpy(arr)
+    n = len(prices)
+    steps = params.soc_steps
+    step = params.capacity / steps
+    eff = np.sqrt(params.efficiency)
+    max_up = int(params.max_charge_power * slot_hours / step + 1e-9)
+    max_down = int(params.max_discharge_power * slot_hours / step + 1e-9)
+    min_level = int(np.ceil(params.min_soc / step - 1e-9))
+    start = min(max(int(round(params.initial_soc / step)), min_level), steps)
+
+    levels = np.arange(steps + 1)
+    # holding first, so it wins ties
+    deltas = np.array(sorted(range(-max_down, max_up + 1), key=abs))
+    # grid energy per step of change of the state of charge
+    grid_per_delta = np.where(deltas > 0, deltas * step / eff, deltas * step * eff)
+
+    # (deltas x levels) target level of every change, out of range ones point at an inf
+    targets = levels[np.newaxis, :] + deltas[:, np.newaxis]
+    targets[(targets < min_level) | (targets > steps)] = steps + 1
+    columns = np.arange(steps + 1)
+
+    # value[s] = lowest cost from slot t on, starting with s steps in the battery
+    value = np.where(levels >= start, 0.0, np.inf)
+    value[levels < min_level] = np.inf
+    policy = np.zeros((n, steps + 1), dtype=np.int16)
+    for t in range(n - 1, -1, -1):
+        cost = (prices[t] * grid_per_delta)[:, np.newaxis] + np.append(value, np.inf)[targets]
+        # the first of equal costs, holding or the smallest change
+        best = np.argmin(cost, axis=0)
+        value = cost[best, columns]
+        policy[t] = deltas[best]
+
+    soc_steps = np.empty(n, dtype=np.int64)
+    level = start
+    for t in range(n):
+        level += policy[t, level]
+        soc_steps[t] = level
+    delta_steps = np.diff(soc_steps, prepend=start)
+
+    grid_energy = np.where(delta_steps > 0, delta_steps * step / eff, delta_steps * step * eff)
+    return BatteryPlan(
+        np.sign(delta_steps).astype(np.int8),
+        grid_energy,
+        soc_steps * step,
+        float(-np.dot(prices, grid_energy)) if n > 0 else 0.0,
+    )
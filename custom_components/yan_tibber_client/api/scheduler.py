@@ -0,0 +1,105 @@
+"""Decide when the price info has to be fetched from the network."""
+from datetime import date, datetime, time, timedelta, tzinfo
+
+PUBLICATION_START = time(12, 45)
+"""Tibber publishes tomorrow's prices around 13:00."""
+MIN_BACKOFF = timedelta(minutes=5)
+MAX_BACKOFF = timedelta(hours=1)
+
+
+def least_complete(homes: dict) -> []:
+    """Price info the scheduler has to look at: that of the home still missing data, if any."""
+    if not homes:
+        return []
+    for home in homes.values():
+        if not home.price_info or not home.price_info.get("tomorrow"):
+            return home.price_info
+    return next(iter(homes.values())).price_info
+
+
+class FetchScheduler:
+    """Fetch only while today's or tomorrow's prices are missing.
+
+    Today's prices are fixed once published and tomorrow's appear once a day, so outside the
+    publication window the data already held is enough and only the current slot moves on.
+    Inside the window repeated attempts back off from MIN_BACKOFF up to MAX_BACKOFF.
+    """
+
+    def __init__(  # noqa: D107
+        self,
+        time_zone: tzinfo,
+        slot_length: timedelta = timedelta(hours=1),
+        publication_start: time = PUBLICATION_START,
+        min_backoff: timedelta = MIN_BACKOFF,
+        max_backoff: timedelta = MAX_BACKOFF,
+    ) -> None:
+        self._time_zone = time_zone
+        self._slot_length = slot_length
+        self._publication_start = publication_start
+        self._min_backoff = min_backoff
+        self._max_backoff = max_backoff
+        self._attempts = 0
+        self._last_attempt: datetime | None = None
+
+    @property
+    def attempts(self) -> int:
+        """Number of consecutive fetches which did not bring the missing data."""
+        return self._attempts
+
+    def _local(self, d: date, t: time) -> datetime:
+        naive = datetime.combine(d, t)
+        localize = getattr(self._time_zone, "localize", None)
+        if localize is not None:
+            # pytz time zones
+            return localize(naive)
+        return naive.replace(tzinfo=self._time_zone)
+
+    def _backoff(self) -> timedelta:
+        if self._attempts == 0:
+            return timedelta(0)
+        return min(self._min_backoff * 2 ** (self._attempts - 1), self._max_backoff)
+
+    def next_fetch(self, price_info: [], now: datetime) -> datetime:
+        """Time of the next network fetch for the aligned price_info held at now."""
+        now = now.astimezone(self._time_zone)
+        retry = now if self._last_attempt is None else self._last_attempt + self._backoff()
+
+        if not price_info:
+            return max(now, retry)
+
+        publication = self._local(now.date(), self._publication_start)
+        if price_info.get("tomorrow"):
+            # nothing new before tomorrow's publication window
+            return self._local(now.date() + timedelta(days=1), self._publication_start)
+        if now < publication:
+            return publication
+        return max(now, retry)
+
+    def needs_fetch(self, price_info: [], now: datetime) -> bool:  # noqa: D102
+        return self.next_fetch(price_info, now) <= now
+
+    def record_fetch(self, price_info: [], now: datetime) -> None:
+        """Remember a fetch attempt, price_info being the aligned result ([] on failure)."""
+        now = now.astimezone(self._time_zone)
+        self._last_attempt = now
+        if price_info and (
+            price_info.get("tomorrow")
+            # today is complete and tomorrow is not expected yet
+            or now < self._local(now.date(), self._publication_start)
+        ):
+            self._attempts = 0
+        else:
+            self._attempts += 1
+
+    def next_slot_start(self, now: datetime) -> datetime:
+        """Start of the slot following now."""
+        now = now.astimezone(self._time_zone)
+        offset = now.utcoffset().total_seconds()
+        slot = self._slot_length.total_seconds()
+        local_seconds = now.timestamp() + offset
+        next_start = (local_seconds // slot + 1) * slot - offset
+        return datetime.fromtimestamp(next_start, self._time_zone)
+
+    def next_wakeup(self, price_info: [], now: datetime) -> datetime:
+        """Next slot boundary or next fetch, whichever comes first."""
+        return min(self.next_slot_start(now), self.next_fetch(price_info, now))
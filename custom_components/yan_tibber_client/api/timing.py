@@ -0,0 +1,105 @@
+"""Rolling timings of the stages of the update pipeline."""
+from collections import deque
+from contextlib import contextmanager, nullcontext
+import threading
+import time
+
+WINDOW = 100
+"""Durations kept per stage for the percentiles."""
+
+_NOT_TIMED = nullcontext()
+
+
+def _percentile(ordered: list[float], q: float) -> float:
+    """Nearest rank percentile of a sorted list."""
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class StageTimer:
+    """Measure named stages and keep their last durations.
+
+    Disabled timers hand out one shared no-op context manager, so instrumented code costs
+    a method call per stage.
+    """
+
+    def __init__(self, enabled: bool = True, window: int = WINDOW) -> None:  # noqa: D107
+        self._enabled = enabled
+        self._window = window
+        self._durations: dict[str, deque[float]] = {}
+        self._counts: dict[str, int] = {}
+        self._totals: dict[str, float] = {}
+        # stages may be timed in the threads of a concurrent analysis
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:  # noqa: D102
+        return self._enabled
+
+    def stage(self, name: str):
+        """Context manager timing the enclosed block as stage name."""
+        if not self._enabled:
+            return _NOT_TIMED
+        return self._timed(name)
+
+    @contextmanager
+    def _timed(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, seconds: float) -> None:
+        """Add a duration measured elsewhere."""
+        if not self._enabled:
+            return
+        with self._lock:
+            durations = self._durations.get(name)
+            if durations is None:
+                durations = self._durations[name] = deque(maxlen=self._window)
+                self._counts[name] = 0
+                self._totals[name] = 0.0
+            durations.append(seconds)
+            self._counts[name] += 1
+            self._totals[name] += seconds
+
+    def last(self, name: str) -> float | None:  # noqa: D102
+        durations = self._durations.get(name)
+        return durations[-1] if durations else None
+
+    def stats(self) -> dict[str, dict]:
+        """Per stage: count, last, p50, p95 and max of the rolling window, in seconds."""
+        res = {}
+        with self._lock:
+            for name, durations in self._durations.items():
+                ordered = sorted(durations)
+                res[name] = {
+                    "count": self._counts[name],
+                    "last": durations[-1],
+                    "p50": _percentile(ordered, 0.5),
+                    "p95": _percentile(ordered, 0.95),
+                    "max": ordered[-1],
+                }
+        return res
+
+    def to_prometheus(self, prefix: str = "yan_tibber_client") -> str:
+        """Stats in the Prometheus text exposition format, one summary over all stages."""
+        metric = f"{prefix}_stage_seconds"
+        lines = [
+            f"# HELP {metric} Duration of the update pipeline stages.",
+            f"# TYPE {metric} summary",
+        ]
+        with self._lock:
+            for name, durations in self._durations.items():
+                ordered = sorted(durations)
+                for q in (0.5, 0.95):
+                    lines.append(
+                        f'{metric}{{stage="{name}",quantile="{q}"}} {_percentile(ordered, q)!r}'
+                    )
+                lines.append(f'{metric}_sum{{stage="{name}"}} {self._totals[name]!r}')
+                lines.append(f'{metric}_count{{stage="{name}"}} {self._counts[name]}')
+        return "\n".join(lines) + "\n"
+
+
+NO_TIMER = StageTimer(enabled=False)
+"""Shared disabled timer, the default of the instrumented classes."""
@@ -18,4 +18,18 @@ Clone this depot to adapt your own SMA device:
 """
 
 PRICE_SENSOR_NAME: Final = "Tibber Prices"
+LIVE_SENSOR_NAME: Final = "Tibber Power"
+DIAGNOSTICS_SENSOR_NAME: Final = "Tibber Diagnostics"
 CONF_LOAD_UNLOAD_LOSS_PERC: Final = "perc_loss_load_unload"
+CONF_COMPACT_ATTRIBUTES: Final = "compact_attributes"
+CONF_RESOLUTION: Final = "resolution"
+CONF_BATTERY_CAPACITY: Final = "battery_capacity"
+CONF_BATTERY_CHARGE_POWER: Final = "battery_charge_power"
+CONF_BATTERY_DISCHARGE_POWER: Final = "battery_discharge_power"
+CONF_BATTERY_MIN_SOC: Final = "battery_min_soc"
+CONF_BATTERY_SOC_ENTITY: Final = "battery_soc_entity"
+CONF_LIVE_MEASUREMENT: Final = "live_measurement"
+CONF_TIMING: Final = "timing"
+CONF_BLOCK_HOURS: Final = "block_hours"
+PRICE_CACHE_FILE: Final = f"{DOMAIN}.price_cache"
+PRICE_HISTORY_FILE: Final = f"{DOMAIN}.price_history.db"
@@ -0,0 +1,156 @@
+"""Shared fetch and analysis of the price info of all homes of an account."""
+import asyncio
+from datetime import datetime, timedelta
+import logging
+
+import aiohttp
+
+from homeassistant.const import STATE_UNAVAILABLE, STATE_UNKNOWN
+from homeassistant.core import HomeAssistant
+from homeassistant.exceptions import PlatformNotReady
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
+from homeassistant.util import dt as dt_util
+
+from .api.analysis import HomeSnapshot, PriceAnalyzer
+from .api.api import HomePriceInfo, TibberApi
+from .api.lazy import preload
+from .api.optimizer import BatteryParameters
+from .api.scheduler import FetchScheduler, least_complete
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+MIN_UPDATE_INTERVAL = timedelta(seconds=1)
+
+
+class TibberPriceCoordinator(DataUpdateCoordinator[dict[str, HomeSnapshot]]):
+    """Fetch and analyse the prices of all homes once per cycle for all entities.
+
+    The data is a HomeSnapshot per home id. The update interval follows the FetchScheduler:
+    the network is only asked while prices are missing, otherwise a refresh just moves on to
+    the current slot.
+    """
+
+    def __init__(  # noqa: D107
+        self,
+        hass: HomeAssistant,
+        api: TibberApi,
+        battery: BatteryParameters | None = None,
+        battery_soc_entity: str | None = None,
+    ) -> None:
+        super().__init__(
+            hass,
+            _LOGGER,
+            name=DOMAIN,
+            update_interval=api.resolution.slot_length,
+        )
+        self._api = api
+        self._scheduler = FetchScheduler(
+            dt_util.DEFAULT_TIME_ZONE, slot_length=api.resolution.slot_length
+        )
+        self._analyzer = PriceAnalyzer(api)
+        self._battery = battery
+        self._battery_soc_entity = battery_soc_entity
+        self._homes: dict[str, HomePriceInfo] = {}
+
+    @property
+    def api(self) -> TibberApi:  # noqa: D102
+        return self._api
+
+    @property
+    def analyzer(self) -> PriceAnalyzer:  # noqa: D102
+        return self._analyzer
+
+    @property
+    def battery(self) -> BatteryParameters | None:  # noqa: D102
+        return self._battery
+
+    @property
+    def homes(self) -> list[HomePriceInfo]:
+        """Homes with their price info aligned to the last update."""
+        return list(self._homes.values())
+
+    def snapshot(self, home_id: str) -> HomeSnapshot | None:
+        """Latest snapshot of the home, None while there are no prices for today."""
+        if self.data is None:
+            return None
+        return self.data.get(home_id)
+
+    def _battery_parameters(self) -> BatteryParameters | None:
+        """Battery parameters starting from the current state of charge, if it is known."""
+        battery = self._battery
+        if battery is None or self._battery_soc_entity is None:
+            return battery
+        state = self.hass.states.get(self._battery_soc_entity)
+        if state is None or state.state in (STATE_UNKNOWN, STATE_UNAVAILABLE):
+            return battery
+        try:
+            return battery.with_initial_soc(float(state.state) / 100 * battery.capacity)
+        except ValueError:
+            _LOGGER.warning(
+                "Invalid state of charge %s of %s", state.state, self._battery_soc_entity
+            )
+            return battery
+
+    async def _async_snapshots(
+        self, homes: dict[str, HomePriceInfo]
+    ) -> dict[str, HomeSnapshot]:
+        """Analyse in the executor, the results are immutable and safe to hand over."""
+        snapshots = await self.hass.async_add_executor_job(
+            self._analyzer.snapshots, homes, self._battery_parameters()
+        )
+        self._homes = homes
+        return snapshots
+
+    def _schedule_next(self, now: datetime) -> None:
+        when = self._scheduler.next_wakeup(least_complete(self._homes), now)
+        _LOGGER.debug("Next update at %s", when)
+        self.update_interval = max(when - now, MIN_UPDATE_INTERVAL)
+
+    async def async_setup(self) -> None:
+        """Start from the cached prices, fetch right away if there are none."""
+        # import NumPy off the event loop before the first analysis needs it
+        await self.hass.async_add_executor_job(preload, "numpy")
+        if self._api.history is not None:
+            await self.hass.async_add_executor_job(self._api.history.load)
+        cached = await self.hass.async_add_executor_job(self._api.load_cached_homes)
+        now = dt_util.now()
+        homes = self._api.align_homes(cached, now)
+        if homes:
+            _LOGGER.debug("Starting from cached prices")
+            # the scheduler decides whether the first refresh has to fetch
+            self.update_interval = MIN_UPDATE_INTERVAL
+            self.async_set_updated_data(await self._async_snapshots(homes))
+            return
+        await self.async_refresh()
+        if not self.data:
+            raise PlatformNotReady("No price info available yet")
+
+    async def _async_update_data(self) -> dict[str, HomeSnapshot]:
+        """Fetch only if the scheduler asks for it, otherwise move on to the current slot locally."""
+        with self._api.timer.stage("update"):
+            return await self._async_update_homes()
+
+    async def _async_update_homes(self) -> dict[str, HomeSnapshot]:
+        api = self._api
+        now = dt_util.now()
+        homes = self._api.align_homes(self.homes, now)
+        try:
+            if self._scheduler.needs_fetch(least_complete(homes), now):
+                _LOGGER.debug("Fetching price info")
+                try:
+                    fetched = await api.async_get_homes_price_info()
+                except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+                    _LOGGER.error("Failed to get price data, %s", err)
+                    fetched = []
+                _LOGGER.debug("Finished rest call")
+                fetched_homes = self._api.align_homes(fetched, now)
+                self._scheduler.record_fetch(least_complete(fetched_homes), now)
+                if fetched_homes:
+                    homes = fetched_homes
+            if not homes:
+                self._homes = {}
+                raise UpdateFailed("No price info for today")
+            return await self._async_snapshots(homes)
+        finally:
+            self._schedule_next(dt_util.now())
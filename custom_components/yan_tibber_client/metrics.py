@@ -0,0 +1,24 @@
+"""Prometheus endpoint for the stage timings."""
+from aiohttp import web
+
+from homeassistant.components.http import HomeAssistantView
+
+from .api.timing import StageTimer
+from .const import DOMAIN
+
+
+class TibberMetricsView(HomeAssistantView):
+    """Serve the stage timings in the Prometheus text format, with the usual API auth."""
+
+    url = f"/api/{DOMAIN}/metrics"
+    name = f"api:{DOMAIN}:metrics"
+    requires_auth = True
+
+    def __init__(self, timer: StageTimer) -> None:  # noqa: D107
+        self._timer = timer
+
+    async def get(self, request: web.Request) -> web.Response:  # noqa: D102
+        return web.Response(
+            text=self._timer.to_prometheus(DOMAIN),
+            content_type="text/plain",
+        )
@@ -1,34 +1,102 @@
 """All Sensors."""
+import abc
+import asyncio
 from datetime import datetime, timedelta
 import logging
 
 import voluptuous as vol
 
-from homeassistant.components.sensor import PLATFORM_SCHEMA
-from homeassistant.const import CONF_TOKEN
-from homeassistant.core import HomeAssistant
+from homeassistant.components.sensor import (
+    PLATFORM_SCHEMA,
+    SensorDeviceClass,
+    SensorEntity,
+)
+from homeassistant.const import CONF_TOKEN, EVENT_HOMEASSISTANT_STOP
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
 import homeassistant.helpers.config_validation as cv
-from homeassistant.helpers.entity import Entity
+from homeassistant.helpers.entity import Entity, EntityCategory
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.helpers.storage import STORAGE_DIR
 from homeassistant.helpers.typing import ConfigType, DiscoveryInfoType
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
 from homeassistant.util import dt as dt_util
 
-from .api.api import HourlyData, LoadingLevel, Statistics, TibberApi
-from .const import CONF_LOAD_UNLOAD_LOSS_PERC, PRICE_SENSOR_NAME
+from .api import formatting
+from .api.analysis import DayAnalysis, HomeSnapshot, PriceWindow
+from .api.api import (
+    HomePriceInfo,
+    LoadingLevel,
+    PriceBlocks,
+    PriceSeries,
+    PriceSlot,
+    Resolution,
+    Statistics,
+    TibberApi,
+)
+from .api.history import PriceHistory
+from .api.live import LiveMeasurementClient, PowerAggregator, WindowAggregate, price_at
+from .api.optimizer import BatteryAction, BatteryParameters, BatteryPlan
+from .api.timing import NO_TIMER, StageTimer
+from .const import (
+    CONF_BATTERY_CAPACITY,
+    CONF_BATTERY_CHARGE_POWER,
+    CONF_BATTERY_DISCHARGE_POWER,
+    CONF_BATTERY_MIN_SOC,
+    CONF_BATTERY_SOC_ENTITY,
+    CONF_BLOCK_HOURS,
+    CONF_COMPACT_ATTRIBUTES,
+    CONF_LIVE_MEASUREMENT,
+    CONF_LOAD_UNLOAD_LOSS_PERC,
+    CONF_RESOLUTION,
+    CONF_TIMING,
+    DIAGNOSTICS_SENSOR_NAME,
+    LIVE_SENSOR_NAME,
+    PRICE_CACHE_FILE,
+    PRICE_HISTORY_FILE,
+    PRICE_SENSOR_NAME,
+)
+from .coordinator import TibberPriceCoordinator
+from .metrics import TibberMetricsView
 
 _LOGGER = logging.getLogger(__name__)
 
 PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
     {
         vol.Required(CONF_TOKEN): cv.string,
-        vol.Optional(CONF_LOAD_UNLOAD_LOSS_PERC, default=20): cv.positive_int,
+        # the battery efficiency is 1 - loss / 100 and must stay above zero
+        vol.Optional(CONF_LOAD_UNLOAD_LOSS_PERC, default=20): vol.All(
+            cv.positive_int, vol.Range(max=99)
+        ),
+        vol.Optional(CONF_COMPACT_ATTRIBUTES, default=False): cv.boolean,
+        vol.Optional(CONF_RESOLUTION, default=Resolution.HOURLY.value): vol.In(
+            [x.value for x in Resolution]
+        ),
+        # kWh / kW, without a capacity no battery plan is computed
+        vol.Optional(CONF_BATTERY_CAPACITY): cv.positive_float,
+        vol.Optional(CONF_BATTERY_CHARGE_POWER): cv.positive_float,
+        vol.Optional(CONF_BATTERY_DISCHARGE_POWER): cv.positive_float,
+        vol.Optional(CONF_BATTERY_MIN_SOC, default=0): cv.positive_float,
+        # sensor with the state of charge in %
+        vol.Optional(CONF_BATTERY_SOC_ENTITY): cv.entity_id,
+        # power sensor per home from the Tibber Pulse
+        vol.Optional(CONF_LIVE_MEASUREMENT, default=False): cv.boolean,
+        # stage timings as diagnostics sensor and Prometheus endpoint
+        vol.Optional(CONF_TIMING, default=False): cv.boolean,
+        # durations of the cheapest and most expensive blocks, e.g. for appliances
+        vol.Optional(CONF_BLOCK_HOURS, default=[2, 3, 5]): vol.All(
+            cv.ensure_list, [cv.positive_float]
+        ),
         # vol.Optional(CONF_DAILY_USAGE, default=True): cv.boolean,
         # vol.Optional(CONF_DATE_FORMAT, default="%b %d %Y"): cv.string,
     }
 )
 
-# You can control the polling interval for your integration by defining a SCAN_INTERVAL constant in your platform.
-SCAN_INTERVAL = timedelta(minutes=30)
+_NOT_FORMATTED = object()
+
+
+def _entity_name(name: str, home: HomePriceInfo, several_homes: bool) -> str:
+    return f"{name} {home.address}" if several_homes else name
 
 
 async def async_setup_platform(  # noqa: D103
@@ -39,22 +107,137 @@ async def async_setup_platform(  # noqa: D103
 ) -> None:
     token = config.get(CONF_TOKEN)
     perc_loss_load_unload = config.get(CONF_LOAD_UNLOAD_LOSS_PERC)
-    api = TibberApi(token, perc_loss_load_unload, dt_util.DEFAULT_TIME_ZONE)
+    timer = StageTimer() if config.get(CONF_TIMING) else NO_TIMER
+    api = TibberApi(
+        token,
+        perc_loss_load_unload,
+        dt_util.DEFAULT_TIME_ZONE,
+        session=async_get_clientsession(hass),
+        cache_path=hass.config.path(STORAGE_DIR, PRICE_CACHE_FILE),
+        resolution=Resolution(config.get(CONF_RESOLUTION)),
+        history=PriceHistory(hass.config.path(STORAGE_DIR, PRICE_HISTORY_FILE)),
+        timer=timer,
+    )
 
     _LOGGER.debug("Setting up sensor(s)")
 
-    sensors = [TibberPricesSensor(api)]
-    async_add_entities(sensors, True)
-
+    battery = None
+    capacity = config.get(CONF_BATTERY_CAPACITY)
+    if capacity is not None:
+        # the configured round trip loss is the efficiency of the battery,
+        # without power limits it can be fully charged within an hour
+        battery = BatteryParameters(
+            capacity,
+            config.get(CONF_BATTERY_CHARGE_POWER, capacity),
+            config.get(CONF_BATTERY_DISCHARGE_POWER, capacity),
+            efficiency=1 - perc_loss_load_unload / 100,
+            min_soc=config.get(CONF_BATTERY_MIN_SOC),
+        )
 
-class TibberPricesSensor(Entity):  # noqa: D101
-    def __init__(self, api: TibberApi) -> None:  # noqa: D107
-        self._name = PRICE_SENSOR_NAME
+    # one fetch and one analysis for all homes of the account, the entities start
+    # from the cache and the coordinator refreshes in the background
+    coordinator = TibberPriceCoordinator(
+        hass, api, battery, config.get(CONF_BATTERY_SOC_ENTITY)
+    )
+    await coordinator.async_setup()
+    homes = coordinator.homes
+    several = len(homes) > 1
+    sensors = []
+    for home in homes:
+        sensors.append(
+            TibberPricesSensor(
+                coordinator,
+                home.id,
+                _entity_name(PRICE_SENSOR_NAME, home, several),
+                config.get(CONF_COMPACT_ATTRIBUTES),
+                [timedelta(hours=x) for x in config.get(CONF_BLOCK_HOURS)],
+            )
+        )
+        sensors.extend(
+            x(coordinator, home.id, _entity_name(x.NAME, home, several))
+            for x in (
+                TibberCurrentPriceSensor,
+                TibberLoadingLevelSensor,
+                TibberNextLoadWindowSensor,
+                TibberNextUnloadWindowSensor,
+                TibberTodayStatsSensor,
+                TibberTomorrowStatsSensor,
+            )
+        )
+        if battery is not None:
+            sensors.append(
+                TibberBatteryActionSensor(
+                    coordinator,
+                    home.id,
+                    _entity_name(TibberBatteryActionSensor.NAME, home, several),
+                )
+            )
+    if config.get(CONF_LIVE_MEASUREMENT):
+        url = await api.async_get_websocket_url()
+        if url is None:
+            _LOGGER.error("No websocket url, live measurement disabled")
+        else:
+            sensors.extend(
+                TibberLivePowerSensor(
+                    coordinator,
+                    home.id,
+                    _entity_name(LIVE_SENSOR_NAME, home, several),
+                    LiveMeasurementClient(
+                        token, home.id, url, session=async_get_clientsession(hass)
+                    ),
+                )
+                for home in homes
+            )
+    if timer.enabled:
+        sensors.append(TibberDiagnosticsSensor(coordinator, DIAGNOSTICS_SENSOR_NAME))
+        hass.http.register_view(TibberMetricsView(timer))
+    async_add_entities(sensors)
+
+    async def _async_close_history(_event) -> None:
+        await hass.async_add_executor_job(api.history.close)
+
+    hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, _async_close_history)
+
+
+class TibberPricesSensor(CoordinatorEntity[TibberPriceCoordinator]):
+    """All prices and analysis results of a home in one state, kept for existing automations."""
+
+    # the per slot lists are far too large for the recorder database
+    _unrecorded_attributes = frozenset(
+        {
+            "today",
+            "today_load_from_net",
+            "today_unload_battery",
+            "tomorrow",
+            "tomorrow_load_from_net",
+            "tomorrow_unload_battery",
+            "future",
+            "battery_plan",
+        }
+    )
+
+    def __init__(  # noqa: D107
+        self,
+        coordinator: TibberPriceCoordinator,
+        home_id: str,
+        name: str,
+        compact: bool = False,
+        block_durations: list[timedelta] | None = None,
+    ) -> None:
+        super().__init__(coordinator)
+        self._name = name
         self._icon = "mdi:currency-eur"
         self._state = 0
         self._state_attributes = {}
+        self._compact = compact
+        if compact:
+            self._state_attributes["codes"] = formatting.compact_codes()
         self._unit_of_measurement = "Cent/kWh"
-        self._api = api
+        self._home_id = home_id
+        self._block_durations = block_durations or []
+        # analyses the today/tomorrow attributes were formatted from
+        self._today: DayAnalysis | None = None
+        self._tomorrow: DayAnalysis | None = _NOT_FORMATTED
 
     @property
     def name(self):
@@ -82,134 +265,462 @@ class TibberPricesSensor(Entity):  # noqa: D101
         return self._unit_of_measurement
 
     @staticmethod
-    def hourly_data_to_json(x: HourlyData) -> {}:  # noqa: D102
-        res = {
-            "level": x.level.value,
-            "price": TibberPricesSensor._format_price(x.price),
-        }
-        if x.starts_at is not None:
-            res["starts_at"] = TibberPricesSensor._format_date(x.starts_at)
-        if x.loading_level is not None:
-            res["loading_level"] = x.loading_level.value
-        if x.extrema_type is not None:
-            res["extrema_type"] = x.extrema_type.value
-
-        return res
+    def hourly_data_to_json(x: PriceSlot) -> {}:  # noqa: D102
+        return formatting.hourly_data_to_json(x, dt_util.DEFAULT_TIME_ZONE)
 
     @staticmethod
-    def convert_to_json_list(arr: list[HourlyData]) -> []:  # noqa: D102
-        res = []
-        for x in arr:
-            res.append(TibberPricesSensor.hourly_data_to_json(x))
-        return res
+    def convert_to_json_list(arr: list[PriceSlot] | PriceSeries) -> []:  # noqa: D102
+        return formatting.convert_to_json_list(arr, dt_util.DEFAULT_TIME_ZONE)
 
     @staticmethod
     def _format_price(price: float) -> float:
         """Return rounded price in Cent / kWh."""
-        return round(price * 100, 1)
+        return formatting.format_price(price)
 
     @staticmethod
     def _format_date(dt: datetime) -> str:
-        local_timestamp = dt_util.as_local(dt)
-        return local_timestamp.isoformat()
+        return formatting.format_date(dt, dt_util.DEFAULT_TIME_ZONE)
 
     @staticmethod
     def _statistics_to_json(x: Statistics) -> {}:  # noqa: D102
-        res = {
-            "start_time": TibberPricesSensor._format_date(x.start_time),
-            "end_time": TibberPricesSensor._format_date(x.end_time),
-            "avg_level": x.avg_level.value,
-            "min": TibberPricesSensor.hourly_data_to_json(x.min),
-            "avg_price": TibberPricesSensor._format_price(x.avg_price),
-            "max": TibberPricesSensor.hourly_data_to_json(x.max),
-        }
-        return res
+        return formatting.statistics_to_json(x, dt_util.DEFAULT_TIME_ZONE)
+
+    def _series_to_json(self, series: PriceSeries) -> []:
+        if self._compact:
+            return formatting.series_to_compact_json(series, dt_util.DEFAULT_TIME_ZONE)
+        return self.convert_to_json_list(series)
+
+    def _loading_level_to_json(self, day: DayAnalysis, level: LoadingLevel) -> []:
+        if self._compact:
+            # indices into the compact day series
+            return formatting.loading_level_indices_to_json(day.series, level)
+        if level is LoadingLevel.LOAD_FROM_NET:
+            return self.convert_to_json_list(day.load_from_net)
+        return self.convert_to_json_list(day.unload_battery)
+
+    def _process_battery_plan(self, upcoming: PriceSeries, plan: BatteryPlan) -> None:
+        attributes = self._state_attributes
+        attributes["sep4"] = "========================================"
+        attributes["battery_action"] = plan.action(0).value if len(plan) else None
+        attributes["battery_savings"] = TibberPricesSensor._format_price(plan.savings)
+        if self._compact:
+            attributes["battery_plan"] = formatting.battery_plan_to_compact_json(
+                upcoming, plan, dt_util.DEFAULT_TIME_ZONE
+            )
+        else:
+            attributes["battery_plan"] = formatting.battery_plan_to_json(
+                upcoming, plan, dt_util.DEFAULT_TIME_ZONE
+            )
 
-    def update(self):
-        """Update state and attributes."""
-        _LOGGER.debug("Start update")
-        api = self._api
-        now = datetime.now(dt_util.DEFAULT_TIME_ZONE)
-        price_info = api.get_price_info()
-        _LOGGER.debug("Finished rest call")
+    def _process_blocks(self, blocks: PriceBlocks, now: datetime) -> None:
+        """Cheapest and most expensive blocks per duration from the current slot on."""
+        attributes = self._state_attributes
+        time_zone = dt_util.DEFAULT_TIME_ZONE
+        attributes["cheapest_blocks"] = formatting.blocks_to_json(
+            blocks.cheapest_blocks(self._block_durations, now), time_zone
+        )
+        attributes["most_expensive_blocks"] = formatting.blocks_to_json(
+            blocks.most_expensive_blocks(self._block_durations, now), time_zone
+        )
 
-        current = api.convert_to_hourly(price_info["current"])
+    async def async_added_to_hass(self) -> None:
+        """Show the prices the coordinator holds right away and follow its updates."""
+        await super().async_added_to_hass()
+        self._process_coordinator_data()
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        self._process_coordinator_data()
+        super()._handle_coordinator_update()
+
+    def _process_coordinator_data(self) -> None:
+        snapshot = self.coordinator.snapshot(self._home_id)
+        if snapshot is None:
+            # no prices for today, keep the previous state
+            return
+        with self.coordinator.api.timer.stage("format_attributes"):
+            self._process_snapshot(snapshot)
+
+    def _process_snapshot(self, snapshot: HomeSnapshot) -> None:
+        """Prepare the sensor attributes from the snapshot of the coordinator.
+
+        Days whose prices did not change keep their analysis and their attributes, only
+        current and future change with every update.
+        """
+        now = datetime.now(dt_util.DEFAULT_TIME_ZONE)
+        today = snapshot.today
+        tomorrow = snapshot.tomorrow
+        current = snapshot.current
         self._state = TibberPricesSensor._format_price(current.price)
+        future = snapshot.future
+        stats_future = snapshot.future_stats
 
-        today = api.convert_to_list(price_info["today"])
-        api.mark_extrema(today)
-        stats_today = Statistics(today)
-        api.determine_loading_levels(today)
-        # take over corresponding loading level from today array
-        api.merge_loading_level(current, today)
+        ######################################################
+        # Prepare sensor attributes
 
-        today_load_from_net = api.filter_loading_level(
-            today, LoadingLevel.LOAD_FROM_NET
-        )
-        today_unload_battery = api.filter_loading_level(
-            today, LoadingLevel.UNLOAD_BATTERY
-        )
+        attributes = self._state_attributes
+        attributes["last_update"] = TibberPricesSensor._format_date(now)
+        attributes["current"] = TibberPricesSensor.hourly_data_to_json(current)
+
+        if today is not self._today:
+            self._today = today
+            attributes["sep1"] = "========================================"
+            attributes["today_stats"] = self._statistics_to_json(today.stats)
+            attributes["today"] = self._series_to_json(today.series)
+            attributes["today_load_from_net"] = self._loading_level_to_json(
+                today, LoadingLevel.LOAD_FROM_NET
+            )
+            attributes["today_unload_battery"] = self._loading_level_to_json(
+                today, LoadingLevel.UNLOAD_BATTERY
+            )
 
-        tomorrow = api.convert_to_list(price_info["tomorrow"])
-        api.mark_extrema(tomorrow)
         # tomorrow value appears around 12:00
-        if tomorrow is not None and len(tomorrow) > 0:
-            stats_tomorrow = Statistics(tomorrow)
-            api.determine_loading_levels(tomorrow)
-            tomorrow_load_from_net = api.filter_loading_level(
-                tomorrow, LoadingLevel.LOAD_FROM_NET
+        if tomorrow is not self._tomorrow:
+            self._tomorrow = tomorrow
+            attributes["sep2"] = "========================================"
+            if tomorrow is not None:
+                attributes["tomorrow_stats"] = self._statistics_to_json(tomorrow.stats)
+                attributes["tomorrow"] = self._series_to_json(tomorrow.series)
+                attributes["tomorrow_load_from_net"] = self._loading_level_to_json(
+                    tomorrow, LoadingLevel.LOAD_FROM_NET
+                )
+                attributes["tomorrow_unload_battery"] = self._loading_level_to_json(
+                    tomorrow, LoadingLevel.UNLOAD_BATTERY
+                )
+            else:
+                attributes["tomorrow_stats"] = None
+                attributes["tomorrow"] = []
+                attributes["tomorrow_load_from_net"] = []
+                attributes["tomorrow_unload_battery"] = []
+
+        attributes["sep3"] = "========================================"
+        attributes["future_stats"] = (
+            self._statistics_to_json(stats_future) if stats_future is not None else None
+        )
+        attributes["future"] = self._series_to_json(future)
+
+        if snapshot.trailing_averages is not None:
+            # the trailing averages Tibber bases the price levels on
+            for days, avg in snapshot.trailing_averages.items():
+                attributes[f"avg_price_{days}_days"] = (
+                    TibberPricesSensor._format_price(avg) if avg is not None else None
+                )
+
+        if snapshot.blocks is not None and self._block_durations:
+            self._process_blocks(snapshot.blocks, now)
+
+        if snapshot.battery_plan is not None:
+            self._process_battery_plan(snapshot.battery_series, snapshot.battery_plan)
+        _LOGGER.debug("EOF update")
+
+
+class TibberLivePowerSensor(Entity):
+    """Average power of the last minute with the energy and cost of the current slot.
+
+    The raw readings arrive every few seconds, the state is only written when a minute
+    is complete.
+    """
+
+    def __init__(  # noqa: D107
+        self,
+        coordinator: TibberPriceCoordinator,
+        home_id: str,
+        name: str,
+        client: LiveMeasurementClient,
+    ) -> None:
+        self._name = name
+        self._icon = "mdi:flash"
+        self._state = None
+        self._state_attributes = {}
+        self._unit_of_measurement = "W"
+        self._coordinator = coordinator
+        self._home_id = home_id
+        self._client = client
+        self._slot_length = coordinator.api.resolution.slot_length
+        self._minutes = PowerAggregator(timedelta(minutes=1), self._price_at)
+        self._slots = PowerAggregator(self._slot_length, self._price_at)
+        self._task: asyncio.Task | None = None
+
+    @property
+    def should_poll(self) -> bool:
+        """Updates are pushed by the subscription."""
+        return False
+
+    @property
+    def name(self):
+        """Return the name of the sensor."""
+        return self._name
+
+    @property
+    def icon(self):
+        """Icon to use in the frontend, if any."""
+        return self._icon
+
+    @property
+    def state(self):
+        """Return the state of the device."""
+        return self._state
+
+    @property
+    def extra_state_attributes(self):
+        """Return the state attributes of the sensor."""
+        return self._state_attributes
+
+    @property
+    def unit_of_measurement(self):
+        """Return the unit of measurement."""
+        return self._unit_of_measurement
+
+    def _price_at(self, dt: datetime) -> float | None:
+        snapshot = self._coordinator.snapshot(self._home_id)
+        if snapshot is None:
+            return None
+        for day in (snapshot.today, snapshot.tomorrow):
+            # until the coordinator moved on, the first slot after midnight is in tomorrow
+            if day is not None:
+                price = price_at(day.series, dt, self._slot_length)
+                if price is not None:
+                    return price
+        return None
+
+    async def async_added_to_hass(self) -> None:  # noqa: D102
+        self._client.start()
+        self._task = self.hass.async_create_task(self._async_consume())
+
+    async def async_will_remove_from_hass(self) -> None:  # noqa: D102
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self._client.stop()
+
+    async def _async_consume(self) -> None:
+        async for reading in self._client.readings():
+            minutes = self._minutes.add(reading)
+            slots = self._slots.add(reading)
+            if minutes or slots:
+                self._update_attributes(minutes[-1] if minutes else None, slots)
+                self.async_write_ha_state()
+
+    @staticmethod
+    def _cost_to_json(cost: float | None) -> float | None:
+        return formatting.format_price(cost) if cost is not None else None
+
+    def _update_attributes(
+        self, minute: WindowAggregate | None, slots: list[WindowAggregate]
+    ) -> None:
+        attributes = self._state_attributes
+        if minute is not None:
+            self._state = round(minute.avg_power)
+            attributes["max_power"] = round(minute.max_power)
+        if slots:
+            last = slots[-1]
+            attributes["last_slot_start"] = formatting.format_date(
+                last.start, dt_util.DEFAULT_TIME_ZONE
             )
-            tomorrow_unload_battery = api.filter_loading_level(
-                tomorrow, LoadingLevel.UNLOAD_BATTERY
+            attributes["last_slot_energy"] = round(last.energy, 4)
+            attributes["last_slot_cost"] = self._cost_to_json(last.cost)
+        current = self._slots.current()
+        if current is not None:
+            attributes["slot_start"] = formatting.format_date(
+                current.start, dt_util.DEFAULT_TIME_ZONE
             )
-        else:
-            stats_tomorrow = None
-            tomorrow_load_from_net = []
-            tomorrow_unload_battery = []
+            attributes["slot_energy"] = round(current.energy, 4)
+            attributes["slot_cost"] = self._cost_to_json(current.cost)
 
-        future = api.filter_future_items(today)
-        future.extend(tomorrow)
-        api.mark_extrema(future)
-        stats_future = Statistics(future)
 
-        ######################################################
-        # Prepare sensor attributes
+class TibberHomeSensor(CoordinatorEntity[TibberPriceCoordinator], SensorEntity):
+    """One slice of the snapshot of a home, only taken when the coordinator updates."""
 
-        self._state_attributes["last_update"] = TibberPricesSensor._format_date(now)
-        self._state_attributes["current"] = TibberPricesSensor.hourly_data_to_json(
-            current
-        )
+    NAME = ""
+    KEY = ""
 
-        self._state_attributes["sep1"] = "========================================"
-        self._state_attributes["today_stats"] = self._statistics_to_json(stats_today)
-        self._state_attributes["today"] = self.convert_to_json_list(today)
-        self._state_attributes["today_load_from_net"] = self.convert_to_json_list(
-            today_load_from_net
-        )
-        self._state_attributes["today_unload_battery"] = self.convert_to_json_list(
-            today_unload_battery
+    def __init__(  # noqa: D107
+        self, coordinator: TibberPriceCoordinator, home_id: str, name: str
+    ) -> None:
+        super().__init__(coordinator)
+        self._home_id = home_id
+        self._has_slice = False
+        self._attr_name = name
+        self._attr_unique_id = f"{home_id}_{self.KEY}"
+        self._update_slice()
+
+    @property
+    def available(self) -> bool:  # noqa: D102
+        return super().available and self._has_slice
+
+    def _update_slice(self) -> None:
+        snapshot = self.coordinator.snapshot(self._home_id)
+        self._has_slice = snapshot is not None
+        if snapshot is not None:
+            self._take_slice(snapshot)
+
+    @abc.abstractmethod
+    def _take_slice(self, snapshot: HomeSnapshot) -> None:
+        """Set the state and attributes of the sensor from the snapshot of its home."""
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        self._update_slice()
+        super()._handle_coordinator_update()
+
+
+class TibberCurrentPriceSensor(TibberHomeSensor):
+    """Price of the current slot."""
+
+    NAME = "Tibber Current Price"
+    KEY = "current_price"
+    _attr_icon = "mdi:currency-eur"
+    _attr_native_unit_of_measurement = "Cent/kWh"
+
+    def _take_slice(self, snapshot: HomeSnapshot) -> None:
+        self._attr_native_value = formatting.format_price(snapshot.current.price)
+        self._attr_extra_state_attributes = formatting.hourly_data_to_json(
+            snapshot.current, dt_util.DEFAULT_TIME_ZONE
         )
 
-        # tomorrow value appears around 12:00
-        self._state_attributes["sep2"] = "========================================"
-        if tomorrow is not None and len(tomorrow) > 0:
-            self._state_attributes["tomorrow_stats"] = self._statistics_to_json(
-                stats_tomorrow
-            )
-            self._state_attributes["tomorrow"] = self.convert_to_json_list(tomorrow)
-            self._state_attributes[
-                "tomorrow_load_from_net"
-            ] = self.convert_to_json_list(tomorrow_load_from_net)
-            self._state_attributes[
-                "tomorrow_unload_battery"
-            ] = self.convert_to_json_list(tomorrow_unload_battery)
-        else:
-            self._state_attributes["tomorrow_stats"] = None
-            self._state_attributes["tomorrow"] = []
-            self._state_attributes["tomorrow_load_from_net"] = []
-            self._state_attributes["tomorrow_unload_battery"] = []
-
-        self._state_attributes["sep3"] = "========================================"
-        self._state_attributes["future_stats"] = self._statistics_to_json(stats_future)
-        self._state_attributes["future"] = self.convert_to_json_list(future)
-        _LOGGER.debug("EOF update")
+
+class TibberLoadingLevelSensor(TibberHomeSensor):
+    """Loading level of the current slot, NONE if the slot is not marked."""
+
+    NAME = "Tibber Loading Level"
+    KEY = "loading_level"
+    _attr_icon = "mdi:battery-sync"
+    _attr_device_class = SensorDeviceClass.ENUM
+    _attr_options = [x.value for x in LoadingLevel] + ["NONE"]
+
+    def _take_slice(self, snapshot: HomeSnapshot) -> None:
+        level = snapshot.current.loading_level
+        self._attr_native_value = level.value if level is not None else "NONE"
+
+
+class TibberPriceWindowSensor(TibberHomeSensor):
+    """Start of the next window of slots with a loading level, the current one included."""
+
+    _attr_device_class = SensorDeviceClass.TIMESTAMP
+
+    @abc.abstractmethod
+    def _window(self, snapshot: HomeSnapshot) -> PriceWindow | None:
+        """The window of the snapshot the sensor shows, None if there is none."""
+
+    def _take_slice(self, snapshot: HomeSnapshot) -> None:
+        window = self._window(snapshot)
+        if window is None:
+            self._attr_native_value = None
+            self._attr_extra_state_attributes = {}
+            return
+        self._attr_native_value = window.start
+        self._attr_extra_state_attributes = {
+            "end": formatting.format_date(window.end, dt_util.DEFAULT_TIME_ZONE),
+            "avg_price": formatting.format_price(window.avg_price),
+            "slots": window.slots,
+        }
+
+
+class TibberNextLoadWindowSensor(TibberPriceWindowSensor):
+    """Next slots to load the battery from the net."""
+
+    NAME = "Tibber Next Cheap Window"
+    KEY = "next_load_window"
+    _attr_icon = "mdi:battery-arrow-up"
+
+    def _window(self, snapshot: HomeSnapshot) -> PriceWindow | None:
+        return snapshot.next_load_window
+
+
+class TibberNextUnloadWindowSensor(TibberPriceWindowSensor):
+    """Next slots to unload the battery."""
+
+    NAME = "Tibber Next Expensive Window"
+    KEY = "next_unload_window"
+    _attr_icon = "mdi:battery-arrow-down"
+
+    def _window(self, snapshot: HomeSnapshot) -> PriceWindow | None:
+        return snapshot.next_unload_window
+
+
+class TibberDayStatsSensor(TibberHomeSensor):
+    """Average price of a day with its minimum and maximum."""
+
+    _attr_icon = "mdi:chart-line"
+    _attr_native_unit_of_measurement = "Cent/kWh"
+
+    @abc.abstractmethod
+    def _day(self, snapshot: HomeSnapshot) -> DayAnalysis | None:
+        """The day of the snapshot the sensor shows, None before its prices are known."""
+
+    def _take_slice(self, snapshot: HomeSnapshot) -> None:
+        day = self._day(snapshot)
+        if day is None:
+            self._attr_native_value = None
+            self._attr_extra_state_attributes = {}
+            return
+        stats = formatting.statistics_to_json(day.stats, dt_util.DEFAULT_TIME_ZONE)
+        self._attr_native_value = stats.pop("avg_price")
+        self._attr_extra_state_attributes = stats
+
+
+class TibberTodayStatsSensor(TibberDayStatsSensor):  # noqa: D101
+    NAME = "Tibber Today Average Price"
+    KEY = "today_stats"
+
+    def _day(self, snapshot: HomeSnapshot) -> DayAnalysis | None:
+        return snapshot.today
+
+
+class TibberTomorrowStatsSensor(TibberDayStatsSensor):
+    """Unknown until tomorrow's prices are published."""
+
+    NAME = "Tibber Tomorrow Average Price"
+    KEY = "tomorrow_stats"
+
+    def _day(self, snapshot: HomeSnapshot) -> DayAnalysis | None:
+        return snapshot.tomorrow
+
+
+class TibberBatteryActionSensor(TibberHomeSensor):
+    """Action of the battery plan for the current slot."""
+
+    NAME = "Tibber Battery Action"
+    KEY = "battery_action"
+    _attr_icon = "mdi:home-battery"
+    _attr_device_class = SensorDeviceClass.ENUM
+    _attr_options = [x.value for x in BatteryAction]
+
+    def _take_slice(self, snapshot: HomeSnapshot) -> None:
+        plan = snapshot.battery_plan
+        if plan is None or len(plan) == 0:
+            self._attr_native_value = None
+            self._attr_extra_state_attributes = {}
+            return
+        self._attr_native_value = plan.action(0).value
+        self._attr_extra_state_attributes = {
+            "savings": formatting.format_price(plan.savings),
+            "soc": round(float(plan.soc[0]), 3),
+        }
+
+
+class TibberDiagnosticsSensor(CoordinatorEntity[TibberPriceCoordinator], SensorEntity):
+    """Duration of the last update with p50/p95 of every pipeline stage in ms."""
+
+    _attr_icon = "mdi:timer-outline"
+    _attr_native_unit_of_measurement = "ms"
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+
+    def __init__(self, coordinator: TibberPriceCoordinator, name: str) -> None:  # noqa: D107
+        super().__init__(coordinator)
+        self._attr_name = name
+        self._attr_unique_id = f"{coordinator.name}_diagnostics"
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        timer = self.coordinator.api.timer
+        last = timer.last("update")
+        self._attr_native_value = round(last * 1000, 2) if last is not None else None
+        self._attr_extra_state_attributes = {
+            stage: {
+                key: value if key == "count" else round(value * 1000, 2)
+                for key, value in stats.items()
+            }
+            for stage, stats in timer.stats().items()
+        }
+        super()._handle_coordinator_update()
@@ -0,0 +1,199 @@
+from concurrent.futures import ThreadPoolExecutor
+import copy
+from datetime import datetime, timedelta
+from unittest import TestCase
+from unittest.mock import patch
+
+import pytz
+
+from custom_components.yan_tibber_client.api.analysis import PriceAnalyzer, fingerprint, next_window
+from custom_components.yan_tibber_client.api.api import (
+    ExtremaType,
+    HomePriceInfo,
+    LoadingLevel,
+    PriceSeries,
+    Statistics,
+    TibberApi,
+)
+from custom_components.yan_tibber_client.api.optimizer import BatteryParameters
+from test.tibber_stub import load_fixture
+
+
+class TestPriceAnalyzer(TestCase):
+    DEFAULT_TIME_ZONE = pytz.timezone('Europe/Berlin')
+
+    def setUp(self):
+        data = load_fixture('price_info.json')
+        self.price_info = data['data']['viewer']['homes'][0]['currentSubscription']['priceInfo']
+        self.api = TibberApi('token', 20, self.DEFAULT_TIME_ZONE)
+        self.analyzer = PriceAnalyzer(self.api)
+
+    def test_identical_payload_is_not_recomputed(self):
+        today, tomorrow = self.analyzer.analyse(self.price_info)
+        with patch.object(self.api, 'with_loading_levels') as determine:
+            today2, tomorrow2 = self.analyzer.analyse(copy.deepcopy(self.price_info))
+        determine.assert_not_called()
+        self.assertIs(today, today2)
+        self.assertIs(tomorrow, tomorrow2)
+
+    def test_changed_price_is_recomputed(self):
+        today, tomorrow = self.analyzer.analyse(self.price_info)
+        changed = copy.deepcopy(self.price_info)
+        changed['tomorrow'][3]['total'] += 0.01
+        today2, tomorrow2 = self.analyzer.analyse(changed)
+        self.assertIs(today, today2)
+        self.assertIsNot(tomorrow, tomorrow2)
+        self.assertNotEqual(fingerprint(self.price_info['tomorrow']), tomorrow2.fingerprint)
+
+    def test_tomorrow_is_reused_after_midnight(self):
+        _, tomorrow = self.analyzer.analyse(self.price_info)
+        now = self.DEFAULT_TIME_ZONE.localize(datetime(2024, 1, 28, 0, 5))
+        today, tomorrow2 = self.analyzer.analyse(self.api.align_price_info(self.price_info, now))
+        self.assertIs(tomorrow, today)
+        self.assertIsNone(tomorrow2)
+
+    def test_day_analysis(self):
+        today, _ = self.analyzer.analyse(self.price_info)
+        self.assertEqual(24, len(today.series))
+        self.assertEqual(
+            [x.starts_at for x in TibberApi.filter_loading_level(today.series, LoadingLevel.LOAD_FROM_NET)],
+            [x.starts_at for x in today.load_from_net],
+        )
+        self.assertEqual(today.stats.min.price, today.series.prices.min())
+
+    def test_future(self):
+        today, tomorrow = self.analyzer.analyse(self.price_info)
+        future, stats = self.analyzer.future(today, tomorrow)
+        # the fixture lies in the past, only tomorrow is left
+        self.assertEqual(24, len(future))
+        self.assertEqual(tomorrow.stats.avg_price, stats.avg_price)
+        # marking the future extrema does not touch the cached day
+        self.assertIsNot(tomorrow.series.extrema_types, future.extrema_types)
+
+        future, stats = self.analyzer.future(today, None)
+        self.assertEqual(0, len(future))
+        self.assertIsNone(stats)
+
+    def test_analyse_all_homes(self):
+        data = load_fixture('price_info_homes.json')
+        homes = TibberApi.homes_from_response(data)
+        same_area = homes[0].with_price_info(copy.deepcopy(homes[0].price_info))
+        res = self.analyzer.analyse_all({'a': homes[0].price_info, 'b': homes[1].price_info,
+                                         'c': same_area.price_info, 'd': []})
+        self.assertEqual(['a', 'b', 'c'], list(res))
+        # homes with the same prices share the analysis
+        self.assertIs(res['a'][0], res['c'][0])
+        self.assertIsNot(res['a'][0], res['b'][0])
+        self.assertAlmostEqual(res['a'][0].stats.avg_price + 0.012, res['b'][0].stats.avg_price)
+
+    def test_plan_battery(self):
+        today, tomorrow = self.analyzer.analyse(self.price_info)
+        params = BatteryParameters(10, 5, 5, efficiency=0.8)
+        upcoming, plan = self.analyzer.plan_battery(today, tomorrow, params)
+        # the fixture lies in the past, only tomorrow is left
+        self.assertEqual(24, len(upcoming))
+        self.assertEqual(24, len(plan))
+        self.assertGreater(plan.savings, 0)
+        self.assertGreaterEqual(plan.soc[-1], 0)
+
+    def test_snapshot(self):
+        home = HomePriceInfo('home', 'Hauptstraße 1', self.price_info)
+        snapshots = self.analyzer.snapshots({'home': home}, BatteryParameters(10, 5, 5, efficiency=0.8))
+        snapshot = snapshots['home']
+        today, tomorrow = self.analyzer.analyse(self.price_info)
+        self.assertIs(today, snapshot.today)
+        self.assertIs(tomorrow, snapshot.tomorrow)
+        self.assertEqual(self.price_info['current']['total'], snapshot.current.price)
+        self.assertEqual(
+            today.series.hourly_data(0).loading_level, snapshot.current.loading_level)
+        # the fixture lies in the past, only tomorrow is left
+        self.assertEqual(24, len(snapshot.future))
+        self.assertEqual(24, len(snapshot.battery_series))
+        self.assertEqual(24, len(snapshot.battery_plan))
+
+        window = snapshot.next_load_window
+        marked = tomorrow.series.loading_level_indices(LoadingLevel.LOAD_FROM_NET)
+        self.assertEqual(tomorrow.series.starts_at(marked[0]), window.start)
+        self.assertEqual(window.start + timedelta(hours=window.slots), window.end)
+        self.assertTrue(all(
+            tomorrow.series.loading_levels[marked[0] + i] == PriceSeries.LOADING_CODES[LoadingLevel.LOAD_FROM_NET]
+            for i in range(window.slots)))
+        self.assertIsNone(self.analyzer.snapshot(home, today, tomorrow).battery_plan)
+
+    def test_next_window(self):
+        series = TibberApi.convert_to_series(self.price_info['today'])
+        codes = [0, 1, 1, 1, 0, 2, 2] + [0] * 17
+        series.loading_levels[:] = codes
+        window = next_window(series, LoadingLevel.LOAD_FROM_NET, timedelta(hours=1))
+        self.assertEqual((series.starts_at(1), series.starts_at(4), 3), (window.start, window.end, window.slots))
+        self.assertAlmostEqual(series.prices[1:4].mean(), window.avg_price)
+        window = next_window(series, LoadingLevel.UNLOAD_BATTERY, timedelta(hours=1))
+        self.assertEqual(2, window.slots)
+        # a gap in the series ends the window
+        gappy = series.take([0, 1, 2, 5, 6])
+        gappy.loading_levels[:] = [0, 2, 2, 2, 2]
+        self.assertEqual(2, next_window(gappy, LoadingLevel.UNLOAD_BATTERY, timedelta(hours=1)).slots)
+        series.loading_levels[:] = 0
+        self.assertIsNone(next_window(series, LoadingLevel.LOAD_FROM_NET, timedelta(hours=1)))
+
+    def test_results_are_frozen(self):
+        today, tomorrow = self.analyzer.analyse(self.price_info)
+        self.assertTrue(today.series.frozen)
+        self.assertTrue(today.load_from_net.frozen)
+        with self.assertRaises(ValueError):
+            self.api.mark_extrema(today.series)
+        with self.assertRaises(ValueError):
+            self.api.determine_loading_levels(tomorrow.series)
+        future, _ = self.analyzer.future(today, tomorrow)
+        self.assertTrue(future.frozen)
+
+    def test_concurrent_snapshots_match_serial(self):
+        data = load_fixture('price_info_homes.json')
+        homes = {x.id: x for x in TibberApi.homes_from_response(data)}
+        battery = BatteryParameters(10, 5, 5, efficiency=0.8)
+        serial = PriceAnalyzer(self.api).snapshots(homes, battery)
+        with ThreadPoolExecutor(4) as executor:
+            concurrent = PriceAnalyzer(self.api, executor).snapshots(homes, battery)
+        self.assertEqual(list(serial), list(concurrent))
+        for home_id, snapshot in serial.items():
+            other = concurrent[home_id]
+            for day in ('today', 'tomorrow'):
+                a, b = getattr(snapshot, day), getattr(other, day)
+                self.assertEqual(a.fingerprint, b.fingerprint)
+                self.assertEqual(a.series.loading_levels.tolist(), b.series.loading_levels.tolist())
+                self.assertEqual(a.series.extrema_types.tolist(), b.series.extrema_types.tolist())
+                self.assertEqual(a.stats.avg_price, b.stats.avg_price)
+            self.assertEqual(snapshot.future.extrema_types.tolist(), other.future.extrema_types.tolist())
+            self.assertEqual(snapshot.battery_plan.savings, other.battery_plan.savings)
+
+    def test_snapshots_leave_out_homes_without_today(self):
+        data = load_fixture('price_info_homes.json')
+        homes = {x.id: x for x in TibberApi.homes_from_response(data)}
+        first, second = homes
+        homes[second] = homes[second].with_price_info(dict(homes[second].price_info, today=[]))
+        self.assertEqual([first], list(PriceAnalyzer(self.api).snapshots(homes)))
+
+
+class TestNonMutatingMarks(TestCase):
+
+    def setUp(self):
+        data = load_fixture('price_info.json')
+        self.api = TibberApi('token', 20, pytz.timezone('Europe/Berlin'))
+        self.series = self.api.convert_to_series(data['data']['viewer']['homes'][0]['currentSubscription']['priceInfo']['today'])
+
+    def test_with_marks_match_marking_in_place(self):
+        marked = self.api.with_loading_levels(self.api.with_extrema(self.series))
+        self.assertFalse(self.series.extrema_types.any())
+        self.assertFalse(self.series.loading_levels.any())
+        self.api.mark_extrema(self.series)
+        self.api.determine_loading_levels(self.series)
+        self.assertEqual(self.series.extrema_types.tolist(), marked.extrema_types.tolist())
+        self.assertEqual(self.series.loading_levels.tolist(), marked.loading_levels.tolist())
+        self.assertIs(self.series.prices, marked.prices)
+
+    def test_statistics_do_not_mark_the_input(self):
+        stats = Statistics(self.series)
+        self.assertFalse(self.series.extrema_types.any())
+        self.assertEqual(ExtremaType.MIN, stats.min.extrema_type)
+        self.assertEqual(ExtremaType.MAX, stats.max.extrema_type)
+        self.assertEqual(self.series.prices.min(), stats.min.price)
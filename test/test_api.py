@@ -1,34 +1,64 @@
-import json
 from datetime import datetime
-from unittest import TestCase
+from unittest import TestCase, mock
 
 import pytz
 
-from custom_components.yan_tibber_client.api.api import TibberApi, Statistics, LoadingLevel
+from custom_components.yan_tibber_client.api import api as api_module
+from custom_components.yan_tibber_client.api.api import (
+    ExtremaType,
+    LoadingLevel,
+    PriceLevel,
+    Statistics,
+    TibberApi,
+)
 from test.my_secrets import tibber_api_token
+from test.tibber_stub import TibberStubServer, load_fixture
+
+TIME_ZONE = pytz.timezone('Europe/Berlin')
+# the current slot of the recorded response
+NOW = TIME_ZONE.localize(datetime(2024, 1, 27, 14, 30))
+# today's slots in the recorded response
+UNLOAD_TODAY = [7, 8, 9, 17, 18, 19, 20, 21, 22, 23]
+
+
+class FixedDatetime(datetime):
+
+    @classmethod
+    def now(cls, tz=None):
+        return NOW.astimezone(tz) if tz is not None else NOW.replace(tzinfo=None)
 
 
 class TestTibberApi(TestCase):
-    DEFAULT_TIME_ZONE = pytz.timezone('Europe/Berlin')  # pytz.timezone('US/Eastern')
+    DEFAULT_TIME_ZONE = TIME_ZONE  # pytz.timezone('US/Eastern')
     PERC_LOSS_LOAD_UNLOAD = 20
 
-    @staticmethod
-    def print_list(arr: []):
-        for x in arr:
-            print(x)
+    @classmethod
+    def setUpClass(cls):
+        # recorded responses instead of the live API
+        cls.server = TibberStubServer().start()
+        cls.price_info = load_fixture('price_info.json')['data']['viewer']['homes'][0]['currentSubscription']['priceInfo']
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
 
     def _get_today_tomorrow(self):
-        api = TibberApi(tibber_api_token, self.PERC_LOSS_LOAD_UNLOAD, self.DEFAULT_TIME_ZONE)
+        api = TibberApi(tibber_api_token, self.PERC_LOSS_LOAD_UNLOAD, self.DEFAULT_TIME_ZONE, url=self.server.url)
         price_info = api.get_price_info()
         today = api.convert_to_list(price_info['today'])
         tomorrow = api.convert_to_list(price_info['tomorrow'])
         return api, today, tomorrow
 
+    def _future(self, api: TibberApi, today: list) -> list:
+        """The slots after the recorded current one, as filter_future_items sees them at NOW."""
+        with mock.patch.object(api_module, 'datetime', FixedDatetime):
+            return api.filter_future_items(today)
+
     def test_get_price_data(self):
-        api = TibberApi(tibber_api_token, self.PERC_LOSS_LOAD_UNLOAD, self.DEFAULT_TIME_ZONE)
+        api = TibberApi(tibber_api_token, self.PERC_LOSS_LOAD_UNLOAD, self.DEFAULT_TIME_ZONE, url=self.server.url)
         price_info = api.get_price_info()
-        formatted_json = json.dumps(price_info, indent=2)
-        print(formatted_json)
+        self.assertEqual(self.price_info, price_info)
+        self.assertEqual(tibber_api_token, self.server.requests[-1]['headers']['Authorization'])
 
     # https://pypi.org/project/pytz/
     def test_timezone_handling(self):
@@ -38,73 +68,104 @@ class TestTibberApi(TestCase):
         self.assertTrue(tdt < now)
 
     def test_get_current_price(self):
-        api = TibberApi(tibber_api_token, self.PERC_LOSS_LOAD_UNLOAD, self.DEFAULT_TIME_ZONE)
+        api = TibberApi(tibber_api_token, self.PERC_LOSS_LOAD_UNLOAD, self.DEFAULT_TIME_ZONE, url=self.server.url)
         price_info = api.get_price_info()
         current = api.convert_to_hourly(price_info['current'])
-        print(current)
+        self.assertEqual(TIME_ZONE.localize(datetime(2024, 1, 27, 14, 0)), current.starts_at)
+        self.assertEqual(0.1885, current.price)
+        self.assertEqual(PriceLevel.CHEAP, current.level)
+        self.assertIsNone(current.loading_level)
 
     def test_convert_to_list(self):
         api, today, tomorrow = self._get_today_tomorrow()
-        TestTibberApi.print_list(today)
-        TestTibberApi.print_list(tomorrow)
+        self.assertEqual(24, len(today))
+        self.assertEqual(24, len(tomorrow))
+        self.assertEqual([x['total'] for x in self.price_info['today']], [x.price for x in today])
+        self.assertEqual(TIME_ZONE.localize(datetime(2024, 1, 27, 0, 0)), today[0].starts_at)
+        self.assertEqual(TIME_ZONE.localize(datetime(2024, 1, 28, 23, 0)), tomorrow[-1].starts_at)
+        self.assertEqual(PriceLevel.NORMAL, today[0].level)
 
     def test_filter_future_items(self):
         api, today, tomorrow = self._get_today_tomorrow()
-
-        x = today[0].starts_at
-        now = datetime.now(self.DEFAULT_TIME_ZONE)
-        self.assertTrue(x >= now or x < now)
-
-        future = api.filter_future_items(today)
-        future.extend(tomorrow)
-        TestTibberApi.print_list(future)
+        future = self._future(api, today)
+        # the slots after 14:00, the running one is not in the future
+        self.assertEqual(today[15:], future)
+        # the recorded days are long gone
+        self.assertEqual([], api.filter_future_items(today))
 
     # https://docs.scipy.org/doc/scipy/reference/generated/scipy.signal.argrelextrema.html
     def test_relative_minima(self):
         api, today, tomorrow = self._get_today_tomorrow()
         values = api.relative_minima(today)
-        TestTibberApi.print_list(values)
+        self.assertEqual([today[4], today[13]], values)
 
     def test_relative_maxima(self):
         api, today, tomorrow = self._get_today_tomorrow()
         values = api.relative_maxima(today)
-        TestTibberApi.print_list(values)
+        self.assertEqual([today[1], today[8], today[19]], values)
 
     def test_relative_extrema(self):
         api, today, tomorrow = self._get_today_tomorrow()
         values = api.relative_extrema(today)
-        TestTibberApi.print_list(values)
+        self.assertEqual([1, 4, 8, 13, 19], [today.index(x) for x in values])
+        # the absolute extrema of the day win over the relative ones
+        self.assertEqual(
+            [ExtremaType.REL_MAX, ExtremaType.REL_MIN, ExtremaType.REL_MAX, ExtremaType.MIN, ExtremaType.MAX],
+            [x.extrema_type for x in values],
+        )
 
     def test_determine_loading_levels(self):
         api, today, tomorrow = self._get_today_tomorrow()
-        future = api.filter_future_items(today)
+        future = self._future(api, today)
         future.extend(tomorrow)
         # mark Min + Max
         api.mark_extrema(future)
+        self.assertEqual(ExtremaType.MAX, future[4].extrema_type)
+        self.assertEqual(ExtremaType.MIN, future[22].extrema_type)
 
         api.determine_loading_levels(future)
-        TestTibberApi.print_list(future)
+        self.assertTrue(all(x.loading_level is not None for x in future))
 
         future_load_from_net = api.filter_loading_level(future, LoadingLevel.LOAD_FROM_NET)
-        print("future_load_from_net:")
-        TestTibberApi.print_list(future_load_from_net)
         future_unload_battery = api.filter_loading_level(future, LoadingLevel.UNLOAD_BATTERY)
-        print("future_unload_battery:")
-        TestTibberApi.print_list(future_unload_battery)
+        self.assertEqual(len(future), len(future_load_from_net) + len(future_unload_battery))
+        self.assertEqual([2, 3, 4, 5, 17] + list(range(26, 33)), [future.index(x) for x in future_unload_battery])
+        # unloading pays off above the cheapest price plus the loss
+        cheapest = min(x.price for x in future)
+        self.assertTrue(all(x.price > cheapest * 1.2 for x in future_unload_battery))
 
     def test_merge_loading_level(self):
         api, today, tomorrow = self._get_today_tomorrow()
         api.determine_loading_levels(today)
+        self.assertEqual(UNLOAD_TODAY, [i for i, x in enumerate(today) if x.loading_level == LoadingLevel.UNLOAD_BATTERY])
 
         price_info = api.get_price_info()
         current = api.convert_to_hourly(price_info['current'])
 
         api.merge_loading_level(current, today)
-        print(current)
+        self.assertEqual(today[14].loading_level, current.loading_level)
+        self.assertEqual(LoadingLevel.LOAD_FROM_NET, current.loading_level)
 
     def test_statistics(self):
         api, today, tomorrow = self._get_today_tomorrow()
         stats_today = Statistics(today)
-        print(stats_today)
+        self.assertEqual((today[13].starts_at, 0.1712), (stats_today.min.starts_at, stats_today.min.price))
+        self.assertEqual((today[19].starts_at, 0.3793), (stats_today.max.starts_at, stats_today.max.price))
+        self.assertAlmostEqual(sum(x.price for x in today) / 24, stats_today.avg_price)
+        self.assertEqual(PriceLevel.NORMAL, stats_today.avg_level)
+        self.assertEqual(today[0].starts_at, stats_today.start_time)
+        self.assertEqual(today[-1].starts_at, stats_today.end_time)
         stats_tomorrow = Statistics(tomorrow)
-        print(stats_tomorrow)
+        self.assertEqual(0.1637, stats_tomorrow.min.price)
+        self.assertEqual(0.3702, stats_tomorrow.max.price)
+        self.assertAlmostEqual(0.2612958, stats_tomorrow.avg_price)
+
+    def test_graphql_error(self):
+        with TibberStubServer(load_fixture('graphql_error.json')) as server:
+            api = TibberApi(tibber_api_token, self.PERC_LOSS_LOAD_UNLOAD, self.DEFAULT_TIME_ZONE, url=server.url)
+            with self.assertLogs('custom_components.yan_tibber_client.api.api', level='ERROR') as logs:
+                self.assertEqual([], api.get_homes_price_info())
+                self.assertEqual([], api.get_price_info())
+            api.close()
+        self.assertIn('TOO_MANY_REQUESTS', logs.output[0])
+        self.assertEqual([], TibberApi.homes_from_response({'data': {'viewer': None}}))
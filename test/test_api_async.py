@@ -0,0 +1,71 @@
+from unittest import IsolatedAsyncioTestCase
+
+import pytz
+
+from custom_components.yan_tibber_client.api.api import TibberApi
+from test.tibber_stub import TibberStubServer, load_fixture
+
+
+class TestTibberApiAsync(IsolatedAsyncioTestCase):
+    DEFAULT_TIME_ZONE = pytz.timezone('Europe/Berlin')
+    PERC_LOSS_LOAD_UNLOAD = 20
+
+    def setUp(self):
+        self.server = TibberStubServer().start()
+        self.api = TibberApi('token', self.PERC_LOSS_LOAD_UNLOAD, self.DEFAULT_TIME_ZONE, url=self.server.url)
+
+    async def asyncTearDown(self):
+        await self.api.async_close()
+        self.server.stop()
+
+    async def test_async_get_price_info(self):
+        price_info = await self.api.async_get_price_info()
+        self.assertEqual(24, len(price_info['today']))
+        self.assertEqual(24, len(price_info['tomorrow']))
+        self.assertEqual('token', self.server.requests[0]['headers']['Authorization'])
+        self.assertIn('priceInfo', self.server.requests[0]['body']['query'])
+
+    async def test_async_matches_blocking_call(self):
+        price_info = await self.api.async_get_price_info()
+        self.assertEqual(self.api.get_price_info(), price_info)
+        self.api.close()
+
+    async def test_connection_is_reused(self):
+        for _ in range(5):
+            await self.api.async_get_price_info()
+        self.assertEqual(5, len(self.server.requests))
+        self.assertEqual(1, len(self.server.connections))
+
+    async def test_error_response(self):
+        self.server.status = 500
+        with self.assertLogs('custom_components.yan_tibber_client.api.api', level='ERROR'):
+            price_info = await self.api.async_get_price_info()
+        self.assertEqual([], price_info)
+
+    async def test_all_homes_in_one_request(self):
+        self.server.response = load_fixture('price_info_homes.json')
+        homes = await self.api.async_get_homes_price_info()
+        self.assertEqual(1, len(self.server.requests))
+        # the home without subscription is left out
+        self.assertEqual(
+            ['96a14971-525a-4420-aae9-e5aedaa129ff', '1d1f2a3b-6c6d-4e5f-8a9b-0c1d2e3f4a5b'],
+            [x.id for x in homes],
+        )
+        self.assertEqual('Seeweg 7 23730 Neustadt', homes[1].address)
+        self.assertEqual(homes[0].price_info, await self.api.async_get_price_info())
+
+    async def test_compressed_response(self):
+        self.server.response = load_fixture('price_info_homes.json')
+        self.server.compress = True
+        homes = await self.api.async_get_homes_price_info()
+        self.assertIn('gzip', self.server.requests[0]['headers']['Accept-Encoding'])
+        self.assertEqual(
+            self.server.response['data']['viewer']['homes'][1]['currentSubscription']['priceInfo'],
+            homes[1].price_info,
+        )
+
+    async def test_graphql_error(self):
+        # reported with status 200
+        self.server.response = load_fixture('graphql_error.json')
+        with self.assertLogs('custom_components.yan_tibber_client.api.api', level='ERROR'):
+            self.assertEqual([], await self.api.async_get_homes_price_info())
@@ -0,0 +1,101 @@
+import time
+from unittest import TestCase
+
+import numpy as np
+
+from custom_components.yan_tibber_client.api.api import LoadingLevel, PriceSeries, TibberApi
+from custom_components.yan_tibber_client.api.backtest import (
+    BacktestConfig,
+    Strategy,
+    backtest,
+    parameter_grid,
+    run_backtests,
+    split_days,
+)
+from custom_components.yan_tibber_client.api.optimizer import BatteryParameters, optimize_battery
+from test.tibber_stub import load_fixture
+
+
+def recorded_prices() -> np.ndarray:
+    data = load_fixture('price_info.json')
+    price_info = data['data']['viewer']['homes'][0]['currentSubscription']['priceInfo']
+    return np.array([x['total'] for x in price_info['today'] + price_info['tomorrow']])
+
+
+def make_series(days: int, seed: int = 1) -> PriceSeries:
+    """Hourly prices of the recorded days with noise, starting at local midnight (UTC+1)."""
+    rng = np.random.default_rng(seed)
+    recorded = recorded_prices()
+    n = days * 24
+    prices = np.resize(recorded, n) * rng.uniform(0.8, 1.2, n)
+    starts = np.datetime64('2023-12-31T23:00:00', 's') + np.arange(n) * np.timedelta64(3600, 's')
+    return PriceSeries(starts, np.full(n, 3600, dtype=np.int32), prices, np.zeros(n, dtype=np.int8))
+
+
+class TestBacktest(TestCase):
+    BATTERY = BatteryParameters(10, 5, 5)
+
+    def test_split_days(self):
+        days = split_days(make_series(3))
+        self.assertEqual([24, 24, 24], [len(x) for x in days])
+        self.assertEqual([], split_days(PriceSeries.empty()))
+
+    def test_loading_levels_follow_the_marks(self):
+        prices = np.array([0.2, 0.1, 0.4, 0.3])
+        config = BacktestConfig(20, BatteryParameters(4, 2, 2, efficiency=1.0))
+        result = backtest([prices], config)
+        # charged 2 kWh at 0.2 and 0.1, discharged 2 kWh at 0.4 and 0.3
+        self.assertAlmostEqual(4, result.charged)
+        self.assertAlmostEqual(4, result.discharged)
+        self.assertAlmostEqual(0.6, result.cost)
+        self.assertAlmostEqual(1.4, result.value)
+        self.assertAlmostEqual(0.8, result.savings)
+        self.assertAlmostEqual(0.35 - 0.15, result.spread)
+
+    def test_marks_match_determine_loading_levels(self):
+        series = make_series(1)
+        api = TibberApi('token', 20, None)
+        api.determine_loading_levels(series)
+        config = BacktestConfig(20, BatteryParameters(100, 1, 1, efficiency=1.0))
+        result = backtest(split_days(series), config)
+        loads = series.loading_levels == PriceSeries.LOADING_CODES[LoadingLevel.LOAD_FROM_NET]
+        # 1 kWh per marked slot
+        self.assertAlmostEqual(float(loads.sum()), result.charged)
+        self.assertAlmostEqual(float(series.prices[loads].sum()), result.cost)
+
+    def test_optimizer_is_the_upper_bound(self):
+        days = split_days(make_series(5))
+        optimal = backtest(days, BacktestConfig(0, self.BATTERY, Strategy.OPTIMIZER))
+        self.assertAlmostEqual(optimize_battery(days[0], self.BATTERY).savings,
+                               backtest(days[:1], BacktestConfig(0, self.BATTERY, Strategy.OPTIMIZER)).savings)
+        for perc in (0, 10, 20, 40):
+            self.assertLessEqual(backtest(days, BacktestConfig(perc, self.BATTERY)).savings, optimal.savings + 1e-9)
+
+    def test_higher_threshold_widens_the_spread(self):
+        days = split_days(make_series(30))
+        results = [backtest(days, BacktestConfig(perc, self.BATTERY)) for perc in (5, 20, 60)]
+        spreads = [x.spread for x in results]
+        self.assertEqual(sorted(spreads), spreads)
+        self.assertEqual(30, results[0].days)
+
+    def test_parallel_matches_serial(self):
+        series = make_series(4)
+        configs = parameter_grid([10, 20, 30], [self.BATTERY, BatteryParameters(5, 2, 2)],
+                                 (Strategy.LOADING_LEVELS, Strategy.OPTIMIZER))
+        self.assertEqual(12, len(configs))
+        serial = run_backtests(series, configs, max_workers=1)
+        parallel = run_backtests(series, configs, max_workers=2)
+        self.assertEqual([x.savings for x in serial], [x.savings for x in parallel])
+        self.assertEqual([str(x) for x in configs], [str(x.config) for x in parallel])
+
+    def test_year_times_50_configs(self):
+        series = make_series(365)
+        batteries = [BatteryParameters(capacity, power, power) for capacity in (5, 10, 15, 20, 30) for power in (3, 5)]
+        configs = parameter_grid([5, 10, 20, 30, 40], batteries)
+        self.assertEqual(50, len(configs))
+        start = time.perf_counter()
+        results = run_backtests(series, configs)
+        elapsed = time.perf_counter() - start
+        print(f"365 days x 50 configurations in {elapsed:.2f} s")
+        self.assertEqual(365, results[0].days)
+        self.assertLess(elapsed, 10)
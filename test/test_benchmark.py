@@ -0,0 +1,136 @@
+"""Timing of the stages of TibberPricesSensor.update, guarded by stored baselines.
+
+Run ``BENCHMARK_SAVE=1 pytest test/test_benchmark.py`` to record new baselines.
+A stage fails if it gets slower than BENCHMARK_TOLERANCE (default 3) times its baseline
+plus SLACK, which keeps the microsecond stages from flaking on a busy machine.
+"""
+from datetime import datetime, timedelta
+import json
+import os
+import timeit
+from unittest import TestCase
+
+import pytz
+
+from custom_components.yan_tibber_client.api import formatting
+from custom_components.yan_tibber_client.api.api import Statistics, TibberApi, json_loads
+from custom_components.yan_tibber_client.api.decode import decode_price_series, price_series_of
+from test.tibber_stub import FIXTURES_DIR, load_fixture
+
+BASELINE_FILE = FIXTURES_DIR / "benchmark_baseline.json"
+TOLERANCE = float(os.environ.get("BENCHMARK_TOLERANCE", 3))
+SLACK = 1e-4
+
+
+def make_price_info(n_slots: int) -> []:
+    """Build n_slots priceInfo entries from the recorded fixture, quarter-hourly above 24 slots."""
+    data = load_fixture("price_info.json")
+    price_info = data["data"]["viewer"]["homes"][0]["currentSubscription"]["priceInfo"]
+    recorded = price_info["today"] + price_info["tomorrow"]
+    step = timedelta(hours=1) if n_slots <= 24 else timedelta(minutes=15)
+    slots_per_hour = timedelta(hours=1) // step
+    start = datetime.fromisoformat(recorded[0]["startsAt"])
+
+    res = []
+    for i in range(n_slots):
+        x = recorded[(i // slots_per_hour) % len(recorded)]
+        res.append(
+            {
+                "total": round(x["total"] + 0.001 * (i % slots_per_hour), 4),
+                "startsAt": (start + i * step).isoformat(timespec="milliseconds"),
+                "level": x["level"],
+            }
+        )
+    return res
+
+
+class TestBenchmark(TestCase):
+    DEFAULT_TIME_ZONE = pytz.timezone('Europe/Berlin')
+    PERC_LOSS_LOAD_UNLOAD = 20
+
+    @classmethod
+    def setUpClass(cls):
+        cls.api = TibberApi('token', cls.PERC_LOSS_LOAD_UNLOAD, cls.DEFAULT_TIME_ZONE)
+        cls.measured = {}
+        with open(BASELINE_FILE, encoding="utf-8") as f:
+            cls.baseline = json.load(f)
+
+    @classmethod
+    def tearDownClass(cls):
+        if os.environ.get("BENCHMARK_SAVE"):
+            with open(BASELINE_FILE, "w", encoding="utf-8") as f:
+                json.dump(cls.measured, f, indent=2, sort_keys=True)
+
+    @staticmethod
+    def _time(fn) -> float:
+        """Best time of a single call in seconds, about 10 ms per run."""
+        timer = timeit.Timer(fn)
+        number = max(1, int(0.01 / max(timer.timeit(1), 1e-7)))
+        return min(timer.repeat(repeat=5, number=number)) / number
+
+    def _stages(self, n_slots: int) -> dict:
+        api = self.api
+        tz = self.DEFAULT_TIME_ZONE
+        payload = json.dumps(make_price_info(n_slots)).encode("utf-8")
+        series = api.convert_to_series(json.loads(payload))
+        api.mark_extrema(series)
+        api.determine_loading_levels(series)
+        stats = Statistics(series)
+
+        return {
+            "parse": lambda: api.convert_to_series(json.loads(payload)),
+            "extrema": lambda: (api.mark_extrema(series), api.relative_extrema(series)),
+            "statistics": lambda: Statistics(series),
+            "loading_levels": lambda: api.determine_loading_levels(series),
+            "format": lambda: (
+                formatting.convert_to_json_list(series, tz),
+                formatting.statistics_to_json(stats, tz),
+            ),
+        }
+
+    def _check(self, n_slots: int):
+        measured = self.measured.setdefault(str(n_slots), {})
+        for stage, fn in self._stages(n_slots).items():
+            measured[stage] = self._time(fn)
+            print(f"{n_slots:>6} slots {stage:<15} {measured[stage] * 1e6:10.1f} µs")
+
+        if os.environ.get("BENCHMARK_SAVE"):
+            return
+        for stage, seconds in measured.items():
+            with self.subTest(stage=stage):
+                limit = self.baseline[str(n_slots)][stage] * TOLERANCE + SLACK
+                self.assertLessEqual(seconds, limit, f"{stage} regressed at {n_slots} slots")
+
+    def test_make_price_info(self):
+        self.assertEqual(96, len(self.api.convert_to_series(make_price_info(96))))
+
+    def test_24_slots(self):
+        self._check(24)
+
+    def test_96_slots(self):
+        self._check(96)
+
+    def test_192_slots(self):
+        self._check(192)
+
+    def test_10k_slots(self):
+        self._check(10_000)
+
+    def test_decode_response(self):
+        """Columnar decode of a 10k slot response, reported next to the dicts of the JSON decoder."""
+        data = load_fixture("price_info.json")
+        home = data["data"]["viewer"]["homes"][0]
+        home["currentSubscription"]["priceInfo"].update(today=make_price_info(10_000), tomorrow=[])
+        body = json.dumps(data).encode("utf-8")
+        measured = self.measured.setdefault("decode", {})
+        measured["dicts"] = self._time(lambda: price_series_of(TibberApi.homes_from_response(json_loads(body))))
+        measured["columnar"] = self._time(lambda: decode_price_series(body))
+        for path, seconds in measured.items():
+            print(f" 10000 slots decode {path:<9} {seconds * 1e6:10.1f} µs")
+
+        if os.environ.get("BENCHMARK_SAVE"):
+            return
+        for path, seconds in measured.items():
+            with self.subTest(path=path):
+                limit = self.baseline["decode"][path] * TOLERANCE + SLACK
+                self.assertLessEqual(seconds, limit, f"decode {path} regressed")
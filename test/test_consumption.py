@@ -0,0 +1,178 @@
+import base64
+from datetime import datetime, timedelta
+import re
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+import numpy as np
+import pytz
+
+from custom_components.yan_tibber_client.api.api import PriceSeries, TibberApi
+from custom_components.yan_tibber_client.api.consumption import (
+    ConsumptionError,
+    ConsumptionFetcher,
+    ConsumptionPage,
+    CostAccumulator,
+)
+from test.tibber_stub import TibberStubServer
+
+HOME_ID = '96a14971-525a-4420-aae9-e5aedaa129ff'
+TIME_ZONE = pytz.timezone('Europe/Berlin')
+START = TIME_ZONE.localize(datetime(2024, 1, 1))
+HOURS = 24 * 70
+
+
+def hour(i: int) -> datetime:
+    return TIME_ZONE.normalize(START + timedelta(hours=i))
+
+
+def price(i: int) -> float:
+    # cheap nights, expensive evenings
+    return 0.2 + 0.1 * (hour(i).hour >= 17)
+
+
+def consumption(i: int) -> float:
+    return 2.0 if hour(i).hour < 6 else 0.5
+
+
+NODES = [
+    {
+        'from': hour(i).isoformat(),
+        'to': hour(i + 1).isoformat(),
+        'consumption': consumption(i),
+        'cost': consumption(i) * price(i),
+        'unitPrice': price(i),
+    }
+    for i in range(HOURS)
+]
+
+
+def consumption_response(request: dict, headers: dict) -> dict:
+    """Pages of NODES starting at the cursor, like the Tibber consumption connection."""
+    query = request['query']
+    if HOME_ID not in query:
+        return {'errors': [{'message': 'home not found'}], 'data': None}
+    first = int(re.search(r'first: (\d+)', query).group(1))
+    cursor = datetime.fromisoformat(base64.b64decode(re.search(r'after: "([^"]*)"', query).group(1)).decode())
+    nodes = [x for x in NODES if datetime.fromisoformat(x['from']) >= cursor][:first]
+    end_cursor = base64.b64encode(nodes[-1]['to'].encode()).decode() if nodes else None
+    return {'data': {'viewer': {'home': {'consumption': {
+        'pageInfo': {'endCursor': end_cursor, 'hasNextPage': bool(nodes) and nodes[-1] is not NODES[-1]},
+        'nodes': nodes,
+    }}}}}
+
+
+def stored_prices(hours: int = HOURS) -> PriceSeries:
+    starts = np.array([int(hour(i).timestamp()) for i in range(hours)], dtype='datetime64[s]')
+    return PriceSeries(
+        starts,
+        np.full(hours, 3600, dtype=np.int32),
+        np.array([price(i) for i in range(hours)]),
+        np.zeros(hours, dtype=np.int8),
+    )
+
+
+class TestConsumptionFetcher(TestCase):
+
+    def setUp(self):
+        self.server = TibberStubServer(consumption_response).start()
+        self.api = TibberApi('token', 20, TIME_ZONE, url=self.server.url)
+
+    def tearDown(self):
+        self.api.close()
+        self.server.stop()
+
+    def test_pages(self):
+        fetcher = ConsumptionFetcher(self.api, HOME_ID, page_size=100)
+        pages = list(fetcher.pages(hour(10), hour(510)))
+        self.assertEqual([100] * 5, [len(x) for x in pages])
+        self.assertEqual(5, len(self.server.requests))
+        starts = np.concatenate([x.starts for x in pages])
+        self.assertEqual(int(hour(10).timestamp()), int(starts[0].astype(np.int64)))
+        self.assertTrue((np.diff(starts) == np.timedelta64(3600, 's')).all())
+        self.assertIn('consumption(resolution: HOURLY, first: 100', self.server.requests[0]['body']['query'])
+
+    def test_pages_until_the_last_node(self):
+        fetcher = ConsumptionFetcher(self.api, HOME_ID, page_size=1000)
+        self.assertEqual(HOURS - 24, sum(len(x) for x in fetcher.pages(hour(24))))
+        self.assertEqual(2, len(self.server.requests))
+
+    def test_unknown_home(self):
+        fetcher = ConsumptionFetcher(self.api, 'unknown')
+        with self.assertRaises(ConsumptionError):
+            next(fetcher.pages(START))
+
+
+class TestConsumptionFetcherAsync(IsolatedAsyncioTestCase):
+
+    async def test_async_pages_match_blocking(self):
+        with TibberStubServer(consumption_response) as server:
+            api = TibberApi('token', 20, TIME_ZONE, url=server.url)
+            fetcher = ConsumptionFetcher(api, HOME_ID, page_size=200)
+            pages = [x async for x in fetcher.async_pages(START, hour(24 * 31))]
+            expected = list(fetcher.pages(START, hour(24 * 31)))
+            await api.async_close()
+            api.close()
+        self.assertEqual([len(x) for x in expected], [len(x) for x in pages])
+        np.testing.assert_array_equal(np.concatenate([x.consumption for x in expected]),
+                                      np.concatenate([x.consumption for x in pages]))
+
+
+class TestCostAccumulator(TestCase):
+
+    def _page(self, hours: int = HOURS) -> ConsumptionPage:
+        return ConsumptionPage.from_connection({'nodes': NODES[:hours]})
+
+    def test_by_month(self):
+        accumulator = CostAccumulator(stored_prices())
+        page = self._page()
+        for i in range(0, HOURS, 100):
+            accumulator.add(page.take(slice(i, i + 100)))
+        months = accumulator.by_month()
+        self.assertEqual(['2024-01', '2024-02', '2024-03'], list(months))
+        january = months['2024-01']
+        self.assertEqual(31 * 24, january.slots)
+        self.assertAlmostEqual(31 * (6 * 2.0 + 18 * 0.5), january.energy)
+        self.assertAlmostEqual(january.reported_cost, january.cost)
+        # the load is in the cheap night, so it costs less than at the average price
+        self.assertGreater(january.savings, 0)
+        self.assertAlmostEqual(january.average_price_cost - january.cost, january.savings)
+        total = accumulator.total()
+        self.assertAlmostEqual(sum(x.energy for x in months.values()), total.energy)
+        self.assertAlmostEqual(sum(x.cost for x in months.values()), total.cost)
+
+    def test_flat_consumption_saves_nothing(self):
+        nodes = [{**x, 'consumption': 1.0} for x in NODES[:48]]
+        accumulator = CostAccumulator(stored_prices())
+        accumulator.add(ConsumptionPage.from_connection({'nodes': nodes}))
+        self.assertAlmostEqual(0, accumulator.total().savings)
+
+    def test_unit_price_fallback_and_missing_values(self):
+        nodes = [dict(x) for x in NODES[:48]]
+        nodes[-1]['consumption'] = None
+        nodes[-1]['cost'] = None
+        nodes[-2]['unitPrice'] = None
+        # stored prices only for the first day, Tibber's unit price for the second
+        accumulator = CostAccumulator(stored_prices(24))
+        page = ConsumptionPage.from_connection({'nodes': nodes})
+        prices = accumulator.prices_of(page)
+        np.testing.assert_allclose([price(i) for i in range(46)], prices[:46])
+        self.assertTrue(np.isnan(prices[46]))
+        accumulator.add(page)
+        total = accumulator.total()
+        self.assertEqual(46, total.slots)
+        self.assertAlmostEqual(sum(consumption(i) for i in range(47)), total.energy)
+        self.assertAlmostEqual(sum(consumption(i) for i in range(46)), total.priced_energy)
+
+    def test_daily_nodes_average_the_slots(self):
+        nodes = [{'from': hour(0).isoformat(), 'to': hour(24).isoformat(),
+                  'consumption': 10.0, 'cost': None, 'unitPrice': None}]
+        accumulator = CostAccumulator(stored_prices(24))
+        prices = accumulator.prices_of(ConsumptionPage.from_connection({'nodes': nodes}))
+        self.assertAlmostEqual(np.mean([price(i) for i in range(24)]), prices[0])
+
+    def test_empty(self):
+        accumulator = CostAccumulator()
+        accumulator.add(ConsumptionPage.from_connection({'nodes': []}))
+        self.assertEqual({}, accumulator.by_month())
+        self.assertIsNone(accumulator.total().average_price)
+        self.assertEqual(0, accumulator.total().savings)
@@ -0,0 +1,128 @@
+from datetime import datetime, time, timedelta, timezone
+import importlib.util
+import os
+import tempfile
+from unittest import IsolatedAsyncioTestCase, skipUnless
+from unittest.mock import patch
+
+from custom_components.yan_tibber_client.api import formatting
+from custom_components.yan_tibber_client.api.api import TibberApi
+from custom_components.yan_tibber_client.api.cache import PriceCache
+from custom_components.yan_tibber_client.api.scheduler import FetchScheduler
+from test.tibber_stub import TibberStubServer, load_fixture
+
+HAS_HOMEASSISTANT = importlib.util.find_spec('homeassistant') is not None
+if HAS_HOMEASSISTANT:
+    from homeassistant.core import HomeAssistant
+    from homeassistant.exceptions import PlatformNotReady
+    from homeassistant.util import dt as dt_util
+
+    from custom_components.yan_tibber_client.coordinator import TibberPriceCoordinator
+    from custom_components.yan_tibber_client.sensor import TibberCurrentPriceSensor, TibberTodayStatsSensor
+
+HOME_ID = '96a14971-525a-4420-aae9-e5aedaa129ff'
+
+
+def todays_response(time_zone, price_step: float = 0.0) -> dict:
+    """The recorded response moved to today and tomorrow, its prices raised by price_step."""
+    data = load_fixture('price_info.json')
+    price_info = data['data']['viewer']['homes'][0]['currentSubscription']['priceInfo']
+    midnight = datetime.combine(datetime.now(time_zone).date(), time(), tzinfo=time_zone)
+    for day, slots in enumerate((price_info['today'], price_info['tomorrow'])):
+        for hour, slot in enumerate(slots):
+            starts_at = midnight.astimezone(timezone.utc) + timedelta(days=day, hours=hour)
+            slot['startsAt'] = starts_at.astimezone(time_zone).isoformat(timespec='milliseconds')
+            slot['total'] = round(slot['total'] + price_step, 4)
+    price_info['current'] = dict(price_info['today'][0])
+    return data
+
+
+@skipUnless(HAS_HOMEASSISTANT, 'homeassistant is not installed')
+class TestPriceCoordinator(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.tmp_dir.name, 'price_cache')
+        self.time_zone = dt_util.get_time_zone('Europe/Berlin')
+        dt_util.set_default_time_zone(self.time_zone)
+        self.hass = HomeAssistant(self.tmp_dir.name)
+        self.server = TibberStubServer(todays_response(self.time_zone)).start()
+        self.api = TibberApi('token', 20, self.time_zone, url=self.server.url, cache_path=self.cache_path)
+        self.coordinator = TibberPriceCoordinator(self.hass, self.api)
+
+    async def asyncTearDown(self):
+        await self.coordinator.async_shutdown()
+        await self.api.async_close()
+        await self.hass.async_stop(force=True)
+        self.server.stop()
+        dt_util.set_default_time_zone(dt_util.UTC)
+        self.tmp_dir.cleanup()
+
+    async def _refresh_with_fetch(self):
+        """Refresh as if the scheduler was missing prices."""
+        with patch.object(FetchScheduler, 'needs_fetch', return_value=True):
+            await self.coordinator.async_refresh()
+
+    async def test_setup_from_cache(self):
+        PriceCache(self.cache_path).store(TibberApi.homes_from_response(todays_response(self.time_zone)))
+        await self.coordinator.async_setup()
+        self.assertEqual([], self.server.requests)
+        self.assertEqual([HOME_ID], [x.id for x in self.coordinator.homes])
+        self.assertEqual(24, len(self.coordinator.snapshot(HOME_ID).today.series))
+
+    async def test_setup_fetches_without_cache(self):
+        await self.coordinator.async_setup()
+        self.assertEqual(1, len(self.server.requests))
+        self.assertIsNotNone(self.coordinator.snapshot(HOME_ID))
+
+    async def test_failed_fetch_keeps_previous_data(self):
+        await self.coordinator.async_setup()
+        snapshot = self.coordinator.snapshot(HOME_ID)
+        self.server.status = 500
+        with self.assertLogs('custom_components.yan_tibber_client.api.api', level='ERROR'):
+            await self._refresh_with_fetch()
+        self.assertEqual(2, len(self.server.requests))
+        self.assertTrue(self.coordinator.last_update_success)
+        self.assertEqual(snapshot.current.price, self.coordinator.snapshot(HOME_ID).current.price)
+        self.assertIs(snapshot.today, self.coordinator.snapshot(HOME_ID).today)
+
+    async def test_graphql_error_response(self):
+        await self.coordinator.async_setup()
+        snapshot = self.coordinator.snapshot(HOME_ID)
+        # Tibber answers throttling with status 200
+        self.server.response = load_fixture('graphql_error.json')
+        with self.assertLogs('custom_components.yan_tibber_client.api.api', level='ERROR'):
+            await self._refresh_with_fetch()
+        self.assertTrue(self.coordinator.last_update_success)
+        self.assertIs(snapshot.today, self.coordinator.snapshot(HOME_ID).today)
+
+    async def test_graphql_error_without_previous_data(self):
+        self.server.response = load_fixture('graphql_error.json')
+        with self.assertLogs('custom_components.yan_tibber_client.api.api', level='ERROR'):
+            with self.assertRaises(PlatformNotReady):
+                await self.coordinator.async_setup()
+        self.assertFalse(self.coordinator.last_update_success)
+
+    async def test_entities_update_from_their_slice(self):
+        await self.coordinator.async_setup()
+        current = TibberCurrentPriceSensor(self.coordinator, HOME_ID, 'Current Price')
+        today = TibberTodayStatsSensor(self.coordinator, HOME_ID, 'Today Stats')
+        unknown = TibberCurrentPriceSensor(self.coordinator, 'unknown', 'Unknown')
+        self.assertEqual(
+            formatting.format_price(self.coordinator.snapshot(HOME_ID).current.price), current.native_value)
+        self.assertFalse(unknown.available)
+
+        for entity in (current, today, unknown):
+            self.coordinator.async_add_listener(entity._handle_coordinator_update)
+        self.server.response = todays_response(self.time_zone, price_step=0.1)
+        with patch.object(TibberCurrentPriceSensor, 'async_write_ha_state') as write_current, \
+                patch.object(TibberTodayStatsSensor, 'async_write_ha_state') as write_today:
+            await self._refresh_with_fetch()
+        snapshot = self.coordinator.snapshot(HOME_ID)
+        self.assertEqual(formatting.format_price(snapshot.current.price), current.native_value)
+        self.assertEqual(
+            formatting.statistics_to_json(snapshot.today.stats, self.time_zone)['avg_price'], today.native_value)
+        self.assertEqual(2, write_current.call_count)
+        write_today.assert_called_once()
+        self.assertTrue(current.available)
+        self.assertFalse(unknown.available)
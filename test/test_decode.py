@@ -0,0 +1,121 @@
+import copy
+import importlib.util
+import json
+from unittest import TestCase, skipUnless
+
+import pytz
+
+from custom_components.yan_tibber_client.api import api as api_module
+from custom_components.yan_tibber_client.api.api import TibberApi
+from custom_components.yan_tibber_client.api.decode import decode_price_series, price_series_of
+from test.tibber_stub import TibberStubServer, load_fixture
+
+TIME_ZONE = pytz.timezone('Europe/Berlin')
+
+
+def expected_series(data: dict) -> dict:
+    """The decoded series of the JSON decoder and PriceSeries.from_price_info."""
+    return price_series_of(TibberApi.homes_from_response(data))
+
+
+class SeriesAssertions:
+
+    def assertSameSeries(self, expected: dict, actual: dict):
+        self.assertEqual(list(expected), list(actual))
+        for home_id, days in expected.items():
+            self.assertEqual(list(days), list(actual[home_id]))
+            for key, series in days.items():
+                with self.subTest(home=home_id, day=key):
+                    other = actual[home_id][key]
+                    self.assertEqual(series.starts.tolist(), other.starts.tolist())
+                    self.assertEqual(series.offsets.tolist(), other.offsets.tolist())
+                    self.assertEqual(series.prices.tolist(), other.prices.tolist())
+                    self.assertEqual(series.levels.tolist(), other.levels.tolist())
+
+
+class TestDecode(SeriesAssertions, TestCase):
+
+    def test_same_as_json_decoder(self):
+        for fixture in ('price_info.json', 'price_info_homes.json'):
+            data = load_fixture(fixture)
+            for separators in (None, (',', ':')):
+                body = json.dumps(data, separators=separators, indent=2 if separators is None else None)
+                with self.subTest(fixture=fixture, compact=separators is not None):
+                    self.assertSameSeries(expected_series(data), decode_price_series(body.encode()))
+        self.assertEqual(2, len(decode_price_series(json.dumps(load_fixture('price_info_homes.json')))))
+
+    def test_offsets(self):
+        data = load_fixture('price_info.json')
+        today = data['data']['viewer']['homes'][0]['currentSubscription']['priceInfo']['today']
+        today[0]['startsAt'] = '2024-01-26T17:30:00.000-05:30'
+        today[1]['startsAt'] = '2024-01-27T01:00:00.000+02:00'
+        self.assertSameSeries(expected_series(data), decode_price_series(json.dumps(data)))
+        # a suffix of another width is parsed per value
+        today[2]['startsAt'] = '2024-01-27T01:00:00Z'
+        series = decode_price_series(json.dumps(data))['96a14971-525a-4420-aae9-e5aedaa129ff']['today']
+        self.assertEqual([-19800, 7200, 0], series.offsets[:3].tolist())
+        self.assertSameSeries(expected_series(data), decode_price_series(json.dumps(data)))
+
+    def test_falls_back_to_none(self):
+        data = load_fixture('price_info.json')
+        price_info = data['data']['viewer']['homes'][0]['currentSubscription']['priceInfo']
+
+        null_total = copy.deepcopy(data)
+        null_total['data']['viewer']['homes'][0]['currentSubscription']['priceInfo']['today'][3]['total'] = None
+        self.assertIsNone(decode_price_series(json.dumps(null_total)))
+
+        swapped = copy.deepcopy(data)
+        slot = swapped['data']['viewer']['homes'][0]['currentSubscription']['priceInfo']['tomorrow'][0]
+        slot['level'] = slot.pop('total')
+        self.assertIsNone(decode_price_series(json.dumps(swapped)))
+
+        self.assertIsNone(decode_price_series(json.dumps({'errors': [{'message': 'unauthorized'}]})))
+        # slots before any home id
+        self.assertIsNone(decode_price_series(json.dumps({'priceInfo': price_info})))
+
+    def test_home_without_subscription(self):
+        data = load_fixture('price_info_homes.json')
+        res = decode_price_series(json.dumps(data))
+        self.assertEqual([x['id'] for x in data['data']['viewer']['homes'][:2]], list(res))
+        self.assertSameSeries(expected_series(data), res)
+
+    @skipUnless(importlib.util.find_spec('orjson'), 'orjson is not installed')
+    def test_orjson_when_installed(self):
+        import orjson
+        self.assertIs(orjson.loads, api_module.json_loads)
+
+
+class TestCompressedTransfer(SeriesAssertions, TestCase):
+
+    def setUp(self):
+        self.server = TibberStubServer(load_fixture('price_info_homes.json')).start()
+        self.server.compress = True
+        self.api = TibberApi('token', 20, TIME_ZONE, url=self.server.url)
+
+    def tearDown(self):
+        self.api.close()
+        self.server.stop()
+
+    def test_gzip_response(self):
+        homes = self.api.get_homes_price_info()
+        self.assertEqual(2, len(homes))
+        self.assertIn('gzip', self.server.requests[0]['headers']['Accept-Encoding'])
+        compressed = self.server.sent_bytes
+        self.server.compress = False
+        self.api.get_homes_price_info()
+        self.assertLess(compressed * 4, self.server.sent_bytes - compressed)
+
+    def test_get_price_series(self):
+        expected = expected_series(load_fixture('price_info_homes.json'))
+        self.assertSameSeries(expected, self.api.get_price_series())
+        # another field order is read by the JSON decoder
+        for home in self.server.response['data']['viewer']['homes'][:2]:
+            for slot in home['currentSubscription']['priceInfo']['today']:
+                slot['total'] = slot.pop('total')
+        self.assertIsNone(decode_price_series(json.dumps(self.server.response)))
+        self.assertSameSeries(expected, self.api.get_price_series())
+
+        self.server.status = 400
+        with self.assertLogs('custom_components.yan_tibber_client.api.api', level='ERROR'):
+            self.assertEqual({}, self.api.get_price_series())
+
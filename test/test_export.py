@@ -0,0 +1,219 @@
+import contextlib
+import csv
+from datetime import datetime, timedelta
+import importlib.util
+import io
+import json
+import os
+import tempfile
+from unittest import TestCase, skipUnless
+from zoneinfo import ZoneInfo
+
+from custom_components.yan_tibber_client.api.api import HomePriceInfo, TibberApi
+from custom_components.yan_tibber_client.api.cli import main, run_daemon
+from custom_components.yan_tibber_client.api.export import (
+    COLUMNS,
+    CsvWriter,
+    ExportError,
+    JsonLinesWriter,
+    analyse_days,
+    format_of,
+    local_iso,
+    open_writer,
+    series_columns,
+)
+from custom_components.yan_tibber_client.api.history import PriceHistory
+from test.tibber_stub import FIXTURES_DIR, TibberStubServer, load_fixture
+
+HOME_ID = '96a14971-525a-4420-aae9-e5aedaa129ff'
+TIME_ZONE = ZoneInfo('Europe/Berlin')
+
+
+class ListWriter:
+
+    def __init__(self):
+        self.rows = []
+
+    def write(self, columns):
+        self.rows.extend(dict(zip(columns, x)) for x in zip(*columns.values()))
+
+
+class TestExport(TestCase):
+
+    def setUp(self):
+        data = load_fixture('price_info.json')
+        self.price_info = data['data']['viewer']['homes'][0]['currentSubscription']['priceInfo']
+        self.api = TibberApi('token', 20, TIME_ZONE)
+        self.series = self.api.convert_to_series(self.price_info['today'] + self.price_info['tomorrow'])
+
+    def test_series_columns(self):
+        day = self.api.with_loading_levels(self.api.with_extrema(self.series.days()[0]))
+        columns = series_columns(day, HOME_ID)
+        self.assertEqual(list(COLUMNS), list(columns))
+        self.assertEqual([x['startsAt'][:19] + '+01:00' for x in self.price_info['today']], columns['starts_at'])
+        self.assertEqual([x['total'] for x in self.price_info['today']], columns['price'])
+        self.assertEqual([x['level'] for x in self.price_info['today']], columns['level'])
+        self.assertEqual(1, columns['extrema_type'].count('MIN'))
+        self.assertEqual(
+            [x.loading_level.value if x.loading_level else None for x in day],
+            columns['loading_level'])
+
+    def test_local_iso(self):
+        series = self.series.take(slice(0, 2))
+        series.offsets[:] = [-19800, 7200]
+        self.assertEqual(['2024-01-26T17:30:00-05:30', '2024-01-27T02:00:00+02:00'], local_iso(series))
+
+    def test_days(self):
+        days = self.series.days()
+        self.assertEqual([24, 24], [len(x) for x in days])
+        self.assertEqual(self.series.starts_at(24), days[1].starts_at(0))
+        # analysed per day, like the today and tomorrow sensors
+        marked = list(analyse_days(self.api, [self.series]))
+        expected = self.api.with_loading_levels(self.api.with_extrema(days[1]))
+        self.assertEqual(expected.loading_levels.tolist(), marked[1].loading_levels.tolist())
+
+    def test_writers(self):
+        columns = series_columns(self.series.take(slice(0, 3)), HOME_ID)
+        out = io.StringIO()
+        writer = JsonLinesWriter(out)
+        writer.write(columns)
+        writer.write(columns)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(6, len(lines))
+        self.assertEqual({'home_id': HOME_ID, 'starts_at': '2024-01-27T00:00:00+01:00', 'price': 0.26,
+                          'level': 'NORMAL', 'loading_level': None, 'extrema_type': None}, json.loads(lines[0]))
+
+        out = io.StringIO()
+        writer = CsvWriter(out)
+        writer.write(columns)
+        writer.write(columns)
+        rows = list(csv.reader(io.StringIO(out.getvalue())))
+        self.assertEqual(list(COLUMNS), rows[0])
+        self.assertEqual(7, len(rows))
+        self.assertEqual('', rows[1][4])
+
+    def test_open_writer(self):
+        self.assertEqual('csv', format_of('out.csv'))
+        self.assertEqual('jsonl', format_of(None))
+        self.assertEqual('jsonl', format_of('out.txt'))
+        with self.assertRaises(ExportError):
+            open_writer('xml')
+        with self.assertRaises(ExportError):
+            open_writer('parquet')
+        columns = series_columns(self.series, HOME_ID)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'out.csv')
+            for _ in range(2):
+                writer = open_writer('csv', path)
+                writer.write(columns)
+                writer.close()
+            with open(path, encoding='utf-8') as f:
+                lines = f.read().splitlines()
+        # appended without a second header
+        self.assertEqual(1 + 2 * 48, len(lines))
+
+    @skipUnless(importlib.util.find_spec('pyarrow'), 'pyarrow is not installed')
+    def test_parquet(self):
+        import pyarrow.parquet as pq
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'out.parquet')
+            writer = open_writer('parquet', path)
+            for day in self.series.days():
+                writer.write(series_columns(day, HOME_ID))
+            writer.close()
+            table = pq.read_table(path)
+        self.assertEqual(48, table.num_rows)
+        self.assertEqual(list(COLUMNS), table.column_names)
+
+
+class TestCli(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.tmp_dir.name, name)
+
+    def test_prices_from_fixture(self):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            self.assertEqual(0, main(['prices', '--fixture', str(FIXTURES_DIR / 'price_info.json')]))
+        rows = [json.loads(x) for x in out.getvalue().splitlines()]
+        self.assertEqual(48, len(rows))
+        self.assertEqual('2024-01-28T23:00:00+01:00', rows[-1]['starts_at'])
+
+        path = self._path('prices.csv')
+        self.assertEqual(0, main(['--output', path, '--perc-loss', '10', 'prices', '--fixture',
+                                  str(FIXTURES_DIR / 'price_info_homes.json')]))
+        with open(path, encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(2, len({x['home_id'] for x in rows}))
+
+    def test_prices_needs_a_source(self):
+        with contextlib.redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+            main(['prices', '--token', ''])
+
+    def test_unavailable_format(self):
+        err = io.StringIO()
+        with contextlib.redirect_stderr(err):
+            code = main(['-f', 'parquet', 'prices', '--fixture', str(FIXTURES_DIR / 'price_info.json')])
+        self.assertEqual(1, code)
+        self.assertIn('Parquet', err.getvalue())
+
+    def test_history(self):
+        data = load_fixture('price_info.json')
+        price_info = data['data']['viewer']['homes'][0]['currentSubscription']['priceInfo']
+        db = self._path('history.db')
+        history = PriceHistory(db)
+        history.store([HomePriceInfo(HOME_ID, '', price_info), HomePriceInfo('other', '', price_info)])
+        history.close()
+        path = self._path('history.jsonl')
+        self.assertEqual(0, main(['-o', path, 'history', '--db', db, '--home', HOME_ID,
+                                  '--start', '2024-01-27', '--end', '2024-01-28', '--chunk-slots', '10']))
+        with open(path, encoding='utf-8') as f:
+            rows = [json.loads(x) for x in f]
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            main(['prices', '--fixture', str(FIXTURES_DIR / 'price_info.json')])
+        # the same marks as the analysis of the fetched days
+        self.assertEqual([json.loads(x) for x in out.getvalue().splitlines()], rows)
+
+        path = self._path('all.jsonl')
+        main(['-o', path, 'history', '--db', db, '--start', '2024-01-28', '--end', '2024-01-28'])
+        with open(path, encoding='utf-8') as f:
+            self.assertEqual(48, len(f.readlines()))
+
+    def test_daemon(self):
+        now = [datetime(2024, 1, 27, 14, 0, tzinfo=TIME_ZONE)]
+        wakeups = [datetime(2024, 1, 28, 0, 30, tzinfo=TIME_ZONE), datetime(2024, 1, 28, 12, 45, tzinfo=TIME_ZONE)]
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(timedelta(seconds=seconds))
+            now[0] = wakeups.pop(0)
+
+        writer = ListWriter()
+        with TibberStubServer() as server:
+            api = TibberApi('token', 20, TIME_ZONE, url=server.url)
+            run_daemon(api, writer, TIME_ZONE, clock=lambda: now[0], sleep=sleep, rounds=3)
+            api.close()
+        # today and tomorrow are written once, after midnight tomorrow is today and not written again
+        self.assertEqual(48, len(writer.rows))
+        self.assertEqual(2, len(server.requests))
+        # complete until tomorrow's publication, then before today's publication
+        self.assertEqual([timedelta(hours=22, minutes=45), timedelta(hours=12, minutes=15)], sleeps)
+
+    def test_daemon_survives_an_error_response(self):
+        now = datetime(2024, 1, 27, 14, 0, tzinfo=TIME_ZONE)
+        writer = ListWriter()
+        with TibberStubServer(load_fixture('graphql_error.json')) as server:
+            api = TibberApi('token', 20, TIME_ZONE, url=server.url)
+            with self.assertLogs('custom_components.yan_tibber_client.api.api', level='ERROR'):
+                run_daemon(api, writer, TIME_ZONE, clock=lambda: now, sleep=lambda _: None, rounds=2)
+            api.close()
+        self.assertEqual([], writer.rows)
+        # both rounds ran, the failed fetch is retried after the scheduler's backoff
+        self.assertEqual(1, len(server.requests))
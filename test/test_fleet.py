@@ -0,0 +1,181 @@
+import asyncio
+import copy
+from datetime import datetime, timedelta
+import gc
+import sys
+import time
+import types
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+import pytz
+
+from custom_components.yan_tibber_client.api.fleet import AccountResult, Fleet, RateLimiter
+from custom_components.yan_tibber_client.api.optimizer import BatteryParameters
+from test.tibber_stub import TibberStubServer, load_fixture
+
+TIME_ZONE = pytz.timezone('Europe/Berlin')
+# within the recorded fixture's today
+NOW = TIME_ZONE.localize(datetime(2024, 1, 27, 14, 0))
+
+
+def deep_size(obj) -> int:
+    """Bytes of the objects reachable from obj, each counted once, classes and modules left out."""
+    seen = set()
+    stack = [obj]
+    size = 0
+    while stack:
+        x = stack.pop()
+        if id(x) in seen or isinstance(x, (type, types.ModuleType, types.FunctionType)):
+            continue
+        seen.add(id(x))
+        size += sys.getsizeof(x)
+        stack.extend(gc.get_referents(x))
+    return size
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRateLimiter(TestCase):
+
+    def test_token_bucket(self):
+        clock = FakeClock()
+        limiter = RateLimiter(timedelta(seconds=10), burst=2, clock=clock)
+        self.assertEqual(0, limiter.delay())
+        asyncio.run(limiter.acquire())
+        asyncio.run(limiter.acquire())
+        self.assertAlmostEqual(10, limiter.delay())
+        clock.now = 4
+        self.assertAlmostEqual(6, limiter.delay())
+        clock.now = 100
+        # refilled up to the burst only
+        asyncio.run(limiter.acquire())
+        asyncio.run(limiter.acquire())
+        self.assertAlmostEqual(10, limiter.delay())
+
+    def test_no_limit(self):
+        limiter = RateLimiter(timedelta(0))
+        for _ in range(10):
+            asyncio.run(limiter.acquire())
+        self.assertEqual(0, limiter.delay())
+
+
+class TestFleet(IsolatedAsyncioTestCase):
+
+    def _fleet(self, server: TibberStubServer, n: int, **kwargs) -> Fleet:
+        kwargs.setdefault('min_request_interval', timedelta(0))
+        kwargs.setdefault('jitter', timedelta(0))
+        kwargs.setdefault('clock', lambda: NOW)
+        return Fleet({f'account{i}': f'token{i}' for i in range(n)}, 20, TIME_ZONE, url=server.url, **kwargs)
+
+    async def test_poll(self):
+        with TibberStubServer() as server:
+            fleet = self._fleet(server, 20, concurrency=4, battery=BatteryParameters(10, 5, 5))
+            server.delay = 0.02
+            results = await fleet.async_poll()
+            await fleet.async_close()
+        self.assertEqual([f'account{i}' for i in range(20)], list(results))
+        self.assertTrue(all(x.ok for x in results.values()))
+        self.assertEqual(20, len(server.requests))
+        self.assertEqual({f'token{i}' for i in range(20)}, {x['headers']['Authorization'] for x in server.requests})
+        self.assertLessEqual(server.max_in_flight, 4)
+        # at most one connection per request in flight
+        self.assertLessEqual(len(server.connections), 4)
+        snapshots = [x.snapshots['96a14971-525a-4420-aae9-e5aedaa129ff'] for x in results.values()]
+        # the same prices are analysed once for the whole fleet
+        self.assertTrue(all(x.today is snapshots[0].today for x in snapshots))
+        self.assertIsNotNone(snapshots[0].battery_plan)
+        self.assertIs(results, fleet.results)
+
+    async def test_failures_stay_with_their_account(self):
+        with TibberStubServer({'errors': [{'message': 'invalid token'}]}, status=400) as server:
+            fleet = self._fleet(server, 3)
+            results = await fleet.async_poll()
+            await fleet.async_close()
+        self.assertEqual(3, len(results))
+        self.assertTrue(all(not x.ok and x.snapshots == {} for x in results.values()))
+
+        fleet = Fleet({'a': 'token'}, 20, TIME_ZONE, url='http://127.0.0.1:9/gql',
+                      min_request_interval=timedelta(0), jitter=timedelta(0))
+        result = (await fleet.async_poll())['a']
+        await fleet.async_close()
+        self.assertIn('ClientConnectorError', result.error)
+
+    async def test_broken_account_among_healthy_ones(self):
+        recorded = load_fixture('price_info.json')
+        without_today = copy.deepcopy(recorded)
+        without_today['data']['viewer']['homes'][0]['currentSubscription']['priceInfo']['today'] = []
+        responses = {
+            'token1': without_today,
+            # an error reported with status 200
+            'token2': {'errors': [{'message': 'too many requests'}], 'data': None},
+        }
+
+        def respond(request, headers):
+            return responses.get(headers['Authorization'], recorded)
+
+        with TibberStubServer(respond) as server:
+            fleet = self._fleet(server, 4)
+            results = await fleet.async_poll()
+            await fleet.async_close()
+        self.assertEqual(['account0', 'account3'], [x for x, result in results.items() if result.ok])
+        self.assertEqual('no price info', results['account1'].error)
+        self.assertEqual('no price info', results['account2'].error)
+        self.assertEqual(1, len(results['account3'].snapshots))
+
+    async def test_rate_limit_per_token(self):
+        with TibberStubServer() as server:
+            fleet = self._fleet(server, 3, min_request_interval=timedelta(seconds=0.2))
+            start = time.monotonic()
+            await fleet.async_poll()
+            first = time.monotonic() - start
+            await fleet.async_poll()
+            elapsed = time.monotonic() - start
+            await fleet.async_close()
+        # the second round of every token waits for its interval, the tokens wait in parallel
+        self.assertLess(first, 0.2)
+        self.assertGreaterEqual(elapsed, 0.2)
+        self.assertLess(elapsed, 0.6)
+        self.assertEqual(6, len(server.requests))
+
+    async def test_jitter_spreads_the_requests(self):
+        with TibberStubServer() as server:
+            fleet = self._fleet(server, 10, jitter=timedelta(seconds=0.3), seed=1)
+            results = await fleet.async_poll()
+            await fleet.async_close()
+        fetched = sorted(x.fetched_at for x in results.values())
+        self.assertGreater((fetched[-1] - fetched[0]).total_seconds(), 0.1)
+
+    async def test_run(self):
+        rounds = []
+        with TibberStubServer() as server:
+            fleet = self._fleet(server, 2)
+            task = asyncio.create_task(fleet.async_run(timedelta(seconds=0.05), rounds.append))
+            while len(rounds) < 3:
+                await asyncio.sleep(0.01)
+            task.cancel()
+            await fleet.async_close()
+        self.assertTrue(all(len(x) == 2 for x in rounds))
+
+    async def test_thousand_accounts(self):
+        with TibberStubServer() as server:
+            fleet = self._fleet(server, 1000)
+            await fleet.async_poll()
+            footprint = deep_size(fleet.results)
+            start = time.perf_counter()
+            results = await fleet.async_poll()
+            elapsed = time.perf_counter() - start
+            await fleet.async_close()
+        print(f"1000 accounts in {elapsed:.2f} s, {footprint / 1000:.0f} bytes per account")
+        self.assertEqual(1000, sum(x.ok for x in results.values()))
+        self.assertIsInstance(results['account999'], AccountResult)
+        # the days are shared, an account holds little more than its snapshot
+        self.assertLess(footprint, 1000 * 8 * 1024)
+        # a round replaces the previous one, it does not add to it
+        self.assertLess(abs(deep_size(fleet.results) - footprint), footprint / 10)
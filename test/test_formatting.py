@@ -0,0 +1,97 @@
+from datetime import datetime
+import json
+from unittest import TestCase
+
+import numpy as np
+import pytz
+
+from custom_components.yan_tibber_client.api import formatting
+from custom_components.yan_tibber_client.api.api import LoadingLevel, Statistics, TibberApi
+from custom_components.yan_tibber_client.api.optimizer import BatteryParameters, optimize_battery
+from test.test_benchmark import make_price_info
+from test.tibber_stub import load_fixture
+
+
+class TestFormatting(TestCase):
+    DEFAULT_TIME_ZONE = pytz.timezone('Europe/Berlin')
+
+    def setUp(self):
+        data = load_fixture('price_info.json')
+        self.price_info = data['data']['viewer']['homes'][0]['currentSubscription']['priceInfo']
+        self.api = TibberApi('token', 20, self.DEFAULT_TIME_ZONE)
+
+    def _analysed(self, arr):
+        series = self.api.convert_to_series(arr)
+        self.api.mark_extrema(series)
+        self.api.determine_loading_levels(series)
+        return series
+
+    def test_hourly_data_to_json(self):
+        series = self._analysed(self.price_info['today'])
+        res = formatting.hourly_data_to_json(series[0], self.DEFAULT_TIME_ZONE)
+        self.assertEqual({'level': 'NORMAL', 'price': 26.0, 'starts_at': '2024-01-27T00:00:00+01:00'},
+                         {k: v for k, v in res.items() if k != 'loading_level'})
+
+    def test_compact_matches_list_format(self):
+        series = self._analysed(self.price_info['today'])
+        expected = formatting.convert_to_json_list(series, self.DEFAULT_TIME_ZONE)
+        compact = formatting.series_to_compact_json(series, self.DEFAULT_TIME_ZONE)
+        codes = formatting.compact_codes()
+
+        self.assertEqual(expected[0]['starts_at'], compact['base'])
+        self.assertEqual(list(range(0, 24 * 60, 60)), compact['offsets'])
+        self.assertEqual([x['price'] for x in expected], compact['prices'])
+        self.assertEqual([x['level'] for x in expected], [codes['levels'][x] for x in compact['levels']])
+        self.assertEqual([x.get('loading_level') for x in expected],
+                         [codes['loading_levels'][x] for x in compact['loading_levels']])
+        self.assertEqual([x.get('extrema_type') for x in expected],
+                         [codes['extrema_types'][x] for x in compact['extrema_types']])
+
+    def test_loading_level_indices(self):
+        series = self._analysed(self.price_info['today'])
+        indices = formatting.loading_level_indices_to_json(series, LoadingLevel.LOAD_FROM_NET)
+        self.assertEqual(
+            [x.starts_at for x in TibberApi.filter_loading_level(series, LoadingLevel.LOAD_FROM_NET)],
+            [series.starts_at(i) for i in indices],
+        )
+
+    def test_compact_is_smaller(self):
+        series = self._analysed(make_price_info(96))
+        full = json.dumps(formatting.convert_to_json_list(series, self.DEFAULT_TIME_ZONE))
+        compact = json.dumps(formatting.series_to_compact_json(series, self.DEFAULT_TIME_ZONE))
+        self.assertLess(len(compact) * 4, len(full))
+
+    def test_empty_series(self):
+        series = self.api.convert_to_series([])
+        self.assertIsNone(formatting.series_to_compact_json(series, self.DEFAULT_TIME_ZONE))
+
+    def test_battery_plan(self):
+        series = self.api.convert_to_series(self.price_info['today'])
+        plan = optimize_battery(series, BatteryParameters(10, 5, 5))
+        res = formatting.battery_plan_to_json(series, plan, self.DEFAULT_TIME_ZONE)
+        compact = formatting.battery_plan_to_compact_json(series, plan, self.DEFAULT_TIME_ZONE)
+        self.assertEqual(24, len(res))
+        self.assertEqual('2024-01-27T00:00:00+01:00', res[0]['starts_at'])
+        self.assertEqual(res[0]['starts_at'], compact['base'])
+        self.assertEqual({'CHARGE', 'HOLD', 'DISCHARGE'}, {x['action'] for x in res})
+        self.assertEqual([{1: 'CHARGE', 0: 'HOLD', -1: 'DISCHARGE'}[x] for x in compact['actions']],
+                         [x['action'] for x in res])
+        self.assertEqual([x['soc'] for x in res], compact['soc'])
+        json.dumps(compact)
+
+    def test_formatting_is_cached(self):
+        series = self._analysed(self.price_info['today'] + self.price_info['tomorrow'])
+        formatting.format_epoch.cache_clear()
+        formatting.convert_to_json_list(series, self.DEFAULT_TIME_ZONE)
+        formatting.convert_to_json_list(series.take(slice(30, None)), self.DEFAULT_TIME_ZONE)
+        formatting.statistics_to_json(Statistics(series), self.DEFAULT_TIME_ZONE)
+        info = formatting.format_epoch.cache_info()
+        # each of the 48 starts is converted once, the statistics only refer to slot starts
+        self.assertEqual(48, info.misses)
+        self.assertEqual(
+            [datetime.fromtimestamp(int(x), self.DEFAULT_TIME_ZONE).isoformat()
+             for x in series.starts.astype(np.int64)],
+            formatting.format_epochs(series.starts, self.DEFAULT_TIME_ZONE),
+        )
+        now = datetime(2024, 1, 27, 12, 30, 15, 123456, tzinfo=pytz.utc)
+        self.assertEqual('2024-01-27T13:30:15.123456+01:00', formatting.format_date(now, self.DEFAULT_TIME_ZONE))
@@ -0,0 +1,78 @@
+import subprocess
+import sys
+from unittest import TestCase
+
+import numpy as np
+
+from custom_components.yan_tibber_client.api.api import relative_extrema_indices
+
+MODULES = [
+    'custom_components.yan_tibber_client.api.analysis',
+    'custom_components.yan_tibber_client.api.formatting',
+    'custom_components.yan_tibber_client.api.history',
+    'custom_components.yan_tibber_client.api.live',
+    'custom_components.yan_tibber_client.api.scheduler',
+]
+
+IMPORT_SCRIPT = f"""
+import sys, time
+import aiohttp  # already loaded by Home Assistant
+start = time.perf_counter()
+for name in {MODULES!r}:
+    __import__(name)
+elapsed = time.perf_counter() - start
+loaded = sorted(x for x in ('numpy._core', 'numpy.core', 'scipy', 'requests.models') if x in sys.modules)
+from custom_components.yan_tibber_client.api.lazy import preload
+preload('numpy')
+print(elapsed, ','.join(loaded), 'numpy._core' in sys.modules or 'numpy.core' in sys.modules)
+"""
+
+ASYNC_FETCH_SCRIPT = """
+import asyncio, sys
+import pytz
+from custom_components.yan_tibber_client.api.api import TibberApi
+from test.tibber_stub import TibberStubServer
+
+async def fetch(url):
+    api = TibberApi('token', 20, pytz.timezone('Europe/Berlin'), url=url)
+    homes = await api.async_get_homes_price_info()
+    await api.async_close()
+    return homes
+
+with TibberStubServer() as server:
+    homes = asyncio.run(fetch(server.url))
+print(len(homes), 'requests.models' in sys.modules)
+"""
+
+
+def reference_extrema(prices, comparator) -> list[int]:
+    return [i for i in range(1, len(prices) - 1)
+            if comparator(prices[i], prices[i - 1]) and comparator(prices[i], prices[i + 1])]
+
+
+class TestLazyImports(TestCase):
+
+    def test_import_time(self):
+        out = subprocess.run([sys.executable, '-c', IMPORT_SCRIPT], capture_output=True, text=True,
+                             check=True).stdout.split()
+        elapsed, loaded, preloaded = float(out[0]), out[1] if len(out) == 3 else '', out[-1]
+        # nothing heavy is executed at import, only on first use
+        self.assertEqual('', loaded)
+        self.assertEqual('True', preloaded)
+        self.assertLess(elapsed, 0.1)
+
+    def test_async_fetch_does_not_import_requests(self):
+        out = subprocess.run([sys.executable, '-c', ASYNC_FETCH_SCRIPT], capture_output=True, text=True,
+                             check=True).stdout.split()
+        self.assertEqual(['1', 'False'], out)
+
+    def test_extrema_kernel(self):
+        rng = np.random.default_rng(3)
+        cases = [np.array([]), np.array([1.0]), np.array([1.0, 0.5]), np.array([2.0, 1.0, 1.0, 2.0]),
+                 np.array([1.0, 3.0, 3.0, 1.0, 0.0, 2.0])]
+        cases += [np.round(rng.normal(0.3, 0.1, n), 2) for n in (3, 24, 96, 192)]
+        for prices in cases:
+            for comparator in (np.less, np.greater):
+                with self.subTest(prices=prices.tolist(), comparator=comparator.__name__):
+                    self.assertEqual(reference_extrema(prices, comparator),
+                                     relative_extrema_indices(prices, comparator).tolist())
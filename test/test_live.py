@@ -0,0 +1,178 @@
+import asyncio
+from datetime import datetime, timedelta
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+import pytz
+
+from custom_components.yan_tibber_client.api.api import TibberApi
+from custom_components.yan_tibber_client.api.live import (
+    LiveMeasurementClient,
+    LiveReading,
+    PowerAggregator,
+    price_at,
+)
+from test.tibber_stub import LiveStubServer, TibberStubServer, load_fixture
+
+HOME_ID = '96a14971-525a-4420-aae9-e5aedaa129ff'
+START = datetime.fromisoformat('2024-01-27T13:58:00+01:00')
+
+
+def make_readings(n: int, power: float = 1200, step: timedelta = timedelta(seconds=2)) -> list[dict]:
+    return [
+        {'timestamp': (START + i * step).isoformat(), 'power': power, 'accumulatedConsumption': 0.5 + i * 0.001}
+        for i in range(n)
+    ]
+
+
+class TestLiveMeasurementClient(IsolatedAsyncioTestCase):
+
+    async def asyncTearDown(self):
+        await self.client.stop()
+        await self.server.stop()
+
+    async def _start(self, server: LiveStubServer, **kwargs) -> LiveMeasurementClient:
+        self.server = await server.start()
+        self.client = LiveMeasurementClient('token', HOME_ID, self.server.url,
+                                            min_backoff=timedelta(milliseconds=10), **kwargs)
+        self.client.start()
+        return self.client
+
+    async def _receive(self, n: int) -> list[LiveReading]:
+        return [await asyncio.wait_for(self.client.get(), 5) for _ in range(n)]
+
+    async def test_subscription(self):
+        await self._start(LiveStubServer(make_readings(5)))
+        readings = await self._receive(5)
+        self.assertEqual([START + timedelta(seconds=2 * i) for i in range(5)], [x.timestamp for x in readings])
+        self.assertEqual(1200, readings[0].power)
+        self.assertEqual(0.501, readings[1].accumulated_consumption)
+        self.assertEqual([{'token': 'token'}], self.server.init_payloads[:1])
+        self.assertIn(f'liveMeasurement(homeId: "{HOME_ID}")', self.server.queries[0])
+        self.assertEqual('graphql-transport-ws', self.server.protocols[0])
+
+    async def test_reconnect(self):
+        await self._start(LiveStubServer(make_readings(5), close_after=2))
+        readings = await self._receive(5)
+        self.assertEqual(5, len({x.timestamp for x in readings}))
+        self.assertEqual(3, self.client.connections)
+
+    async def test_slow_consumer_drops_oldest(self):
+        await self._start(LiveStubServer(make_readings(10)), queue_size=3)
+        for _ in range(100):
+            if self.client.dropped == 7:
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(7, self.client.dropped)
+        readings = await self._receive(3)
+        self.assertEqual([START + timedelta(seconds=2 * i) for i in range(7, 10)], [x.timestamp for x in readings])
+
+    async def test_refused_connection_is_retried(self):
+        with self.assertLogs('custom_components.yan_tibber_client.api.live', level='WARNING'):
+            await self._start(LiveStubServer(make_readings(1), ack=False))
+            for _ in range(100):
+                if len(self.server.init_payloads) >= 2:
+                    break
+                await asyncio.sleep(0.01)
+        self.assertGreaterEqual(len(self.server.init_payloads), 2)
+        self.assertEqual(0, self.client.connections)
+
+    async def test_malformed_frames_reconnect(self):
+        server = LiveStubServer(make_readings(3))
+        server.bad_frames = [
+            'not json',
+            '{"id": "1", "type": "next", "payload": {"data": null}}',
+            '{"id": "1", "type": "next", "payload": {"data": {}}}',
+            '{"id": "1", "type": "next", "payload": {"data": {"liveMeasurement": {"power": 5}}}}',
+        ]
+        with self.assertLogs('custom_components.yan_tibber_client.api.live', level='WARNING') as logs:
+            await self._start(server)
+            readings = await self._receive(3)
+        self.assertEqual([START + timedelta(seconds=2 * i) for i in range(3)], [x.timestamp for x in readings])
+        self.assertEqual(5, self.client.connections)
+        self.assertEqual(4, sum('Malformed' in x for x in logs.output))
+
+    async def test_readings_feed_the_aggregator(self):
+        await self._start(LiveStubServer(make_readings(61)))
+        aggregator = PowerAggregator(timedelta(minutes=1))
+        windows = []
+        async for reading in self.client.readings():
+            windows.extend(aggregator.add(reading))
+            if len(windows) == 2:
+                break
+        self.assertEqual([START, START + timedelta(minutes=1)], [x.start for x in windows])
+        self.assertAlmostEqual(0.02, windows[0].energy)
+
+
+class TestWebsocketUrl(IsolatedAsyncioTestCase):
+
+    async def test_websocket_url(self):
+        url = 'wss://websocket-api.tibber.com/v1-beta/gql/subscriptions'
+        with TibberStubServer({'data': {'viewer': {'websocketSubscriptionUrl': url}}}) as server:
+            api = TibberApi('token', 20, pytz.timezone('Europe/Berlin'), url=server.url)
+            self.assertEqual(url, await api.async_get_websocket_url())
+            await api.async_close()
+        self.assertIn('websocketSubscriptionUrl', server.requests[0]['body']['query'])
+
+
+class TestPowerAggregator(TestCase):
+
+    def setUp(self):
+        data = load_fixture('price_info.json')
+        price_info = data['data']['viewer']['homes'][0]['currentSubscription']['priceInfo']
+        self.series = TibberApi.convert_to_series(price_info['today'])
+        self.price_13 = price_info['today'][13]['total']
+        self.price_14 = price_info['today'][14]['total']
+
+    def _price_at(self, dt):
+        return price_at(self.series, dt, timedelta(hours=1))
+
+    @staticmethod
+    def _reading(seconds: float, power: float) -> LiveReading:
+        return LiveReading(START + timedelta(seconds=seconds), power)
+
+    def test_minute_windows(self):
+        aggregator = PowerAggregator(timedelta(minutes=1), self._price_at)
+        windows = []
+        for x in make_readings(3 * 30 + 1):
+            windows.extend(aggregator.add(LiveReading.from_payload(x)))
+        self.assertEqual(3, len(windows))
+        self.assertEqual([START + timedelta(minutes=i) for i in range(3)], [x.start for x in windows])
+        for window in windows:
+            self.assertEqual(30, window.readings)
+            self.assertAlmostEqual(0.02, window.energy)
+            self.assertAlmostEqual(1200, window.avg_power)
+        # the third minute is 14:00-14:01 with the next price
+        self.assertAlmostEqual(0.02 * self.price_13, windows[0].cost)
+        self.assertAlmostEqual(0.02 * self.price_14, windows[2].cost)
+        self.assertEqual(1, aggregator.current().readings)
+
+    def test_power_is_split_at_the_window_end(self):
+        aggregator = PowerAggregator(timedelta(minutes=1))
+        self.assertEqual([], aggregator.add(self._reading(50, 3600)))
+        self.assertEqual([], aggregator.add(self._reading(55, 7200)))
+        windows = aggregator.add(self._reading(65, 0))
+        self.assertEqual(1, len(windows))
+        # 5 s at 3600 W + 5 s at 7200 W
+        self.assertAlmostEqual(0.005 + 0.01, windows[0].energy)
+        self.assertAlmostEqual(5400, windows[0].avg_power)
+        self.assertEqual(7200, windows[0].max_power)
+        self.assertAlmostEqual(0.01, aggregator.current().energy)
+        self.assertIsNone(windows[0].cost)
+
+    def test_gap_and_out_of_order(self):
+        aggregator = PowerAggregator(timedelta(minutes=1), max_gap=timedelta(seconds=30))
+        aggregator.add(self._reading(0, 1000))
+        aggregator.add(self._reading(10, 1000))
+        self.assertEqual([], aggregator.add(self._reading(5, 5000)))
+        windows = aggregator.add(self._reading(600, 1000))
+        # no empty windows and no power held over the gap
+        self.assertEqual(1, len(windows))
+        self.assertAlmostEqual(1000 * 10 / 3_600_000, windows[0].energy)
+        self.assertEqual(START + timedelta(minutes=10), aggregator.current().start)
+        self.assertEqual(0, aggregator.current().energy)
+
+    def test_price_at(self):
+        self.assertEqual(self.price_13, self._price_at(START))
+        self.assertEqual(self.price_14, self._price_at(START + timedelta(minutes=2)))
+        self.assertIsNone(self._price_at(START + timedelta(days=1)))
+        self.assertIsNone(self._price_at(START - timedelta(days=1)))
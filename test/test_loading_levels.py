@@ -0,0 +1,81 @@
+from unittest import TestCase
+
+import numpy as np
+import pytz
+
+from custom_components.yan_tibber_client.api.api import LoadingLevel, PriceSeries, TibberApi
+from test.tibber_stub import load_fixture
+
+
+def reference_loading_levels(prices, perc_loss_load_unload) -> list:
+    """Pairwise O(n²) algorithm, the inner loop running up to and including the last slot."""
+    factor = 1.0 + perc_loss_load_unload / 100
+    res = [None] * len(prices)
+    for i in range(len(prices) - 1):
+        max_price = prices[i] * factor
+        found = False
+        for j in range(i + 1, len(prices)):
+            if prices[j] >= max_price:
+                found = True
+                res[j] = LoadingLevel.UNLOAD_BATTERY
+        if found:
+            res[i] = LoadingLevel.LOAD_FROM_NET
+    return res
+
+
+class TestLoadingLevels(TestCase):
+    DEFAULT_TIME_ZONE = pytz.timezone('Europe/Berlin')
+
+    @staticmethod
+    def _series(prices) -> PriceSeries:
+        n = len(prices)
+        return PriceSeries(
+            np.arange(n).astype('datetime64[h]').astype('datetime64[s]'),
+            np.zeros(n, dtype=np.int32),
+            np.asarray(prices, dtype=np.float64),
+            np.zeros(n, dtype=np.int8),
+        )
+
+    def _assert_reference(self, prices, perc):
+        api = TibberApi('token', perc, self.DEFAULT_TIME_ZONE)
+        series = self._series(prices)
+        api.determine_loading_levels(series)
+        self.assertEqual(
+            reference_loading_levels(list(series.prices), perc),
+            [x.loading_level for x in series],
+        )
+
+    def test_matches_reference_on_random_prices(self):
+        rng = np.random.default_rng(42)
+        for n in (0, 1, 2, 3, 24, 96, 192):
+            for perc in (0, 5, 20, 50):
+                prices = np.round(rng.normal(0.25, 0.08, n), 4)
+                self._assert_reference(prices, perc)
+
+    def test_matches_reference_with_negative_and_equal_prices(self):
+        self._assert_reference([0.1, -0.05, 0.0, -0.05, 0.2, 0.2], 20)
+        self._assert_reference([0.3] * 10, 0)
+        self._assert_reference([0.3] * 10, 20)
+
+    def test_matches_reference_on_fixture(self):
+        data = load_fixture('price_info.json')
+        price_info = data['data']['viewer']['homes'][0]['currentSubscription']['priceInfo']
+        prices = [x['total'] for x in price_info['today'] + price_info['tomorrow']]
+        self._assert_reference(prices, 20)
+
+    def test_last_slot_is_considered(self):
+        self._assert_reference([0.2, 0.21, 0.3], 20)
+        series = self._series([0.2, 0.21, 0.3])
+        TibberApi('token', 20, self.DEFAULT_TIME_ZONE).determine_loading_levels(series)
+        self.assertEqual(LoadingLevel.UNLOAD_BATTERY, series[2].loading_level)
+
+    def test_list_input(self):
+        data = load_fixture('price_info.json')
+        today = TibberApi.convert_to_list(
+            data['data']['viewer']['homes'][0]['currentSubscription']['priceInfo']['today']
+        )
+        TibberApi('token', 20, self.DEFAULT_TIME_ZONE).determine_loading_levels(today)
+        self.assertEqual(
+            reference_loading_levels([x.price for x in today], 20),
+            [x.loading_level for x in today],
+        )
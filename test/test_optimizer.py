@@ -0,0 +1,89 @@
+import itertools
+import time
+from unittest import TestCase
+
+import numpy as np
+
+from custom_components.yan_tibber_client.api.api import TibberApi
+from custom_components.yan_tibber_client.api.optimizer import (
+    BatteryAction,
+    BatteryParameters,
+    optimize_battery,
+)
+from test.test_benchmark import make_price_info
+
+
+def brute_force_savings(prices, params: BatteryParameters) -> float:
+    """Try every sequence of state of charge changes."""
+    step = params.capacity / params.soc_steps
+    eff = np.sqrt(params.efficiency)
+    max_up = int(params.max_charge_power / step + 1e-9)
+    max_down = int(params.max_discharge_power / step + 1e-9)
+    start = int(round(params.initial_soc / step))
+    best = 0.0
+    for deltas in itertools.product(range(-max_down, max_up + 1), repeat=len(prices)):
+        levels = start + np.cumsum(deltas)
+        if levels.min() < 0 or levels.max() > params.soc_steps or levels[-1] < start:
+            continue
+        grid = [d * step / eff if d > 0 else d * step * eff for d in deltas]
+        best = max(best, -float(np.dot(prices, grid)))
+    return best
+
+
+class TestOptimizer(TestCase):
+
+    def test_charge_cheap_discharge_expensive(self):
+        params = BatteryParameters(capacity=2, max_charge_power=2, max_discharge_power=2, efficiency=1.0, soc_steps=2)
+        plan = optimize_battery(np.array([0.30, 0.10, 0.40, 0.20]), params)
+        self.assertEqual(
+            [BatteryAction.HOLD, BatteryAction.CHARGE, BatteryAction.DISCHARGE, BatteryAction.HOLD],
+            [plan.action(i) for i in range(len(plan))],
+        )
+        self.assertAlmostEqual(2 * (0.40 - 0.10), plan.savings)
+        self.assertEqual([0, 2, 0, 0], plan.soc.tolist())
+
+    def test_losses_make_small_spreads_worthless(self):
+        params = BatteryParameters(capacity=2, max_charge_power=2, max_discharge_power=2, efficiency=0.8)
+        plan = optimize_battery(np.array([0.30, 0.33, 0.31]), params)
+        self.assertEqual([0, 0, 0], plan.actions.tolist())
+        self.assertEqual(0.0, plan.savings)
+
+    def test_matches_brute_force(self):
+        rng = np.random.default_rng(7)
+        for _ in range(20):
+            prices = np.round(rng.normal(0.25, 0.1, 6), 3)
+            params = BatteryParameters(capacity=4, max_charge_power=2, max_discharge_power=1,
+                                       efficiency=0.9, initial_soc=1, soc_steps=4)
+            plan = optimize_battery(prices, params)
+            self.assertAlmostEqual(brute_force_savings(prices, params), plan.savings)
+            self.assertGreaterEqual(plan.soc[-1], params.initial_soc)
+            self.assertTrue(((plan.soc >= 0) & (plan.soc <= params.capacity)).all())
+
+    def test_power_limits(self):
+        params = BatteryParameters(capacity=10, max_charge_power=2.5, max_discharge_power=5, efficiency=1.0)
+        plan = optimize_battery(np.array([0.1] * 4 + [0.5] * 2), params)
+        self.assertLessEqual(plan.grid_energy.max(), 2.5 + 1e-9)
+        self.assertGreaterEqual(plan.grid_energy.min(), -5 - 1e-9)
+        self.assertAlmostEqual(10 * 0.4, plan.savings)
+
+    def test_efficiency_out_of_range(self):
+        for efficiency in (0, -0.1, 1.1):
+            with self.subTest(efficiency=efficiency), self.assertRaises(ValueError):
+                BatteryParameters(capacity=10, max_charge_power=5, max_discharge_power=5, efficiency=efficiency)
+        self.assertEqual(1, BatteryParameters(10, 5, 5, efficiency=1).efficiency)
+
+    def test_quarter_hour_slots_and_series_input(self):
+        series = TibberApi.convert_to_series(make_price_info(192))
+        # the sensor's default, the power is the capacity per hour
+        params = BatteryParameters(capacity=10, max_charge_power=10, max_discharge_power=10, min_soc=1, initial_soc=5)
+        for slot_hours in (0.25, 1.0):
+            start = time.perf_counter()
+            plan = optimize_battery(series, params, slot_hours=slot_hours)
+            elapsed = time.perf_counter() - start
+            with self.subTest(slot_hours=slot_hours):
+                self.assertEqual(192, len(plan))
+                self.assertLessEqual(np.abs(plan.grid_energy).max(), 10 * slot_hours / np.sqrt(0.9) + 1e-9)
+                self.assertGreaterEqual(plan.soc.min(), 1 - 1e-9)
+                self.assertGreater(plan.savings, 0)
+                self.assertLess(elapsed, 0.1)
+            print(f"192 slots of {slot_hours} h optimized in {elapsed * 1000:.1f} ms")
@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+import numpy as np
+import pytz
+
+from custom_components.yan_tibber_client.api import formatting
+from custom_components.yan_tibber_client.api.analysis import PriceAnalyzer
+from custom_components.yan_tibber_client.api.api import HomePriceInfo, PriceSeries, Resolution, TibberApi
+from test.test_benchmark import make_price_info
+from test.tibber_stub import load_fixture
+
+
+class TestPriceBlocks(TestCase):
+    DEFAULT_TIME_ZONE = pytz.timezone('Europe/Berlin')
+
+    def setUp(self):
+        data = load_fixture('price_info.json')
+        self.price_info = data['data']['viewer']['homes'][0]['currentSubscription']['priceInfo']
+        self.api = TibberApi('token', 20, self.DEFAULT_TIME_ZONE)
+        self.series = self.api.convert_to_series(self.price_info['today'] + self.price_info['tomorrow'])
+        self.blocks = self.api.price_blocks(self.series)
+
+    def _brute_force(self, k, lo=0, hi=None, cheapest=True):
+        prices = self.series.prices.tolist()
+        hi = len(prices) - k + 1 if hi is None else hi
+        averages = [sum(prices[i:i + k]) / k for i in range(lo, hi)]
+        best = min(averages) if cheapest else max(averages)
+        return lo + averages.index(best), best
+
+    def test_matches_brute_force(self):
+        for k in (1, 2, 3, 5, 24, 48):
+            with self.subTest(k=k):
+                cheapest = self.blocks.cheapest(k)
+                start, avg = self._brute_force(k)
+                self.assertEqual(self.series.starts_at(start), cheapest.start)
+                self.assertEqual(cheapest.start + timedelta(hours=k), cheapest.end)
+                self.assertAlmostEqual(avg, cheapest.avg_price)
+                self.assertEqual(k, cheapest.slots)
+                start, avg = self._brute_force(k, cheapest=False)
+                self.assertAlmostEqual(avg, self.blocks.most_expensive(k).avg_price)
+                self.assertEqual(self.series.starts_at(start), self.blocks.most_expensive(k).start)
+        self.assertIsNone(self.blocks.cheapest(49))
+        self.assertIsNone(self.blocks.cheapest(0))
+
+    def test_earliest_and_deadline(self):
+        earliest = self.series.starts_at(10) + timedelta(minutes=30)
+        deadline = self.series.starts_at(30)
+        block = self.blocks.cheapest(3, earliest, deadline)
+        # slot 10 is running at earliest, the last block ends with slot 29
+        start, avg = self._brute_force(3, 10, 28)
+        self.assertEqual(self.series.starts_at(start), block.start)
+        self.assertAlmostEqual(avg, block.avg_price)
+        self.assertLessEqual(block.end, deadline)
+        self.assertIsNone(self.blocks.cheapest(3, earliest, self.series.starts_at(12)))
+        self.assertEqual(self.series.starts_at(10), self.blocks.cheapest(2, earliest, self.series.starts_at(12)).start)
+        # deadlines too early for the block, also before the first slot
+        start = self.series.starts_at(0)
+        for deadline in (start + timedelta(hours=1), start + timedelta(hours=2), start - timedelta(hours=5)):
+            with self.subTest(deadline=deadline):
+                self.assertIsNone(self.blocks.cheapest(3, deadline=deadline))
+                self.assertIsNone(self.blocks.most_expensive(3, deadline=deadline))
+        self.assertEqual(start, self.blocks.cheapest(3, deadline=start + timedelta(hours=3)).start)
+
+    def test_blocks_do_not_span_gaps(self):
+        series = PriceSeries.concat(self.series.take(slice(0, 4)), self.series.take(slice(6, 10)))
+        blocks = self.api.price_blocks(series)
+        self.assertEqual(6, len(blocks.averages(3)))
+        self.assertEqual(2, np.isnan(blocks.averages(3)).sum())
+        self.assertIsNone(blocks.cheapest(5))
+        self.assertEqual(4, blocks.cheapest(4).slots)
+
+    def test_many_durations(self):
+        durations = [timedelta(hours=2), timedelta(hours=3), timedelta(hours=4, minutes=30)]
+        res = self.blocks.cheapest_blocks(durations)
+        self.assertEqual([2, 3, 5], [x.slots for x in res.values()])
+        self.assertEqual(self.blocks.cheapest(5).start, res[durations[2]].start)
+        attributes = formatting.blocks_to_json(res, self.DEFAULT_TIME_ZONE)
+        self.assertEqual(['2h', '3h', '4.5h'], list(attributes))
+        self.assertEqual({'start', 'end', 'avg_price', 'slots'}, set(attributes['2h']))
+        self.assertEqual({'1h': None}, formatting.blocks_to_json({timedelta(hours=1): None}, self.DEFAULT_TIME_ZONE))
+
+    def test_quarter_hourly(self):
+        api = TibberApi('token', 20, self.DEFAULT_TIME_ZONE, resolution=Resolution.QUARTER_HOURLY)
+        blocks = api.price_blocks(api.convert_to_series(make_price_info(192)))
+        self.assertEqual(8, blocks.slots_for(timedelta(hours=2)))
+        block = blocks.cheapest_blocks([timedelta(hours=2)])[timedelta(hours=2)]
+        self.assertEqual(timedelta(hours=2), block.end - block.start)
+
+    def test_snapshot_shares_the_blocks(self):
+        analyzer = PriceAnalyzer(self.api)
+        now = self.DEFAULT_TIME_ZONE.localize(datetime(2024, 1, 27, 13, 30))
+        home = HomePriceInfo('home', 'address', self.api.align_price_info(self.price_info, now))
+        first = analyzer.snapshots({'home': home})['home']
+        second = analyzer.snapshots({'home': home})['home']
+        self.assertIs(first.blocks, second.blocks)
+        self.assertEqual(48, len(first.blocks.series))
@@ -0,0 +1,96 @@
+from datetime import datetime
+import json
+import os
+import tempfile
+from unittest import IsolatedAsyncioTestCase
+
+import pytz
+
+from custom_components.yan_tibber_client.api.api import TibberApi
+from test.tibber_stub import TibberStubServer, load_fixture
+
+
+class TestPriceCache(IsolatedAsyncioTestCase):
+    DEFAULT_TIME_ZONE = pytz.timezone('Europe/Berlin')
+    PERC_LOSS_LOAD_UNLOAD = 20
+
+    def setUp(self):
+        self.server = TibberStubServer().start()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.tmp_dir.name, 'price_cache')
+
+    def tearDown(self):
+        self.server.stop()
+        self.tmp_dir.cleanup()
+
+    def _api(self, url=None) -> TibberApi:
+        return TibberApi('token', self.PERC_LOSS_LOAD_UNLOAD, self.DEFAULT_TIME_ZONE,
+                         url=url or self.server.url, cache_path=self.cache_path)
+
+    def _at(self, iso: str):
+        return self.DEFAULT_TIME_ZONE.localize(datetime.fromisoformat(iso))
+
+    async def test_fetch_writes_cache(self):
+        api = self._api()
+        price_info = await api.async_get_price_info()
+        await api.async_close()
+
+        with open(self.cache_path, encoding='utf-8') as f:
+            entries = json.load(f)
+        self.assertEqual(
+            {'96a14971-525a-4420-aae9-e5aedaa129ff': {
+                'address': 'Hauptstraße 1 10115 Berlin', 'date': '2024-01-27', 'price_info': price_info}},
+            entries)
+
+    def test_warm_start_without_network(self):
+        api = self._api()
+        price_info = api.get_price_info()
+        api.close()
+
+        # fresh instance, nothing listening at the url
+        cached = self._api(url='http://127.0.0.1:9/gql').load_cached_price_info(self._at('2024-01-27T17:30:00'))
+        self.assertEqual(price_info['today'], cached['today'])
+        self.assertEqual(price_info['tomorrow'], cached['tomorrow'])
+        self.assertEqual('2024-01-27T17:00:00.000+01:00', cached['current']['startsAt'])
+
+    def test_tomorrow_becomes_today(self):
+        api = self._api()
+        price_info = api.get_price_info()
+        api.close()
+
+        cached = api.load_cached_price_info(self._at('2024-01-28T00:10:00'))
+        self.assertEqual(price_info['tomorrow'], cached['today'])
+        self.assertEqual([], cached['tomorrow'])
+        self.assertEqual(price_info['tomorrow'][0], cached['current'])
+
+    def test_outdated_cache_is_ignored(self):
+        api = self._api()
+        api.get_price_info()
+        api.close()
+        self.assertEqual([], api.load_cached_price_info(self._at('2024-01-30T12:00:00')))
+
+    def test_unchanged_payload_is_not_rewritten(self):
+        api = self._api()
+        api.get_price_info()
+        os.utime(self.cache_path, ns=(0, 0))
+        api.get_price_info()
+        api.close()
+        self.assertEqual(0, os.stat(self.cache_path).st_mtime_ns)
+
+    def test_missing_or_broken_cache(self):
+        api = self._api()
+        self.assertEqual([], api.load_cached_price_info())
+        with open(self.cache_path, 'w', encoding='utf-8') as f:
+            f.write('{broken')
+        with self.assertLogs('custom_components.yan_tibber_client.api.cache', level='WARNING'):
+            self.assertEqual([], self._api().load_cached_price_info())
+
+    def test_all_homes_are_cached(self):
+        self.server.response = load_fixture('price_info_homes.json')
+        api = self._api()
+        homes = api.get_homes_price_info()
+        api.close()
+
+        cached = self._api().load_cached_homes(self._at('2024-01-27T17:30:00'))
+        self.assertEqual([(x.id, x.address) for x in homes], [(x.id, x.address) for x in cached])
+        self.assertEqual(homes[1].price_info['today'], cached[1].price_info['today'])
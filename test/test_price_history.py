@@ -0,0 +1,155 @@
+from datetime import datetime, timedelta
+import os
+import tempfile
+import time
+from unittest import IsolatedAsyncioTestCase
+
+import numpy as np
+import pytz
+
+from custom_components.yan_tibber_client.api.analysis import TRAILING_DAYS, PriceAnalyzer
+from custom_components.yan_tibber_client.api.api import HomePriceInfo, PriceLevel, TibberApi
+from custom_components.yan_tibber_client.api.history import PriceHistory
+from test.test_benchmark import make_price_info
+from test.tibber_stub import TibberStubServer, load_fixture
+
+HOME_ID = '96a14971-525a-4420-aae9-e5aedaa129ff'
+
+
+class TestPriceHistory(IsolatedAsyncioTestCase):
+    DEFAULT_TIME_ZONE = pytz.timezone('Europe/Berlin')
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'price_history.db')
+        data = load_fixture('price_info.json')
+        self.price_info = data['data']['viewer']['homes'][0]['currentSubscription']['priceInfo']
+        self.history = PriceHistory(self.path)
+
+    def tearDown(self):
+        self.history.close()
+        self.tmp_dir.cleanup()
+
+    def _at(self, iso: str):
+        return self.DEFAULT_TIME_ZONE.localize(datetime.fromisoformat(iso))
+
+    def test_range_query(self):
+        self.assertEqual(48, self.history.store([HomePriceInfo(HOME_ID, '', self.price_info)]))
+        slots = self.history.slots(HOME_ID, self._at('2024-01-27T22:00'), self._at('2024-01-28T02:00'))
+        self.assertEqual(
+            ['2024-01-27T22:00:00+01:00', '2024-01-27T23:00:00+01:00',
+             '2024-01-28T00:00:00+01:00', '2024-01-28T01:00:00+01:00'],
+            [x.starts_at.isoformat() for x in slots],
+        )
+        self.assertEqual(self.price_info['today'][22]['total'], slots[0].price)
+        self.assertEqual(PriceLevel.from_string(self.price_info['tomorrow'][1]['level']), slots[3].level)
+
+        starts, prices = self.history.prices(HOME_ID, self._at('2024-01-27T00:00'), self._at('2024-01-29T00:00'))
+        self.assertEqual(48, len(starts))
+        self.assertEqual([x['total'] for x in self.price_info['today'] + self.price_info['tomorrow']],
+                         prices.tolist())
+        self.assertEqual(0, len(self.history.series('unknown', self._at('2024-01-27T00:00'),
+                                                    self._at('2024-01-29T00:00'))))
+
+    def test_append_only_and_persistent(self):
+        home = HomePriceInfo(HOME_ID, '', self.price_info)
+        self.history.store([home])
+        changed = {'today': [dict(self.price_info['today'][0], total=1.0)], 'tomorrow': []}
+        self.assertEqual(0, self.history.store([home.with_price_info(changed)]))
+        self.history.close()
+
+        history = PriceHistory(self.path)
+        history.load()
+        self.assertEqual([HOME_ID], history.home_ids())
+        series = history.series(HOME_ID, self._at('2024-01-27T00:00'), self._at('2024-01-27T01:00'))
+        self.assertEqual([self.price_info['today'][0]['total']], series.prices.tolist())
+        history.close()
+
+    def test_query_returns_copies(self):
+        self.history.store([HomePriceInfo(HOME_ID, '', self.price_info)])
+        series = self.history.series(HOME_ID, self._at('2024-01-27T00:00'), self._at('2024-01-28T00:00'))
+        TibberApi('token', 20, self.DEFAULT_TIME_ZONE).mark_extrema(series)
+        again = self.history.series(HOME_ID, self._at('2024-01-27T00:00'), self._at('2024-01-28T00:00'))
+        self.assertTrue(series.extrema_types.any())
+        self.assertFalse(again.extrema_types.any())
+
+    def test_trailing_average(self):
+        self.history.store([HomePriceInfo(HOME_ID, '', self.price_info)])
+        now = self._at('2024-01-28T12:00')
+        expected = np.mean([x['total'] for x in self.price_info['today'] + self.price_info['tomorrow'][:12]])
+        self.assertAlmostEqual(expected, self.history.trailing_average(HOME_ID, now, 3))
+        self.assertIsNone(self.history.trailing_average(HOME_ID, self._at('2024-01-20T00:00'), 3))
+
+    def test_snapshot_trailing_averages(self):
+        home = HomePriceInfo(HOME_ID, '', self.price_info)
+        self.history.store([home])
+        analyzer = PriceAnalyzer(TibberApi('token', 20, self.DEFAULT_TIME_ZONE, history=self.history))
+        now = self._at('2024-01-28T12:00')
+        self.assertEqual(
+            {days: self.history.trailing_average(HOME_ID, now, days) for days in TRAILING_DAYS},
+            analyzer.trailing_averages(HOME_ID, now),
+        )
+        today, tomorrow = analyzer.analyse(self.price_info)
+        snapshot = analyzer.snapshot(home, today, tomorrow)
+        # averaged up to the current slot
+        expected = analyzer.trailing_averages(HOME_ID, snapshot.current.starts_at)
+        self.assertIsNotNone(expected[3])
+        self.assertEqual(expected, snapshot.trailing_averages)
+        without_history = PriceAnalyzer(TibberApi('token', 20, self.DEFAULT_TIME_ZONE))
+        self.assertIsNone(without_history.snapshot(home, today, tomorrow).trailing_averages)
+
+    def test_sub_millisecond_queries(self):
+        # 90 days of quarter hourly prices, stored day by day as they would be fetched
+        arr = make_price_info(90 * 96)
+        for day in range(90):
+            self.history.store([HomePriceInfo(HOME_ID, '', {'today': arr[day * 96:(day + 1) * 96]})])
+        self.history.close()
+        history = PriceHistory(self.path)
+        history.load()
+
+        start = datetime.fromisoformat(arr[0]['startsAt'])
+        windows = [(start + timedelta(days=d), start + timedelta(days=d + 30)) for d in range(60)]
+        begin = time.perf_counter()
+        for window_start, window_end in windows:
+            starts, prices = history.prices(HOME_ID, window_start, window_end)
+        elapsed = (time.perf_counter() - begin) / len(windows)
+        history.close()
+        self.assertEqual(30 * 96, len(prices))
+        self.assertLess(elapsed, 0.001)
+
+    async def test_fetch_appends_to_history(self):
+        server = TibberStubServer(load_fixture('price_info_homes.json')).start()
+        try:
+            api = TibberApi('token', 20, self.DEFAULT_TIME_ZONE, url=server.url, history=self.history)
+            homes = await api.async_get_homes_price_info()
+            await api.async_close()
+        finally:
+            server.stop()
+        self.assertEqual(sorted(x.id for x in homes), sorted(self.history.home_ids()))
+        series = self.history.series(homes[1].id, self._at('2024-01-27T00:00'), self._at('2024-01-29T00:00'))
+        self.assertEqual(len(homes[1].price_info['today']) + len(homes[1].price_info['tomorrow']), len(series))
+
+    def test_chunks_of_whole_days(self):
+        hours = 24 * 366
+        start = datetime(2023, 12, 31, 23, tzinfo=pytz.utc)
+        today = [
+            {'startsAt': (start + timedelta(hours=i)).astimezone(self.DEFAULT_TIME_ZONE).isoformat(),
+             'total': 0.2 + 0.01 * (i % 24), 'level': 'NORMAL'}
+            for i in range(hours)
+        ]
+        self.history.store([HomePriceInfo(HOME_ID, '', {'today': today, 'tomorrow': []})])
+        chunks = list(self.history.chunks(HOME_ID, self._at('2024-01-01T00:00'), self._at('2025-01-01T00:00'), 100))
+        self.assertEqual(hours, sum(len(x) for x in chunks))
+        # at most a chunk plus the day held back
+        self.assertLessEqual(max(len(x) for x in chunks), 100 + 24)
+        days = [x.days() for x in chunks]
+        # every chunk ends with a whole day, the DST days have 23 and 25 slots
+        self.assertEqual({23, 24, 25}, {len(day) for x in days for day in x})
+        self.assertEqual(366, sum(len(x) for x in days))
+        whole = self.history.series(HOME_ID, self._at('2024-01-01T00:00'), self._at('2025-01-01T00:00'))
+        self.assertEqual(whole.prices.tolist(), np.concatenate([x.prices for x in chunks]).tolist())
+        # a chunk shorter than a day
+        self.assertEqual([24, 24], [len(x) for x in self.history.chunks(
+            HOME_ID, self._at('2024-01-01T00:00'), self._at('2024-01-03T00:00'), 5)])
+        self.assertEqual([], list(self.history.chunks('unknown', self._at('2024-01-01T00:00'),
+                                                      self._at('2024-01-03T00:00'))))
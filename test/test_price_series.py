@@ -0,0 +1,162 @@
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+import numpy as np
+import pytz
+
+from custom_components.yan_tibber_client.api.api import (
+    ExtremaType,
+    LoadingLevel,
+    PriceSeries,
+    Statistics,
+    TibberApi,
+    parse_starts_at,
+)
+from test.tibber_stub import load_fixture
+
+
+class TestPriceSeries(TestCase):
+    DEFAULT_TIME_ZONE = pytz.timezone('Europe/Berlin')
+    PERC_LOSS_LOAD_UNLOAD = 20
+
+    def setUp(self):
+        data = load_fixture('price_info.json')
+        self.price_info = data['data']['viewer']['homes'][0]['currentSubscription']['priceInfo']
+        self.api = TibberApi('token', self.PERC_LOSS_LOAD_UNLOAD, self.DEFAULT_TIME_ZONE)
+
+    def _list_and_series(self, key='today'):
+        return self.api.convert_to_list(self.price_info[key]), self.api.convert_to_series(self.price_info[key])
+
+    def assertSameSlots(self, expected, actual):
+        self.assertEqual(len(expected), len(actual))
+        for x, y in zip(expected, actual):
+            self.assertEqual(str(x), str(y))
+
+    def test_convert_to_series(self):
+        today, series = self._list_and_series()
+        self.assertEqual(np.float64, series.prices.dtype)
+        self.assertEqual(np.int8, series.levels.dtype)
+        self.assertEqual(np.int8, series.loading_levels.dtype)
+        self.assertSameSlots(today, series)
+        self.assertEqual(today[0].starts_at.utcoffset(), series.starts_at(0).utcoffset())
+
+    def test_from_list_round_trip(self):
+        today, series = self._list_and_series()
+        self.api.mark_extrema(today)
+        self.assertSameSlots(today, PriceSeries.from_list(today))
+
+    def test_get_prices_numpy_without_copy(self):
+        _, series = self._list_and_series()
+        self.assertIs(series.prices, TibberApi.get_prices_numpy(series))
+
+    def test_relative_extrema(self):
+        today, series = self._list_and_series()
+        self.assertSameSlots(self.api.relative_extrema(today), self.api.relative_extrema(series))
+        self.assertSameSlots(today, series)
+
+    def test_mark_extrema(self):
+        today, series = self._list_and_series()
+        self.api.mark_extrema(today)
+        self.api.mark_extrema(series)
+        self.assertSameSlots(today, series)
+        self.assertEqual(ExtremaType.MIN, TibberApi.absolute_minimum(series).extrema_type)
+
+    def test_statistics(self):
+        today, series = self._list_and_series()
+        expected = Statistics(today)
+        actual = Statistics(series)
+        self.assertEqual(expected.start_time, actual.start_time)
+        self.assertEqual(expected.end_time, actual.end_time)
+        self.assertEqual(expected.avg_level, actual.avg_level)
+        self.assertAlmostEqual(expected.avg_price, actual.avg_price)
+        self.assertEqual(str(expected.min), str(actual.min))
+        self.assertEqual(str(expected.max), str(actual.max))
+
+    def test_determine_loading_levels(self):
+        today, series = self._list_and_series()
+        self.api.determine_loading_levels(today)
+        self.api.determine_loading_levels(series)
+        self.assertSameSlots(today, series)
+        for level in LoadingLevel:
+            self.assertSameSlots(
+                TibberApi.filter_loading_level(today, level),
+                TibberApi.filter_loading_level(series, level),
+            )
+
+    def test_concat_and_filter_future_items(self):
+        today, series = self._list_and_series()
+        _, tomorrow = self._list_and_series('tomorrow')
+        future = PriceSeries.concat(self.api.filter_future_items(series), tomorrow)
+        # fixture lies in the past
+        self.assertEqual(0, len(self.api.filter_future_items(series)))
+        self.assertSameSlots(tomorrow, future)
+        # marks on the concatenated series do not leak into the source
+        self.api.mark_extrema(future)
+        self.assertFalse(tomorrow.extrema_types.any())
+
+    def test_merge_loading_level(self):
+        today, series = self._list_and_series()
+        self.api.determine_loading_levels(series)
+        current = self.api.convert_to_hourly(self.price_info['current'])
+        self.api.merge_loading_level(current, series)
+        index = [x.starts_at for x in today].index(current.starts_at)
+        self.assertEqual(series[index].loading_level, current.loading_level)
+
+    def test_empty_series(self):
+        series = PriceSeries.from_price_info([])
+        self.assertEqual(0, len(series))
+        self.assertIsNone(TibberApi.absolute_minimum(series))
+        self.assertEqual([], series.to_list())
+        self.assertEqual(datetime, type(self.api.convert_to_series(self.price_info['today']).starts_at(0)))
+
+    def test_parse_starts_at(self):
+        values = [
+            '2024-03-31T01:00:00.000+01:00',
+            '2024-03-31T03:00:00.000+02:00',
+            '2024-10-27T02:00:00.000+02:00',
+            '2024-10-27T02:00:00.000+01:00',
+            '2024-01-27T00:15:00+01:00',
+            '2024-01-27T00:00:00.500Z',
+            '2024-01-27T00:00:00-05:30',
+        ]
+        starts, offsets = parse_starts_at(values)
+        for value, start, offset in zip(values, starts.astype(np.int64).tolist(), offsets.tolist()):
+            dt = datetime.fromisoformat(value)
+            self.assertEqual(int(dt.timestamp()), start, value)
+            self.assertEqual(dt.utcoffset().total_seconds(), offset, value)
+        with self.assertRaises(ValueError):
+            parse_starts_at(['2024-01-27T00:00:00'])
+
+    def test_slot_index(self):
+        series = self.api.convert_to_series(self.price_info['today'] + self.price_info['tomorrow'])
+        # the same series with a gap, looked up by bisection
+        gapped = PriceSeries.concat(series.take(slice(0, 10)), series.take(slice(12, None)))
+        self.assertEqual(3600, series.index.stride)
+        self.assertIsNone(gapped.index.stride)
+        for x in (series, gapped):
+            starts = [x.starts_at(i) for i in range(len(x))]
+            for t in starts[:3] + starts[9:13] + [starts[0] - timedelta(minutes=1), starts[-1] + timedelta(minutes=59),
+                                                   starts[-1] + timedelta(hours=2), starts[20] + timedelta(minutes=30)]:
+                with self.subTest(t=t, gaps=x is gapped):
+                    self.assertEqual(sum(1 for s in starts if s <= t), x.index.after(t))
+                    self.assertEqual(starts.index(t) if t in starts else None, x.index.find(t))
+                    containing = [i for i, s in enumerate(starts) if s <= t < s + timedelta(hours=1)]
+                    self.assertEqual(containing[0] if containing else None, x.index.containing(t, timedelta(hours=1)))
+
+    def test_after_is_a_view(self):
+        series = self.api.convert_to_series(self.price_info['today'])
+        after = series.after(series.starts_at(5))
+        self.assertEqual(18, len(after))
+        self.assertEqual(series.starts_at(6), after.starts_at(0))
+        self.assertTrue(np.shares_memory(series.prices, after.prices))
+        self.assertEqual(0, len(series.after(series.starts_at(23))))
+
+    def test_loading_level_index(self):
+        series = self.api.convert_to_series(self.price_info['today'])
+        self.assertEqual([], series.loading_level_indices(LoadingLevel.LOAD_FROM_NET).tolist())
+        self.api.determine_loading_levels(series)
+        for level in (LoadingLevel.LOAD_FROM_NET, LoadingLevel.UNLOAD_BATTERY):
+            expected = np.flatnonzero(series.loading_levels == PriceSeries.LOADING_CODES[level])
+            np.testing.assert_array_equal(expected, series.loading_level_indices(level))
+        self.assertIs(series.loading_level_indices(LoadingLevel.LOAD_FROM_NET),
+                      series.loading_level_indices(LoadingLevel.LOAD_FROM_NET))
@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+import pytz
+
+from custom_components.yan_tibber_client.api import formatting
+from custom_components.yan_tibber_client.api.analysis import PriceAnalyzer
+from custom_components.yan_tibber_client.api.api import LoadingLevel, Resolution, TibberApi
+from custom_components.yan_tibber_client.api.scheduler import FetchScheduler
+from test.tibber_stub import TibberStubServer, load_fixture
+
+
+class TestQuarterHourlyResolution(TestCase):
+    DEFAULT_TIME_ZONE = pytz.timezone('Europe/Berlin')
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = TibberStubServer(load_fixture('price_info_quarter_hourly.json')).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.api = TibberApi('token', 20, self.DEFAULT_TIME_ZONE, url=self.server.url,
+                             resolution=Resolution.QUARTER_HOURLY)
+
+    def tearDown(self):
+        self.api.close()
+
+    def test_query(self):
+        self.assertNotIn('resolution', Resolution.HOURLY.query)
+        self.assertIn('priceInfo(resolution: QUARTER_HOURLY)', Resolution.QUARTER_HOURLY.query)
+        self.api.get_price_info()
+        self.assertIn('QUARTER_HOURLY', self.server.requests[-1]['body']['query'])
+
+    def test_analysis(self):
+        price_info = self.api.get_price_info()
+        today, tomorrow = PriceAnalyzer(self.api).analyse(price_info)
+        self.assertEqual(96, len(today.series))
+        self.assertEqual(96, len(tomorrow.series))
+        self.assertEqual(timedelta(minutes=15), today.series.starts_at(1) - today.series.starts_at(0))
+        self.assertGreater(len(today.load_from_net), 0)
+        self.assertEqual(len(today.load_from_net), len(today.series.loading_level_indices(LoadingLevel.LOAD_FROM_NET)))
+        self.assertEqual(today.series.prices.min(), today.stats.min.price)
+
+    def test_current_slot(self):
+        price_info = self.api.get_price_info()
+        now = self.DEFAULT_TIME_ZONE.localize(datetime(2024, 1, 27, 14, 40))
+        aligned = self.api.align_price_info(price_info, now)
+        self.assertEqual('2024-01-27T14:30:00.000+01:00', aligned['current']['startsAt'])
+
+    def test_scheduler_slot_length(self):
+        scheduler = FetchScheduler(self.DEFAULT_TIME_ZONE, slot_length=self.api.resolution.slot_length)
+        now = self.DEFAULT_TIME_ZONE.localize(datetime(2024, 1, 27, 14, 40))
+        self.assertEqual(now.replace(minute=45), scheduler.next_slot_start(now))
+
+    def test_json_list_matches_slot_format(self):
+        price_info = self.api.get_price_info()
+        today, _ = PriceAnalyzer(self.api).analyse(price_info)
+        self.assertEqual(
+            [formatting.hourly_data_to_json(x, self.DEFAULT_TIME_ZONE) for x in today.series],
+            formatting.convert_to_json_list(today.series, self.DEFAULT_TIME_ZONE),
+        )
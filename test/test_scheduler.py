@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+import pytz
+
+from custom_components.yan_tibber_client.api.api import TibberApi
+from custom_components.yan_tibber_client.api.scheduler import FetchScheduler
+from test.tibber_stub import load_fixture
+
+
+class TestFetchScheduler(TestCase):
+    DEFAULT_TIME_ZONE = pytz.timezone('Europe/Berlin')
+
+    def setUp(self):
+        data = load_fixture('price_info.json')
+        self.price_info = data['data']['viewer']['homes'][0]['currentSubscription']['priceInfo']
+        self.api = TibberApi('token', 20, self.DEFAULT_TIME_ZONE)
+        self.scheduler = FetchScheduler(self.DEFAULT_TIME_ZONE)
+
+    def _at(self, iso: str) -> datetime:
+        return self.DEFAULT_TIME_ZONE.localize(datetime.fromisoformat(iso))
+
+    def _today_only(self, now):
+        return self.api.align_price_info({**self.price_info, 'tomorrow': []}, now)
+
+    def test_fetch_when_nothing_is_known(self):
+        self.assertTrue(self.scheduler.needs_fetch([], self._at('2024-01-27T08:10:00')))
+
+    def test_no_fetch_before_publication(self):
+        now = self._at('2024-01-27T08:10:00')
+        price_info = self._today_only(now)
+        self.assertFalse(self.scheduler.needs_fetch(price_info, now))
+        self.assertEqual(self._at('2024-01-27T12:45:00'), self.scheduler.next_fetch(price_info, now))
+        self.assertEqual(self._at('2024-01-27T09:00:00'), self.scheduler.next_wakeup(price_info, now))
+
+    def test_no_fetch_once_tomorrow_is_known(self):
+        now = self._at('2024-01-27T14:10:00')
+        price_info = self.api.align_price_info(self.price_info, now)
+        self.assertFalse(self.scheduler.needs_fetch(price_info, now))
+        self.assertEqual(self._at('2024-01-28T12:45:00'), self.scheduler.next_fetch(price_info, now))
+
+    def test_backoff_inside_publication_window(self):
+        now = self._at('2024-01-27T12:50:00')
+        price_info = self._today_only(now)
+        self.assertTrue(self.scheduler.needs_fetch(price_info, now))
+
+        expected = [5, 10, 20, 40, 60, 60]
+        for minutes in expected:
+            self.scheduler.record_fetch(price_info, now)
+            self.assertEqual(now + timedelta(minutes=minutes), self.scheduler.next_fetch(price_info, now))
+            self.assertFalse(self.scheduler.needs_fetch(price_info, now + timedelta(minutes=minutes - 1)))
+            now += timedelta(minutes=minutes)
+            self.assertTrue(self.scheduler.needs_fetch(price_info, now))
+
+        # tomorrow finally arrived
+        self.scheduler.record_fetch(self.api.align_price_info(self.price_info, now), now)
+        self.assertEqual(0, self.scheduler.attempts)
+
+    def test_failed_fetch_backs_off(self):
+        now = self._at('2024-01-27T03:00:00')
+        self.scheduler.record_fetch([], now)
+        self.assertFalse(self.scheduler.needs_fetch([], now + timedelta(minutes=4)))
+        self.assertTrue(self.scheduler.needs_fetch([], now + timedelta(minutes=5)))
+
+    def test_requests_per_day(self):
+        """Count the fetches of a day with hourly wakeups, tomorrow being published at 13:20."""
+        now = self._at('2024-01-27T00:00:00')
+        published = self._at('2024-01-27T13:20:00')
+        held = []
+        fetches = 0
+        while now < self._at('2024-01-28T00:00:00'):
+            price_info = self.api.align_price_info(held, now)
+            if self.scheduler.needs_fetch(price_info, now):
+                fetches += 1
+                held = self.price_info if now >= published else {**self.price_info, 'tomorrow': []}
+                price_info = self.api.align_price_info(held, now)
+                self.scheduler.record_fetch(price_info, now)
+            now = self.scheduler.next_wakeup(price_info, now)
+        # first fetch + 12:45, 12:50, 13:00, 13:20 instead of 48 polls
+        self.assertEqual(5, fetches)
+
+    def test_next_slot_start(self):
+        self.assertEqual(self._at('2024-01-27T15:00:00'), self.scheduler.next_slot_start(self._at('2024-01-27T14:00:00')))
+        quarter = FetchScheduler(self.DEFAULT_TIME_ZONE, slot_length=timedelta(minutes=15))
+        self.assertEqual(self._at('2024-01-27T14:15:00'), quarter.next_slot_start(self._at('2024-01-27T14:07:30')))
@@ -0,0 +1,74 @@
+import time
+from unittest import TestCase
+
+import pytz
+
+from custom_components.yan_tibber_client.api.analysis import PriceAnalyzer
+from custom_components.yan_tibber_client.api.api import HomePriceInfo, TibberApi
+from custom_components.yan_tibber_client.api.timing import NO_TIMER, StageTimer
+from test.tibber_stub import TibberStubServer
+
+
+class TestStageTimer(TestCase):
+
+    def test_rolling_stats(self):
+        timer = StageTimer(window=10)
+        for i in range(1, 21):
+            timer.record('fetch', i / 1000)
+        stats = timer.stats()['fetch']
+        self.assertEqual(20, stats['count'])
+        self.assertEqual(0.020, stats['last'])
+        # only the last 10 durations 11..20 ms are kept
+        self.assertEqual(0.016, stats['p50'])
+        self.assertEqual(0.020, stats['p95'])
+        self.assertEqual(0.020, stats['max'])
+
+    def test_stage(self):
+        timer = StageTimer()
+        with timer.stage('sleep'):
+            time.sleep(0.01)
+        with self.assertRaises(ValueError):
+            with timer.stage('failing'):
+                raise ValueError
+        self.assertGreaterEqual(timer.last('sleep'), 0.009)
+        self.assertEqual(1, timer.stats()['failing']['count'])
+        self.assertIsNone(timer.last('unknown'))
+
+    def test_disabled_timer(self):
+        self.assertFalse(NO_TIMER.enabled)
+        self.assertIs(NO_TIMER.stage('a'), NO_TIMER.stage('b'))
+        n = 100_000
+        start = time.perf_counter()
+        for _ in range(n):
+            with NO_TIMER.stage('x'):
+                pass
+        per_stage = (time.perf_counter() - start) / n
+        NO_TIMER.record('x', 1.0)
+        self.assertEqual({}, NO_TIMER.stats())
+        self.assertLess(per_stage, 5e-6)
+
+    def test_prometheus(self):
+        timer = StageTimer()
+        timer.record('http', 0.25)
+        timer.record('http', 0.5)
+        text = timer.to_prometheus('tibber')
+        lines = text.splitlines()
+        self.assertEqual('# TYPE tibber_stage_seconds summary', lines[1])
+        self.assertIn('tibber_stage_seconds{stage="http",quantile="0.5"} 0.5', lines)
+        self.assertIn('tibber_stage_seconds_sum{stage="http"} 0.75', lines)
+        self.assertIn('tibber_stage_seconds_count{stage="http"} 2', lines)
+        self.assertTrue(text.endswith('\n'))
+
+    def test_pipeline_stages(self):
+        timer = StageTimer()
+        with TibberStubServer() as server:
+            api = TibberApi('token', 20, pytz.timezone('Europe/Berlin'), url=server.url, timer=timer)
+            homes = api.get_homes_price_info()
+            api.close()
+        PriceAnalyzer(api).snapshots({x.id: x for x in homes})
+        self.assertEqual(
+            {'http', 'json_decode', 'store', 'convert', 'extrema', 'statistics', 'loading_levels', 'snapshot'},
+            set(timer.stats()),
+        )
+        self.assertEqual(2, timer.stats()['convert']['count'])
+        self.assertIsInstance(homes[0], HomePriceInfo)
@@ -0,0 +1,186 @@
+"""Local stand-ins for the Tibber GraphQL endpoint and its websocket subscriptions."""
+import asyncio
+from collections.abc import Callable
+import gzip
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+from pathlib import Path
+import threading
+import time
+
+from aiohttp import WSMsgType, web
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+
+
+def load_fixture(name: str) -> dict:
+    """Load a recorded GraphQL response from the fixtures folder."""
+    with open(FIXTURES_DIR / name, encoding="utf-8") as f:
+        return json.load(f)
+
+
+class TibberStubServer:
+    """Serve a GraphQL response on localhost and record what the client sent.
+
+    The response is either fixed or a callable building it from the request body and headers.
+    """
+
+    def __init__(self, response: dict | Callable[[dict, dict], dict] | None = None, status: int = 200) -> None:
+        self.response = response if response is not None else load_fixture("price_info.json")
+        self.status = status
+        self.delay = 0.0
+        self.compress = False
+        self.sent_bytes = 0
+        self.requests: list[dict] = []
+        self.connections: set[int] = set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._server: ThreadingHTTPServer | None = None
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1-beta/gql"
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):  # noqa: N802
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length)
+                stub.connections.add(self.client_address[1])
+                request = json.loads(body)
+                headers = dict(self.headers)
+                stub.requests.append({"headers": headers, "body": request})
+                with stub._lock:
+                    stub.in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+                time.sleep(stub.delay)
+                with stub._lock:
+                    stub.in_flight -= 1
+                response = stub.response(request, headers) if callable(stub.response) else stub.response
+                payload = json.dumps(response).encode("utf-8")
+                gzipped = stub.compress and "gzip" in self.headers.get("Accept-Encoding", "")
+                if gzipped:
+                    payload = gzip.compress(payload)
+                stub.sent_bytes += len(payload)
+                self.send_response(stub.status)
+                self.send_header("Content-Type", "application/json")
+                if gzipped:
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):  # noqa: A002
+                pass
+
+        return Handler
+
+    def start(self) -> "TibberStubServer":
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self) -> "TibberStubServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+class LiveStubServer:
+    """Answer liveMeasurement subscriptions with the given readings (graphql-transport-ws).
+
+    Every connection gets a ping, then the readings starting after the ones already sent.
+    With close_after set a connection is dropped after that many readings. Each of the
+    bad_frames is sent as is on its own connection, which then waits for the client to close it.
+    """
+
+    def __init__(
+        self, readings: list[dict], close_after: int | None = None, ack: bool = True
+    ) -> None:
+        self.readings = readings
+        self.close_after = close_after
+        self.ack = ack
+        self.interval = 0.0
+        self.bad_frames: list[str] = []
+        self.init_payloads: list[dict] = []
+        self.queries: list[str] = []
+        self.protocols: list[str] = []
+        self.pongs = 0
+        self.sent = 0
+        self._runner: web.AppRunner | None = None
+        self._port: int | None = None
+
+    @property
+    def url(self) -> str:
+        return f"ws://127.0.0.1:{self._port}/v1-beta/gql/subscriptions"
+
+    async def _handle(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse(protocols=("graphql-transport-ws",))
+        await ws.prepare(request)
+        self.protocols.append(ws.ws_protocol)
+        init = await ws.receive_json()
+        self.init_payloads.append(init.get("payload"))
+        if not self.ack:
+            await ws.close(code=4403, message=b"Forbidden")
+            return ws
+        await ws.send_json({"type": "connection_ack"})
+        subscribe = await ws.receive_json()
+        self.queries.append(subscribe["payload"]["query"])
+        await ws.send_json({"type": "ping"})
+        if self.bad_frames:
+            await ws.send_str(self.bad_frames.pop(0))
+            # the client has to give up on the connection
+            async for _ in ws:
+                pass
+            return ws
+
+        sent_here = 0
+        while self.sent < len(self.readings):
+            if self.close_after is not None and sent_here >= self.close_after:
+                await ws.close()
+                return ws
+            await ws.send_json(
+                {
+                    "id": subscribe["id"],
+                    "type": "next",
+                    "payload": {"data": {"liveMeasurement": self.readings[self.sent]}},
+                }
+            )
+            self.sent += 1
+            sent_here += 1
+            await asyncio.sleep(self.interval)
+        await ws.send_json({"id": subscribe["id"], "type": "complete"})
+        async for msg in ws:
+            if msg.type == WSMsgType.TEXT and json.loads(msg.data).get("type") == "pong":
+                self.pongs += 1
+        return ws
+
+    async def start(self) -> "LiveStubServer":
+        app = web.Application()
+        app.router.add_get("/v1-beta/gql/subscriptions", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        self._port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self) -> None:
+        await self._runner.cleanup()